@@ -1,11 +1,16 @@
 import logging
 
+from .scheduler import PRIORITY_NORMAL, request_priority
+
 logger = logging.getLogger(__name__)
 
 
 class Calculator(object):
     """Base class for calculators."""
 
+    # Priority of the requests made to JIRA by this calculator
+    priority = PRIORITY_NORMAL
+
     def __init__(self, query_manager, settings, results):
         """Initialise with a `QueryManager`, a dict of `settings`,
         and a reference to the dict of `results`, which will be
@@ -16,14 +21,41 @@ class Calculator(object):
         self.settings = settings
         self._results = results
 
-    def get_result(self, calculator=None, default=None):
+    def get_result(self, calculator=None, default=None, name=None):
         """Get the results calculated by a previous calculator
-        of type `calculator` (a class). Defaults to `self.__class__`
+        of type `calculator` (a class). Defaults to `self.__class__`.
+        If `name` is given, get the result stored with `set_result()`
+        under that name instead.
+        """
+
+        key = calculator or self.__class__
+        if name is not None:
+            key = (key, name)
+
+        return self._results.get(key, default)
+
+    def set_result(self, name, value):
+        """Store a result calculated along with the one returned by `run()`
+        under `name`, for other calculators to use with `get_result()`.
         """
 
-        return self._results.get(calculator or self.__class__, default)
+        self._results[(self.__class__, name)] = value
 
     # Lifecycle methods -- implement as appropriate
+    def queries(self):
+        """Return a list of `(jql, expand)` tuples for the queries `run()`
+        is going to make, if known in advance, so that they can be fetched
+        before any calculator is run.
+        """
+        return []
+
+    def fields(self):
+        """Return a list of the names or ids of fields `run()` is going to
+        read from issues, besides those the query manager fetches anyway,
+        so that they can be fetched with all queries.
+        """
+        return []
+
     def run(self):
         """Run the calculator and return its results.
         These will be automatically saved
@@ -43,10 +75,26 @@ def run_calculators(calculators, query_manager, settings):
     results = {}
     calculators = [C(query_manager, settings, results) for C in calculators]
 
+    # Decide which fields to fetch before fetching any issues, so that all
+    # calculators get the same fields
+    fields = [field for c in calculators for field in c.fields()]
+    if len(fields) > 0:
+        query_manager.request_fields(fields)
+
+    # Fetch issues for all known queries up front, possibly concurrently
+    queries = [
+        (jql, expand, c.priority)
+        for c in calculators
+        for jql, expand in c.queries()
+    ]
+    if len(queries) > 0:
+        query_manager.prefetch(queries)
+
     # Run all calculators first
     for c in calculators:
         logger.info("%s running...", c.__class__.__name__)
-        results[c.__class__] = c.run()
+        with request_priority(c.priority):
+            results[c.__class__] = c.run()
         logger.info("%s completed\n", c.__class__.__name__)
 
     # Write all files as a second pass
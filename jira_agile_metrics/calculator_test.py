@@ -39,3 +39,75 @@ def test_run_calculator():
     }
 
     assert written == ["Enabled", "Enabled bar"]
+
+
+def test_named_results():
+    class Details(Calculator):
+        def run(self):
+            self.set_result("details", "More")
+            return "Main"
+
+    class UseDetails(Calculator):
+        def run(self):
+            return self.get_result(Details, name="details")
+
+    results = run_calculators([Details, UseDetails], object(), {})
+
+    assert results == {
+        Details: "Main",
+        (Details, "details"): "More",
+        UseDetails: "More",
+    }
+
+
+def test_run_calculators_prefetches_queries():
+
+    prefetched = []
+
+    class QueryManager:
+        def prefetch(self, queries):
+            prefetched.extend(queries)
+
+    class WithQueries(Calculator):
+        def queries(self):
+            return [("(filter=1)", "changelog"), ("(filter=2)", None)]
+
+    class WithoutQueries(Calculator):
+        pass
+
+    run_calculators([WithQueries, WithoutQueries], QueryManager(), {})
+
+    assert prefetched == [
+        ("(filter=1)", "changelog", WithQueries.priority),
+        ("(filter=2)", None, WithQueries.priority),
+    ]
+
+
+def test_run_calculators_requests_fields_before_fetching():
+
+    calls = []
+
+    class QueryManager:
+        def request_fields(self, fields):
+            calls.append(("request_fields", fields))
+
+        def prefetch(self, queries):
+            calls.append(("prefetch", [jql for jql, _, _ in queries]))
+
+    class WithFields(Calculator):
+        def queries(self):
+            return [("(filter=1)", "changelog")]
+
+        def fields(self):
+            return ["Epic Link"]
+
+    class WithMoreFields(Calculator):
+        def fields(self):
+            return ["customfield_001"]
+
+    run_calculators([WithFields, WithMoreFields], QueryManager(), {})
+
+    assert calls == [
+        ("request_fields", ["Epic Link", "customfield_001"]),
+        ("prefetch", ["(filter=1)"]),
+    ]
@@ -1,14 +1,41 @@
 import json
+import hashlib
+import itertools
 import logging
+import pickle
 import datetime
 import dateutil.parser
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 
 from ..calculator import Calculator
-from ..utils import get_extension, to_json_string, StatusTypes
+from ..leanissue import LeanIssue
+from ..scheduler import PRIORITY_HIGH
+from ..utils import chunks, get_extension, parse_date, to_json_string
+from ..workflow import compile_workflow
 
 logger = logging.getLogger(__name__)
 
+# Number of issues to look up in the cache of cycle time data at a time,
+# per worker process if there is more than one
+ROW_BATCH_SIZE = 500
+
+# Smallest number of issues in a batch worth sending to worker processes.
+# Fewer are calculated in this process, as starting the processes and
+# sending the issues to them takes longer than it saves.
+MIN_WORKER_ISSUES = 1000
+
+# Fields whose changes are read to calculate cycle time data
+CHANGE_FIELDS = ("status", "Flagged")
+
+# Change this when changing how cycle time data is calculated or stored, so
+# that data calculated before is not reused
+ROW_FORMAT_VERSION = 2
+
+# Format of dates in cycle time data kept in the issue cache
+ROW_DATE_FORMAT = "%Y-%m-%d"
+
 
 class CycleTimeCalculator(Calculator):
     """Basic cycle time data, fetched from JIRA.
@@ -23,7 +50,9 @@ class CycleTimeCalculator(Calculator):
 
     If 'query_attribute' is set in `settings`, a column with this name
     will be added, and populated with the `value` key, if any, from each
-    criteria block under `queries` in settings.
+    criteria block under `queries` in settings. Issues matched by more than
+    one criteria block are only included once, with the value from the
+    first block that matched.
 
     In addition, `cycle_time` will be set to the time delta between the
     first `accepted`-type column and the first `complete` column, or None.
@@ -36,11 +65,44 @@ class CycleTimeCalculator(Calculator):
 
     If an item moves backwards through the cycle, subsequent date/time
     stamps in the cycle are erased.
+
+    An issue found by more than one of the `queries` is only fetched and
+    calculated once, but gets a row for each query that found it, unless
+    `unique_issues` is set, in which case it only gets a row with the
+    value of the first query. Either way, the values of all the queries
+    that found each issue are stored as the result named `query_values`, a
+    dict of lists keyed by issue key.
+
+    The impediments of all issues are also stored as a table, with a row
+    for each impediment, as the result named `impediments` (see
+    `impediments_table()`).
+
+    If `workers` is more than one, issues are processed in that many worker
+    processes, once there are at least `MIN_WORKER_ISSUES` of them to
+    calculate in a batch.
+
+    If `vectorized_cycle_times` is set, the dates of the steps are worked
+    out for many issues at a time with array operations, with the same
+    results (see `calculate_cycle_time_rows()`).
+
+    If `compact_cycle_data` is set, the `url` column is left out (it is
+    added back when writing files), columns of strings with few distinct
+    values are stored as categories, and `blocked_days` as a small nullable
+    integer, to use less memory.
     """
 
+    priority = PRIORITY_HIGH
+
+    def queries(self):
+        # Streamed issues are fetched as they are processed
+        if self.settings["stream_issues"]:
+            return []
+        return [(q["jql"], "changelog") for q in self.settings["queries"]]
+
     def run(self, now=None):
 
-        return calculate_cycle_times(
+        details = {}
+        cycle_data = calculate_cycle_times(
             self.query_manager,
             self.settings["cycle"],
             self.settings["attributes"],
@@ -49,8 +111,29 @@ class CycleTimeCalculator(Calculator):
             self.settings["queries"],
             self.settings["query_attribute"],
             now=now,
+            workers=self.settings["workers"],
+            unique_issues=self.settings["unique_issues"],
+            vectorized=self.settings["vectorized_cycle_times"],
+            details=details,
         )
 
+        self.set_result("impediments", details["impediments"])
+        self.set_result("query_values", details["query_values"])
+
+        if self.settings["compact_cycle_data"]:
+            cycle_data = compact_cycle_data(
+                cycle_data,
+                ["issue_type", "status", "resolution"]
+                + sorted(self.settings["attributes"].keys())
+                + (
+                    [self.settings["query_attribute"]]
+                    if self.settings["query_attribute"]
+                    else []
+                ),
+            )
+
+        return cycle_data
+
     def write(self):
         output_files = self.settings["cycle_time_data"]
 
@@ -58,7 +141,9 @@ class CycleTimeCalculator(Calculator):
             logger.debug("No output file specified for cycle time data")
             return
 
-        cycle_data = self.get_result()
+        cycle_data = expand_cycle_data(
+            self.get_result(), self.query_manager.server_url
+        )
         cycle_names = [s["name"] for s in self.settings["cycle"]]
         attribute_names = sorted(self.settings["attributes"].keys())
         query_attribute_names = (
@@ -122,28 +207,27 @@ def calculate_cycle_times(
     queries,  # [{jql:"", value:""}]
     query_attribute=None,  # ""
     now=None,
+    workers=None,
+    unique_issues=False,
+    vectorized=False,
+    details=None,  # {}
 ):
+    """Return the cycle time data for the issues found by `queries`. If a
+    dict is given as `details`, the table of impediments (see
+    `impediments_table()`) is put in it as `impediments`, and the values of
+    the queries that found each issue as `query_values`.
+    """
 
     # Allows unit testing to use a fixed date
     if now is None:
         now = datetime.datetime.utcnow()
 
-    cycle_names = [s["name"] for s in cycle]
-    accepted_steps = set(
-        s["name"] for s in cycle if s["type"] == StatusTypes.accepted
-    )
-    completed_steps = set(
-        s["name"] for s in cycle if s["type"] == StatusTypes.complete
-    )
+    workflow = compile_workflow(cycle)
+    cycle_names = workflow.step_names
 
-    cycle_lookup = {}
-    for idx, cycle_step in enumerate(cycle):
-        for status in cycle_step["statuses"]:
-            cycle_lookup[status.lower()] = dict(
-                index=idx,
-                name=cycle_step["name"],
-                type=cycle_step["type"],
-            )
+    # Statuses are mapped to steps by id, as well as by name, using the
+    # statuses of the JIRA instance as they are named now
+    status_ids = workflow.status_id_indexes(query_manager.status_names())
 
     unmapped_statuses = set()
 
@@ -172,208 +256,175 @@ def calculate_cycle_times(
     if query_attribute:
         series[query_attribute] = {"data": [], "dtype": "str"}
 
-    for criteria in queries:
-        for issue in query_manager.find_issues(criteria["jql"]):
+    # (key, impediment) for each impediment of each issue
+    impediments = []
 
-            item = {
-                "key": issue.key,
-                "url": "%s/browse/%s"
-                % (
-                    query_manager.jira.client_info(),
-                    issue.key,
-                ),
-                "issue_type": issue.fields.issuetype.name,
-                "summary": issue.fields.summary,
-                "status": issue.fields.status.name,
-                "resolution": issue.fields.resolution.name
-                if issue.fields.resolution
-                else None,
-                "cycle_time": None,
-                "completed_timestamp": None,
-                "blocked_days": 0,
-                "impediments": [],
-            }
-
-            for name in attributes:
-                item[name] = query_manager.resolve_attribute_value(issue, name)
-
-            if query_attribute:
-                item[query_attribute] = criteria.get("value", None)
-
-            for cycle_name in cycle_names:
-                item[cycle_name] = None
-
-            last_status = None
-            impediment_flag = None
-            impediment_start_status = None
-            impediment_start = None
+    # Rows calculated before are kept in the issue cache, if there is one
+    row_cache = query_manager.issue_cache
+    row_config = (
+        cycle_row_config(
+            query_manager,
+            cycle,
+            status_ids,
+            attributes,
+            backlog_column,
+            done_column,
+        )
+        if row_cache is not None
+        else None
+    )
+    cached_rows = 0
 
-            # Record date of status and impediments flag changes
-            for snapshot in query_manager.iter_changes(
-                issue, ["status", "Flagged"]
-            ):
-                if snapshot.change == "status":
-                    snapshot_cycle_step = cycle_lookup.get(
-                        snapshot.to_string.lower(), None
+    row_args = (
+        workflow,
+        status_ids,
+        attributes,
+        backlog_column,
+        done_column,
+        now,
+    )
+
+    # Issues found by more than one query are only fetched and calculated
+    # once. Unless `unique_issues` is set, they get a row for each query,
+    # so their rows are kept to be repeated.
+    seen_keys = set()
+    seen_rows = {}
+
+    # Key -> the values of all the queries that found the issue
+    query_values = {}
+
+    # Issues are sent to worker processes in their raw JSON form, and
+    # rebuilt there as lean issues. The processes are started the first time
+    # a batch has enough issues, and used for the rest of the run.
+    if workers is None or workers < 1:
+        workers = 1
+    executor = None
+    worker_state = None
+
+    try:
+        for criteria in queries:
+            matches = query_manager.iter_new_issues(criteria["jql"], seen_keys)
+
+            while True:
+                matched = list(
+                    itertools.islice(matches, ROW_BATCH_SIZE * workers)
+                )
+                if len(matched) == 0:
+                    break
+
+                batch = [issue for _, issue in matched if issue is not None]
+                seen_keys.update(issue.key for issue in batch)
+
+                previous_rows = (
+                    row_cache.get_cycle_rows(
+                        [issue.key for issue in batch], row_config
+                    )
+                    if row_cache is not None
+                    else {}
+                )
+                new_rows = []
+
+                rows = {}
+                for issue in batch:
+                    updated = getattr(issue.fields, "updated", None)
+                    previous_updated, previous_row = previous_rows.get(
+                        issue.key, (None, None)
                     )
-                    if snapshot_cycle_step is None:
-                        logger.info(
-                            "Issue %s transitioned to unknown JIRA status %s",
-                            issue.key,
-                            snapshot.to_string,
+                    if updated is not None and previous_updated == updated:
+                        rows[issue.key] = cycle_row_from_json(
+                            previous_row, cycle_names
                         )
-                        unmapped_statuses.add(snapshot.to_string)
-                        continue
+                        cached_rows += 1
 
-                    last_status = (
-                        snapshot_cycle_step_name
-                    ) = snapshot_cycle_step["name"]
-
-                    # Keep the first time we entered a step
-                    if item[snapshot_cycle_step_name] is None:
-                        item[snapshot_cycle_step_name] = snapshot.date.date()
-
-                    # Wipe any subsequent dates,
-                    # in case this was a move backwards
-                    found_cycle_name = False
-                    for cycle_name in cycle_names:
-                        if (
-                            not found_cycle_name
-                            and cycle_name == snapshot_cycle_step_name
-                        ):
-                            found_cycle_name = True
-                            continue
-                        elif found_cycle_name and item[cycle_name] is not None:
-                            logger.info(
-                                "Issue %s moved backwards to %s "
-                                "[JIRA: %s -> %s], "
-                                "wiping data for subsequent step %s",
-                                issue.key,
-                                snapshot_cycle_step_name,
-                                snapshot.from_string,
-                                snapshot.to_string,
-                                cycle_name,
+                changed = [issue for issue in batch if issue.key not in rows]
+
+                if workers > 1 and len(changed) >= MIN_WORKER_ISSUES:
+                    if executor is None:
+                        executor = ProcessPoolExecutor(max_workers=workers)
+                        worker_state = pickle.dumps(query_manager)
+
+                    # Split the issues into a chunk for each worker, and put
+                    # the rows back together in the original order
+                    raw_issues = [worker_issue(issue) for issue in changed]
+                    changed_rows = list(
+                        itertools.chain.from_iterable(
+                            executor.map(
+                                calculate_raw_rows,
+                                chunks(
+                                    raw_issues, -(-len(changed) // workers)
+                                ),
+                                itertools.repeat(worker_state),
+                                itertools.repeat(row_args),
+                                itertools.repeat(vectorized),
                             )
-                            item[cycle_name] = None
-                elif snapshot.change == "Flagged":
-                    if snapshot.from_string == snapshot.to_string is None:
-                        # Initial state from None -> None
-                        continue
-                    elif (
-                        snapshot.to_string is not None
-                        and snapshot.to_string != ""
-                    ):
-                        impediment_flag = snapshot.to_string
-                        impediment_start = snapshot.date.date()
-                        impediment_start_status = last_status
-                    elif (
-                        snapshot.to_string is None or snapshot.to_string == ""
+                        )
+                    )
+                else:
+                    changed_rows = calculate_rows(
+                        query_manager, changed, row_args, vectorized
+                    )
+
+                for issue, (item, issue_unmapped_statuses) in zip(
+                    changed, changed_rows
+                ):
+                    rows[issue.key] = (item, issue_unmapped_statuses)
+
+                    # Rows with open impediments depend on today's date
+                    updated = getattr(issue.fields, "updated", None)
+                    if (
+                        row_cache is not None
+                        and updated is not None
+                        and all(
+                            i["end"] is not None for i in item["impediments"]
+                        )
                     ):
-                        if impediment_start is None:
-                            logger.warning(
-                                "Issue %s had impediment flag cleared before "
-                                "being set. This should not happen.",
+                        new_rows.append(
+                            (
                                 issue.key,
+                                updated,
+                                cycle_row_to_json(
+                                    item, issue_unmapped_statuses, cycle_names
+                                ),
                             )
-                            continue
-
-                        if impediment_start_status not in (
-                            backlog_column,
-                            done_column,
-                        ):
-                            item["blocked_days"] += (
-                                snapshot.date.date() - impediment_start
-                            ).days
-                        item["impediments"].append(
-                            {
-                                "start": impediment_start,
-                                "end": snapshot.date.date(),
-                                "status": impediment_start_status,
-                                "flag": impediment_flag,
-                            }
                         )
 
-                        # Reset for next time
-                        impediment_flag = None
-                        impediment_start = None
-                        impediment_start_status = None
-
-            # If an impediment flag was set but never cleared :
-            # treat as resolved on the ticket
-            # resolution date if the ticket was resolved,
-            # else as still open until today.
-            if impediment_start is not None:
-                if issue.fields.resolutiondate:
-                    resolution_date = dateutil.parser.parse(
-                        issue.fields.resolutiondate
-                    ).date()
-                    if impediment_start_status not in (
-                        backlog_column,
-                        done_column,
-                    ):
-                        item["blocked_days"] += (
-                            resolution_date - impediment_start
-                        ).days
-                    item["impediments"].append(
-                        {
-                            "start": impediment_start,
-                            "end": resolution_date,
-                            "status": impediment_start_status,
-                            "flag": impediment_flag,
-                        }
+                for key, issue in matched:
+                    query_values.setdefault(key, []).append(
+                        criteria.get("value", None)
                     )
-                else:
-                    if impediment_start_status not in (
-                        backlog_column,
-                        done_column,
-                    ):
-                        item["blocked_days"] += (
-                            now.date() - impediment_start
-                        ).days
-                    item["impediments"].append(
-                        {
-                            "start": impediment_start,
-                            "end": None,
-                            "status": impediment_start_status,
-                            "flag": impediment_flag,
-                        }
-                    )
-                impediment_flag = None
-                impediment_start = None
-                impediment_start_status = None
 
-            # Wipe timestamps if items have moved backwards ;
-            # calculate cycle time
-            previous_timestamp = None
-            accepted_timestamp = None
-            completed_timestamp = None
+                    if issue is not None:
+                        item, issue_unmapped_statuses = rows[key]
+                        if not unique_issues and len(queries) > 1:
+                            seen_rows[key] = dict(item)
+                    elif unique_issues:
+                        continue
+                    else:
+                        item = dict(seen_rows[key])
+                        issue_unmapped_statuses = set()
 
-            for cycle_name in cycle_names:
-                if item[cycle_name] is not None:
-                    previous_timestamp = item[cycle_name]
+                    unmapped_statuses.update(issue_unmapped_statuses)
 
-                    if (
-                        accepted_timestamp is None
-                        and previous_timestamp is not None
-                        and cycle_name in accepted_steps
-                    ):
-                        accepted_timestamp = previous_timestamp
-                    if (
-                        completed_timestamp is None
-                        and previous_timestamp is not None
-                        and cycle_name in completed_steps
-                    ):
-                        completed_timestamp = previous_timestamp
+                    if query_attribute:
+                        item[query_attribute] = criteria.get("value", None)
 
-            if (
-                accepted_timestamp is not None
-                and completed_timestamp is not None
-            ):
-                item["cycle_time"] = completed_timestamp - accepted_timestamp
-                item["completed_timestamp"] = completed_timestamp
+                    for k, v in item.items():
+                        series[k]["data"].append(v)
+
+                    impediments.extend(
+                        (key, impediment) for impediment in item["impediments"]
+                    )
+
+                if row_cache is not None and len(new_rows) > 0:
+                    row_cache.save_cycle_rows(new_rows, row_config)
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
-            for k, v in item.items():
-                series[k]["data"].append(v)
+    if cached_rows > 0:
+        logger.info(
+            "Reused cycle time data for %d unchanged issues", cached_rows
+        )
 
     if len(unmapped_statuses) > 0:
         logger.warning(
@@ -386,7 +437,7 @@ def calculate_cycle_times(
     for k, v in series.items():
         data[k] = pd.Series(v["data"], dtype=v["dtype"])
 
-    return pd.DataFrame(
+    cycle_data = pd.DataFrame(
         data,
         columns=["key", "url", "issue_type", "summary", "status", "resolution"]
         + sorted(attributes.keys())
@@ -394,3 +445,731 @@ def calculate_cycle_times(
         + ["cycle_time", "completed_timestamp", "blocked_days", "impediments"]
         + cycle_names,
     )
+
+    if details is not None:
+        details["impediments"] = impediments_table(impediments)
+        details["query_values"] = query_values
+
+    return cycle_data
+
+
+def impediments_table(impediments):
+    """Return a data frame with the columns `key`, `status`, `flag`,
+    `start` and `end`, and a row for each of the given `(key, impediment)`
+    tuples, where `impediment` is a dict as found in the `impediments`
+    column of the cycle time data.
+    """
+
+    series = {
+        "key": {"data": [], "dtype": "str"},
+        "status": {"data": [], "dtype": "str"},
+        "flag": {"data": [], "dtype": "str"},
+        "start": {"data": [], "dtype": "datetime64[ns]"},
+        "end": {"data": [], "dtype": "datetime64[ns]"},
+    }
+
+    for key, impediment in impediments:
+        series["key"]["data"].append(key)
+        for k in ["status", "flag", "start", "end"]:
+            series[k]["data"].append(impediment[k])
+
+    data = {}
+    for k, v in series.items():
+        data[k] = pd.Series(v["data"], dtype=v["dtype"])
+
+    return pd.DataFrame(
+        data, columns=["key", "status", "flag", "start", "end"]
+    )
+
+
+def calculate_rows(query_manager, issues, row_args, vectorized=False):
+    """Return a list of `(item, unmapped_statuses)` tuples for the given
+    issues, using `calculate_cycle_time_row()` for each issue, or
+    `calculate_cycle_time_rows()` for all of them if `vectorized` is set.
+    `row_args` are the remaining arguments to it.
+    """
+
+    if vectorized:
+        return calculate_cycle_time_rows(query_manager, issues, *row_args)
+
+    rows = []
+    for issue in issues:
+        unmapped_statuses = set()
+        item = calculate_cycle_time_row(
+            query_manager, issue, *row_args, unmapped_statuses
+        )
+        rows.append((item, unmapped_statuses))
+    return rows
+
+
+def worker_issue(issue):
+    """Return the raw JSON data of the given issue to send to a worker
+    process, with only the changes to `CHANGE_FIELDS` left in its changelog.
+    """
+
+    histories = []
+    changelog = issue.raw.get("changelog") or {}
+    for history in changelog.get("histories", []):
+        items = [
+            item
+            for item in history.get("items", [])
+            if item.get("field") in CHANGE_FIELDS
+        ]
+        if len(items) > 0:
+            histories.append({"created": history["created"], "items": items})
+
+    return {
+        "key": issue.key,
+        "fields": issue.raw.get("fields", {}),
+        "changelog": {"histories": histories},
+    }
+
+
+# The pickled query manager a worker process was last given, and the copy
+# of the query manager unpickled from it
+_worker_state = (None, None)
+
+
+def calculate_raw_rows(raw_issues, state, row_args, vectorized=False):
+    """Return the same as `calculate_rows()` for issues given as raw JSON
+    data, in a worker process. `state` is the pickled query manager, which
+    is only unpickled the first time a worker is given it. The copy has no
+    connection to JIRA.
+    """
+    global _worker_state
+    if _worker_state[0] != state:
+        _worker_state = (state, pickle.loads(state))
+
+    issues = [LeanIssue(raw) for raw in raw_issues]
+    return calculate_rows(_worker_state[1], issues, row_args, vectorized)
+
+
+def calculate_cycle_time_row(
+    query_manager,
+    issue,
+    workflow,
+    status_ids,
+    attributes,
+    backlog_column,
+    done_column,
+    now,
+    unmapped_statuses,
+):
+    """Return a dict of the values of the cycle time data columns for the
+    given issue (except the query attribute). Statuses are mapped to steps
+    of the `workflow` by id using `status_ids` (see
+    `Workflow.status_id_indexes()`), or else by name. Statuses not mapped to
+    a step are added to the set `unmapped_statuses`.
+    """
+
+    item = issue_item(query_manager, issue, attributes)
+
+    # Date each step was entered, by step index
+    dates = [None] * len(workflow.step_names)
+
+    # Index of the last step with a date. Steps after it have none.
+    last_index = -1
+
+    last_status = None
+    flag_changes = []
+
+    # Record date of status and impediments flag changes
+    for snapshot in query_manager.iter_changes(issue, CHANGE_FIELDS):
+        if snapshot.change == "status":
+            index = workflow.step_index(
+                snapshot.to_string, snapshot.to_id, status_ids
+            )
+            if index is None:
+                logger.info(
+                    "Issue %s transitioned to unknown JIRA status %s",
+                    issue.key,
+                    snapshot.to_string,
+                )
+                unmapped_statuses.add(snapshot.to_string)
+                continue
+
+            last_status = workflow.step_names[index]
+
+            # Keep the first time we entered a step
+            if dates[index] is None:
+                dates[index] = snapshot.date.date()
+
+            # Wipe any subsequent dates,
+            # in case this was a move backwards
+            for later_index in range(index + 1, last_index + 1):
+                if dates[later_index] is not None:
+                    logger.info(
+                        "Issue %s moved backwards to %s "
+                        "[JIRA: %s -> %s], "
+                        "wiping data for subsequent step %s",
+                        issue.key,
+                        last_status,
+                        snapshot.from_string,
+                        snapshot.to_string,
+                        workflow.step_names[later_index],
+                    )
+                    dates[later_index] = None
+            last_index = index
+        elif snapshot.change == "Flagged":
+            flag_changes.append(
+                (
+                    snapshot.date.date(),
+                    snapshot.from_string,
+                    snapshot.to_string,
+                    last_status,
+                )
+            )
+
+    item.update(zip(workflow.step_names, dates))
+
+    item["blocked_days"], item["impediments"] = calculate_impediments(
+        issue, flag_changes, backlog_column, done_column, now
+    )
+
+    # Calculate cycle time from the first accepted and completed steps
+    # with a date
+    accepted_timestamp = next(
+        (dates[i] for i in workflow.accepted_indexes if dates[i] is not None),
+        None,
+    )
+    completed_timestamp = next(
+        (dates[i] for i in workflow.completed_indexes if dates[i] is not None),
+        None,
+    )
+
+    if accepted_timestamp is not None and completed_timestamp is not None:
+        item["cycle_time"] = completed_timestamp - accepted_timestamp
+        item["completed_timestamp"] = completed_timestamp
+
+    return item
+
+
+def calculate_cycle_time_rows(
+    query_manager,
+    issues,
+    workflow,
+    status_ids,
+    attributes,
+    backlog_column,
+    done_column,
+    now,
+):
+    """Return a list of `(item, unmapped_statuses)` tuples for the given
+    issues, with the same values as `calculate_cycle_time_row()`. Rather
+    than replaying the changes of each issue in turn, the status and flag
+    changes of all the issues are read from their raw JSON into one table,
+    and the dates each issue entered each step are worked out with array
+    operations.
+
+    An issue keeps the date it first entered a step, unless it later moves
+    back to an earlier step, which wipes the dates of the steps after it.
+    The date of a step is therefore that of the first change to the step
+    with no change to an earlier step after it.
+    """
+
+    if len(issues) == 0:
+        return []
+
+    step_names = workflow.step_names
+    n_issues, n_steps = len(issues), len(step_names)
+
+    # Change items, in the order they appear in the changelogs, as columns
+    # of issue position, timestamp, field, from/to values and from/to ids
+    positions, timestamps, changes = [], [], []
+    for position, issue in enumerate(issues):
+        changelog = issue.raw.get("changelog") or {}
+        for history in changelog.get("histories", []):
+            for item in history.get("items", []):
+                if item["field"] in CHANGE_FIELDS:
+                    positions.append(position)
+                    timestamps.append(history["created"])
+                    changes.append(
+                        (
+                            item["field"],
+                            item.get("fromString"),
+                            item.get("toString"),
+                            item.get("from"),
+                            item.get("to"),
+                        )
+                    )
+
+    # Sort the items by issue and time, keeping the order of items made at
+    # the same time, as `ChangelogIndex` does
+    positions = np.array(positions, dtype=int)
+    order = np.lexsort(
+        (
+            np.arange(len(positions)),
+            parse_timestamps(timestamps),
+            positions,
+        )
+    )
+    positions = positions[order]
+    days = local_days(timestamps)[order]
+    changes = [changes[i] for i in order]
+
+    # Each issue starts with its initial status and flag at the time it was
+    # created: the value the first change to the field changed from, or the
+    # current value if it never changed
+    created_days = local_days([issue.fields.created for issue in issues])
+    initial = []
+    for field in CHANGE_FIELDS:
+        field_id = query_manager.field_name_to_id(field)
+        mask = np.array([c[0] == field for c in changes], dtype=bool)
+        first_positions, first_indexes = np.unique(
+            positions[mask], return_index=True
+        )
+        first_changes = dict(
+            zip(
+                first_positions.tolist(),
+                np.flatnonzero(mask)[first_indexes].tolist(),
+            )
+        )
+        values = []
+        for position, issue in enumerate(issues):
+            index = first_changes.get(position)
+            if index is not None:
+                _, from_string, _, from_id, _ = changes[index]
+                values.append((field, None, from_string, None, from_id))
+            else:
+                values.append(
+                    (
+                        field,
+                        None,
+                        query_manager.resolve_field_value(issue, field_id),
+                        None,
+                        getattr(
+                            getattr(issue.fields, field_id, None), "id", None
+                        ),
+                    )
+                )
+        initial.append(values)
+
+    # All the changes of all issues, each issue's initial status and flag
+    # first, then its changes in order
+    order = np.lexsort(
+        (
+            np.concatenate(
+                [
+                    np.full(n_issues, -2),
+                    np.full(n_issues, -1),
+                    np.arange(len(positions)),
+                ]
+            ),
+            np.concatenate(
+                [np.arange(n_issues), np.arange(n_issues), positions]
+            ),
+        )
+    )
+    positions = np.concatenate(
+        [np.arange(n_issues), np.arange(n_issues), positions]
+    )[order]
+    days = np.concatenate([created_days, created_days, days])[order]
+    changes = initial[0] + initial[1] + changes
+    changes = [changes[i] for i in order]
+
+    # Step index of each status change, -1 for unmapped statuses, and
+    # None for flag changes
+    unmapped_statuses = [set() for _ in issues]
+    steps = np.full(len(changes), -1)
+    is_status = np.zeros(len(changes), dtype=bool)
+    step_indexes = {}
+    for i, (field, _, to_string, _, to_id) in enumerate(changes):
+        if field != "status":
+            continue
+        is_status[i] = True
+        try:
+            index = step_indexes[to_string, to_id]
+        except KeyError:
+            index = step_indexes[to_string, to_id] = workflow.step_index(
+                to_string, to_id, status_ids
+            )
+        if index is None:
+            position = positions[i]
+            logger.info(
+                "Issue %s transitioned to unknown JIRA status %s",
+                issues[position].key,
+                to_string,
+            )
+            unmapped_statuses[position].add(to_string)
+        else:
+            steps[i] = index
+    is_mapped = is_status & (steps >= 0)
+
+    # A change to a step is kept if the issue never moves to an earlier
+    # step after it, and the first change kept for each step gives its date
+    mapped_positions, mapped_steps = positions[is_mapped], steps[is_mapped]
+    later_minimum = (
+        pd.Series(mapped_steps[::-1])
+        .groupby(mapped_positions[::-1])
+        .cummin()
+        .values[::-1]
+    )
+    kept = later_minimum == mapped_steps
+    cells, first_indexes = np.unique(
+        mapped_positions[kept] * n_steps + mapped_steps[kept],
+        return_index=True,
+    )
+    step_days = np.full(n_issues * n_steps, np.datetime64("NaT", "D"))
+    step_days[cells] = days[is_mapped][kept][first_indexes]
+    step_days = step_days.reshape(n_issues, n_steps)
+
+    # Calculate cycle time from the first accepted and completed steps
+    # with a date
+    def first_day(indexes):
+        result = np.full(n_issues, np.datetime64("NaT", "D"))
+        for index in reversed(indexes):
+            has_day = ~np.isnat(step_days[:, index])
+            result[has_day] = step_days[has_day, index]
+        return result
+
+    accepted_days = first_day(workflow.accepted_indexes)
+    completed_days = first_day(workflow.completed_indexes)
+    completed_days[np.isnat(accepted_days)] = np.datetime64("NaT", "D")
+    cycle_times = (completed_days - accepted_days).astype(object)
+    completed_days = completed_days.astype(object)
+
+    # The step each issue was in at the time of each flag change
+    last_steps = (
+        pd.Series(np.where(is_mapped, steps, np.nan))
+        .groupby(positions)
+        .ffill()
+        .values
+    )
+    flag_changes = [[] for _ in issues]
+    day_values = days.astype(object)
+    for i in np.flatnonzero(~is_status).tolist():
+        _, from_string, to_string, _, _ = changes[i]
+        flag_changes[positions[i]].append(
+            (
+                day_values[i],
+                from_string,
+                to_string,
+                (
+                    step_names[int(last_steps[i])]
+                    if not np.isnan(last_steps[i])
+                    else None
+                ),
+            )
+        )
+
+    rows = []
+    step_day_values = step_days.astype(object)
+    for position, issue in enumerate(issues):
+        item = issue_item(query_manager, issue, attributes)
+        item.update(zip(step_names, step_day_values[position]))
+        item["blocked_days"], item["impediments"] = calculate_impediments(
+            issue, flag_changes[position], backlog_column, done_column, now
+        )
+        if cycle_times[position] is not None:
+            item["cycle_time"] = cycle_times[position]
+            item["completed_timestamp"] = completed_days[position]
+        rows.append((item, unmapped_statuses[position]))
+
+    return rows
+
+
+def parse_timestamps(values):
+    """Return an array of the UTC times of the given JIRA timestamps, as
+    nanoseconds, for sorting.
+    """
+    try:
+        parsed = pd.to_datetime(values, utc=True)
+    except (ValueError, TypeError):
+        parsed = pd.to_datetime([parse_date(v) for v in values], utc=True)
+    return np.asarray(parsed.asi8)
+
+
+def local_days(values):
+    """Return an array of the dates of the given JIRA timestamps, in the
+    timezone JIRA reported them in.
+    """
+    try:
+        return np.array([v[:10] for v in values], dtype="datetime64[D]")
+    except (ValueError, TypeError):
+        return np.array(
+            [parse_date(v).date() for v in values], dtype="datetime64[D]"
+        )
+
+
+def issue_item(query_manager, issue, attributes):
+    """Return a dict of the cycle time data columns taken from the fields
+    of the given issue.
+    """
+
+    item = {
+        "key": issue.key,
+        "url": "%s/browse/%s"
+        % (
+            query_manager.server_url,
+            issue.key,
+        ),
+        "issue_type": issue.fields.issuetype.name,
+        "summary": issue.fields.summary,
+        "status": issue.fields.status.name,
+        "resolution": (
+            issue.fields.resolution.name if issue.fields.resolution else None
+        ),
+        "cycle_time": None,
+        "completed_timestamp": None,
+        "blocked_days": 0,
+        "impediments": [],
+    }
+
+    for name in attributes:
+        item[name] = query_manager.resolve_attribute_value(issue, name)
+
+    return item
+
+
+def calculate_impediments(
+    issue, flag_changes, backlog_column, done_column, now
+):
+    """Return the number of days the given issue was blocked, and a list of
+    its impediments, given a `(date, from_string, to_string, status)` tuple
+    for each change to its impediment flag, where `status` is the step of
+    the cycle the issue was in at the time.
+    """
+
+    blocked_days = 0
+    impediments = []
+
+    impediment_flag = None
+    impediment_start_status = None
+    impediment_start = None
+
+    for date, from_string, to_string, status in flag_changes:
+        if from_string == to_string is None:
+            # Initial state from None -> None
+            continue
+        elif to_string is not None and to_string != "":
+            impediment_flag = to_string
+            impediment_start = date
+            impediment_start_status = status
+        elif to_string is None or to_string == "":
+            if impediment_start is None:
+                logger.warning(
+                    "Issue %s had impediment flag cleared before "
+                    "being set. This should not happen.",
+                    issue.key,
+                )
+                continue
+
+            if impediment_start_status not in (
+                backlog_column,
+                done_column,
+            ):
+                blocked_days += (date - impediment_start).days
+            impediments.append(
+                {
+                    "start": impediment_start,
+                    "end": date,
+                    "status": impediment_start_status,
+                    "flag": impediment_flag,
+                }
+            )
+
+            # Reset for next time
+            impediment_flag = None
+            impediment_start = None
+            impediment_start_status = None
+
+    # If an impediment flag was set but never cleared :
+    # treat as resolved on the ticket
+    # resolution date if the ticket was resolved,
+    # else as still open until today.
+    if impediment_start is not None:
+        if issue.fields.resolutiondate:
+            resolution_date = dateutil.parser.parse(
+                issue.fields.resolutiondate
+            ).date()
+            if impediment_start_status not in (
+                backlog_column,
+                done_column,
+            ):
+                blocked_days += (resolution_date - impediment_start).days
+            impediments.append(
+                {
+                    "start": impediment_start,
+                    "end": resolution_date,
+                    "status": impediment_start_status,
+                    "flag": impediment_flag,
+                }
+            )
+        else:
+            if impediment_start_status not in (
+                backlog_column,
+                done_column,
+            ):
+                blocked_days += (now.date() - impediment_start).days
+            impediments.append(
+                {
+                    "start": impediment_start,
+                    "end": None,
+                    "status": impediment_start_status,
+                    "flag": impediment_flag,
+                }
+            )
+
+    return blocked_days, impediments
+
+
+def compact_cycle_data(cycle_data, columns):
+    """Return a copy of `cycle_data` that uses less memory: without the
+    `url` column, with those of the given `columns` that only hold strings,
+    with few distinct values, as categories, and with `blocked_days` as a
+    32 bit nullable integer. `expand_cycle_data()` turns it back.
+    """
+
+    cycle_data = cycle_data.drop(columns=["url"])
+
+    for column in columns:
+        values = cycle_data[column].dropna()
+        if (
+            values.map(type).eq(str).all()
+            and values.nunique() <= len(cycle_data.index) // 2
+        ):
+            cycle_data[column] = cycle_data[column].astype("category")
+
+    cycle_data["blocked_days"] = cycle_data["blocked_days"].astype("Int32")
+
+    return cycle_data
+
+
+def expand_cycle_data(cycle_data, server_url):
+    """Return cycle time data made with `compact_cycle_data()` (or data
+    derived from it) as `calculate_cycle_times()` would have returned it,
+    with links to issues on the given server in the `url` column. Other
+    data is returned as it is.
+    """
+
+    categories = [
+        column
+        for column, dtype in cycle_data.dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)
+    ]
+    compact_blocked_days = "blocked_days" in cycle_data and (
+        pd.api.types.is_extension_array_dtype(cycle_data["blocked_days"])
+    )
+
+    if (
+        "url" in cycle_data
+        and len(categories) == 0
+        and not compact_blocked_days
+    ):
+        return cycle_data
+
+    cycle_data = cycle_data.copy()
+
+    for column in categories:
+        values = cycle_data[column].astype(object)
+        cycle_data[column] = values.where(values.notna(), None)
+
+    if compact_blocked_days:
+        cycle_data["blocked_days"] = cycle_data["blocked_days"].astype("int")
+
+    if "url" not in cycle_data:
+        cycle_data.insert(
+            cycle_data.columns.get_loc("key") + 1,
+            "url",
+            ("%s/browse/" % server_url) + cycle_data["key"].astype(object),
+        )
+
+    return cycle_data
+
+
+def cycle_row_config(
+    query_manager, cycle, status_ids, attributes, backlog_column, done_column
+):
+    """Return a hash of the configuration that cycle time data for an issue
+    is calculated from, besides the issue itself, including the ids (and
+    types) of the fields the attributes are read from.
+    """
+    fields = {
+        name: [
+            field_id,
+            (query_manager.jira_fields_by_id.get(field_id) or {}).get(
+                "schema"
+            ),
+        ]
+        for name, field_id in query_manager.attributes_to_fields.items()
+    }
+
+    return hashlib.sha1(
+        json.dumps(
+            [
+                ROW_FORMAT_VERSION,
+                query_manager.server_url,
+                cycle,
+                status_ids,
+                attributes,
+                fields,
+                query_manager.settings["known_values"],
+                backlog_column,
+                done_column,
+            ],
+            sort_keys=True,
+            default=str,
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def cycle_row_to_json(item, unmapped_statuses, step_names):
+    """Return the cycle time data for an issue, as returned by
+    `calculate_rows()`, as a value that can be stored as JSON, with dates
+    as strings and the cycle time as a number of days.
+    `cycle_row_from_json()` turns it back.
+    """
+
+    def date_to_json(value):
+        return value.strftime(ROW_DATE_FORMAT) if value is not None else None
+
+    item = dict(item)
+
+    for name in step_names + ["completed_timestamp"]:
+        item[name] = date_to_json(item[name])
+
+    if item["cycle_time"] is not None:
+        item["cycle_time"] = item["cycle_time"].days
+
+    item["impediments"] = [
+        dict(
+            impediment,
+            start=date_to_json(impediment["start"]),
+            end=date_to_json(impediment["end"]),
+        )
+        for impediment in item["impediments"]
+    ]
+
+    return {"item": item, "unmapped_statuses": sorted(unmapped_statuses)}
+
+
+def cycle_row_from_json(row, step_names):
+    """Return cycle time data for an issue saved with
+    `cycle_row_to_json()` as an `(item, unmapped_statuses)` tuple.
+    """
+
+    def date_from_json(value):
+        return (
+            datetime.datetime.strptime(value, ROW_DATE_FORMAT).date()
+            if value is not None
+            else None
+        )
+
+    item = dict(row["item"])
+
+    for name in step_names + ["completed_timestamp"]:
+        item[name] = date_from_json(item[name])
+
+    if item["cycle_time"] is not None:
+        item["cycle_time"] = datetime.timedelta(days=item["cycle_time"])
+
+    item["impediments"] = [
+        dict(
+            impediment,
+            start=date_from_json(impediment["start"]),
+            end=date_from_json(impediment["end"]),
+        )
+        for impediment in item["impediments"]
+    ]
+
+    return item, set(row["unmapped_statuses"])
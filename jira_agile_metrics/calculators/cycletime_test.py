@@ -1,6 +1,9 @@
+import json
+import random
 import pytest
 import datetime
 from pandas import NaT, Timestamp, Timedelta
+from pandas.testing import assert_frame_equal
 
 from ..conftest import (
     FauxJIRA as JIRA,
@@ -10,7 +13,16 @@ from ..conftest import (
 )
 
 from ..querymanager import QueryManager
-from .cycletime import CycleTimeCalculator
+from ..utils import extend_dict
+from . import cycletime
+from .cycletime import (
+    CycleTimeCalculator,
+    cycle_row_from_json,
+    cycle_row_to_json,
+    expand_cycle_data,
+    worker_issue,
+)
+from .scatterplot import ScatterplotCalculator
 
 
 @pytest.fixture
@@ -363,3 +375,542 @@ def test_movement(jira, settings):
             "Done": NaT,
         },
     ]
+
+    def impediment(key, status, flag, start, end):
+        return {
+            "key": key,
+            "status": status,
+            "flag": flag,
+            "start": Timestamp(start),
+            "end": Timestamp(end) if end else NaT,
+        }
+
+    assert calculator.get_result(name="impediments").to_dict("records") == [
+        impediment("A-2", "Backlog", "Impediment", "2018-01-02", "2018-01-03"),
+        impediment(
+            "A-2", "Committed", "Impediment", "2018-01-04", "2018-01-05"
+        ),
+        impediment("A-2", "Committed", "Impediment", "2018-01-08", None),
+        impediment("A-3", "Build", "Impediment", "2018-01-04", "2018-01-06"),
+        impediment(
+            "A-4", "Committed", "Awaiting input", "2018-01-07", "2018-01-10"
+        ),
+    ]
+
+
+def test_movement_streamed(jira, settings):
+    now = datetime.datetime(2018, 1, 10, 15, 37, 0)
+
+    expected = CycleTimeCalculator(
+        QueryManager(jira, settings), settings, {}
+    ).run(now=now)
+
+    settings = extend_dict(
+        settings, {"stream_issues": True, "fetch_page_size": 2}
+    )
+    query_manager = QueryManager(jira, settings)
+    calculator = CycleTimeCalculator(query_manager, settings, {})
+
+    assert calculator.queries() == []
+
+    data = calculator.run(now=now)
+    assert data.to_dict("records") == expected.to_dict("records")
+
+    # Streamed issues are not kept
+    assert query_manager.query_results == {}
+
+
+def test_overlapping_queries(jira, settings):
+    # (filter=1) finds A-1, A-2 and A-3, (filter=2) finds A-3 and A-4
+    def simple_ql(issue, jql):
+        if jql.startswith("key in"):
+            return issue.key in jql.split("(")[1].strip(")").split(", ")
+        if jql == "(filter=1)":
+            return issue.key in ("A-1", "A-2", "A-3")
+        return issue.key in ("A-3", "A-4")
+
+    queries = []
+
+    class RecordingJIRA(JIRA):
+        def search_issues(self, jql, *args, **kwargs):
+            queries.append(jql)
+            return super().search_issues(jql, *args, **kwargs)
+
+    jira = RecordingJIRA(
+        fields=jira.fields(), issues=jira.issues(), filter_=simple_ql
+    )
+    settings = extend_dict(
+        settings,
+        {
+            "query_attribute": "Source",
+            "queries": [
+                {"jql": "(filter=1)", "value": "First"},
+                {"jql": "(filter=2)", "value": "Second"},
+            ],
+        },
+    )
+
+    query_manager = QueryManager(jira, settings)
+    calculator = CycleTimeCalculator(query_manager, settings, {})
+    data = calculator.run(now=datetime.datetime(2018, 1, 10, 15, 37, 0))
+
+    # Each issue is included once for each query that found it
+    assert [(r["key"], r["Source"]) for r in data.to_dict("records")] == [
+        ("A-1", "First"),
+        ("A-2", "First"),
+        ("A-3", "First"),
+        ("A-3", "Second"),
+        ("A-4", "Second"),
+    ]
+    assert calculator.get_result(name="query_values") == {
+        "A-1": ["First"],
+        "A-2": ["First"],
+        "A-3": ["First", "Second"],
+        "A-4": ["Second"],
+    }
+    rows = data.to_dict("records")
+    assert {**rows[2], "Source": None} == {**rows[3], "Source": None}
+
+    # A-3 was only fetched once
+    assert queries == ["(filter=1)", "(filter=2)", "key in (A-4)"]
+
+    # Or only included once, with the value from the first query
+    queries.clear()
+    settings = extend_dict(settings, {"unique_issues": True})
+    query_manager = QueryManager(jira, settings)
+    calculator = CycleTimeCalculator(query_manager, settings, {})
+    data = calculator.run(now=datetime.datetime(2018, 1, 10, 15, 37, 0))
+
+    assert [(r["key"], r["Source"]) for r in data.to_dict("records")] == [
+        ("A-1", "First"),
+        ("A-2", "First"),
+        ("A-3", "First"),
+        ("A-4", "Second"),
+    ]
+    assert calculator.get_result(name="query_values")["A-3"] == [
+        "First",
+        "Second",
+    ]
+    assert queries == ["(filter=1)", "(filter=2)", "key in (A-4)"]
+
+
+def test_updated_issues_without_cache(jira, settings):
+    now = datetime.datetime(2018, 1, 10, 15, 37, 0)
+
+    query_manager = QueryManager(jira, settings)
+    expected = CycleTimeCalculator(query_manager, settings, {}).run(now=now)
+
+    # Issues fetched from JIRA have an `updated` date
+    for issue in jira._issues:
+        issue.fields.updated = "2018-01-08T10:01:01"
+
+    query_manager = QueryManager(jira, settings)
+    assert query_manager.issue_cache is None
+
+    data = CycleTimeCalculator(query_manager, settings, {}).run(now=now)
+    assert data.to_dict("records") == expected.to_dict("records")
+
+
+def test_reuses_rows_for_unchanged_issues(
+    jira, settings, tmp_path, monkeypatch
+):
+    from . import cycletime
+
+    for issue in jira._issues:
+        issue.fields.updated = "2018-01-08T10:01:01"
+
+    settings = extend_dict(settings, {"cache_directory": str(tmp_path)})
+    now = datetime.datetime(2018, 1, 10, 15, 37, 0)
+
+    calculated = []
+    calculate_row = cycletime.calculate_cycle_time_row
+
+    def counting_calculate_row(query_manager, issue, *args):
+        calculated.append(issue.key)
+        return calculate_row(query_manager, issue, *args)
+
+    monkeypatch.setattr(
+        cycletime, "calculate_cycle_time_row", counting_calculate_row
+    )
+
+    def run():
+        calculated.clear()
+        query_manager = QueryManager(jira, settings)
+        return CycleTimeCalculator(query_manager, settings, {}).run(now=now)
+
+    first = run()
+    assert calculated == ["A-1", "A-2", "A-3", "A-4"]
+
+    # Rows with open impediments depend on the current date, so aren't kept
+    second = run()
+    assert calculated == ["A-2"]
+    assert second.to_dict("records") == first.to_dict("records")
+
+    # Issues updated since are calculated again
+    jira._issues[0].fields.updated = "2018-01-09T10:01:01"
+    run()
+    assert calculated == ["A-1", "A-2"]
+
+
+def test_cycle_row_json():
+    item = {
+        "key": "A-1",
+        "url": "https://example.org/browse/A-1",
+        "issue_type": "Story",
+        "summary": "Issue A-1",
+        "status": "Done",
+        "resolution": None,
+        "cycle_time": datetime.timedelta(days=3),
+        "completed_timestamp": datetime.date(2018, 1, 6),
+        "blocked_days": 1,
+        "impediments": [
+            {
+                "start": datetime.date(2018, 1, 4),
+                "end": datetime.date(2018, 1, 5),
+                "status": "Build",
+                "flag": "Impediment",
+            }
+        ],
+        "Estimate": 10,
+        "Release": "R1",
+        "Backlog": datetime.date(2018, 1, 1),
+        "Build": datetime.date(2018, 1, 3),
+        "Done": datetime.date(2018, 1, 6),
+        "Test": None,
+    }
+    steps = ["Backlog", "Build", "Test", "Done"]
+
+    row = cycle_row_to_json(item, {"Unknown", "Other"}, steps)
+    assert json.loads(json.dumps(row)) == row
+    assert row["item"]["Build"] == "2018-01-03"
+    assert row["item"]["cycle_time"] == 3
+
+    assert cycle_row_from_json(row, steps) == (item, {"Unknown", "Other"})
+
+
+def test_recalculates_rows_for_other_fields(custom_fields, settings, tmp_path):
+    issues = [
+        Issue(
+            "A-1",
+            summary="Just created",
+            issuetype=Value("Story", "story"),
+            status=Value("Backlog", "backlog"),
+            resolution=None,
+            resolutiondate=None,
+            created="2018-01-01 01:01:01",
+            updated="2018-01-01 01:01:01",
+            customfield_001="Team 1",
+            customfield_002=Value(None, 10),
+            customfield_003=Value(None, ["R2", "R3", "R4"]),
+            customfield_004="Team 2",
+            customfield_100=None,
+            changes=[],
+        )
+    ]
+    fields = custom_fields + [{"id": "customfield_004", "name": "Squad"}]
+    jira = JIRA(fields=fields, issues=issues)
+    settings = extend_dict(settings, {"cache_directory": str(tmp_path)})
+
+    def run(settings):
+        query_manager = QueryManager(jira, settings)
+        return CycleTimeCalculator(query_manager, settings, {}).run()
+
+    assert run(settings)["Team"].tolist() == ["Team 1"]
+
+    # Rows are calculated again if an attribute is read from another field
+    for field in fields:
+        if field["name"] in ("Team", "Squad"):
+            field["name"] = {"Team": "Squad", "Squad": "Team"}[field["name"]]
+
+    settings = extend_dict(settings, {"refresh_metadata": True})
+    assert run(settings)["Team"].tolist() == ["Team 2"]
+
+
+def test_lean_issues(jira, settings):
+    now = datetime.datetime(2018, 1, 10, 15, 37, 0)
+
+    query_manager = QueryManager(jira, settings)
+    data = CycleTimeCalculator(query_manager, settings, {}).run(now=now)
+
+    settings = extend_dict(settings, {"lean_issues": True})
+    query_manager = QueryManager(jira, settings)
+    lean_data = CycleTimeCalculator(query_manager, settings, {}).run(now=now)
+
+    assert lean_data.to_dict("records") == data.to_dict("records")
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_renamed_statuses(custom_fields, settings, workers, monkeypatch):
+    monkeypatch.setattr(cycletime, "MIN_WORKER_ISSUES", 2)
+    settings = extend_dict(settings, {"workers": workers})
+
+    def issue(key, status, changes):
+        return Issue(
+            key,
+            summary="Renamed",
+            issuetype=Value("Story", "story"),
+            status=status,
+            resolution=None,
+            resolutiondate=None,
+            created="2018-01-01 01:01:01",
+            customfield_001="Team 1",
+            customfield_002=Value(None, 10),
+            customfield_003=Value(None, []),
+            customfield_100=None,
+            changes=changes,
+        )
+
+    # "Next" used to be called "Ready". "Doing" was never mapped. Only the
+    # second issue is in "Next" now, which is how JIRA lists the status.
+    status = Value("Next", "next")
+    status.id = "10"
+    jira = JIRA(
+        fields=custom_fields,
+        issues=[
+            issue(
+                "A-1",
+                Value("Doing", "doing"),
+                [
+                    Change(
+                        "2018-01-02 01:01:01",
+                        [("status", "Backlog", "Ready", "1", "10")],
+                    ),
+                    Change(
+                        "2018-01-03 01:01:01",
+                        [("status", "Ready", "Doing", "10", "30")],
+                    ),
+                ],
+            ),
+            issue(
+                "A-2",
+                status,
+                [
+                    Change(
+                        "2018-01-03 01:01:01",
+                        [("status", "Backlog", "Next", "1", "10")],
+                    ),
+                ],
+            ),
+        ],
+    )
+
+    query_manager = QueryManager(jira, settings)
+    data = CycleTimeCalculator(query_manager, settings, {}).run(
+        now=datetime.datetime(2018, 1, 10, 15, 37, 0)
+    )
+
+    assert data[["key", "Backlog", "Committed", "Build"]].to_dict(
+        "records"
+    ) == [
+        {
+            "key": "A-1",
+            "Backlog": Timestamp("2018-01-01 00:00:00"),
+            "Committed": Timestamp("2018-01-02 00:00:00"),
+            "Build": NaT,
+        },
+        {
+            "key": "A-2",
+            "Backlog": Timestamp("2018-01-01 00:00:00"),
+            "Committed": Timestamp("2018-01-03 00:00:00"),
+            "Build": NaT,
+        },
+    ]
+
+
+def test_workers(jira, settings, monkeypatch):
+    monkeypatch.setattr(cycletime, "MIN_WORKER_ISSUES", 2)
+    now = datetime.datetime(2018, 1, 10, 15, 37, 0)
+
+    query_manager = QueryManager(jira, settings)
+    data = CycleTimeCalculator(query_manager, settings, {}).run(now=now)
+
+    settings = extend_dict(settings, {"workers": 2})
+    query_manager = QueryManager(jira, settings)
+    parallel_data = CycleTimeCalculator(query_manager, settings, {}).run(
+        now=now
+    )
+
+    assert parallel_data.to_dict("records") == data.to_dict("records")
+
+
+def test_vectorized_cycle_times(jira, settings):
+    now = datetime.datetime(2018, 1, 10, 15, 37, 0)
+
+    def run(settings):
+        query_manager = QueryManager(jira, settings)
+        calculator = CycleTimeCalculator(query_manager, settings, {})
+        return (
+            calculator.run(now=now),
+            calculator.get_result(name="impediments"),
+        )
+
+    data, impediments = run(settings)
+    vectorized_data, vectorized_impediments = run(
+        extend_dict(settings, {"vectorized_cycle_times": True})
+    )
+
+    assert_frame_equal(vectorized_data, data)
+    assert_frame_equal(vectorized_impediments, impediments)
+
+
+def test_workers_only_for_many_issues(jira, settings, monkeypatch):
+    def no_executor(*args, **kwargs):
+        raise AssertionError("Worker processes started")
+
+    monkeypatch.setattr(cycletime, "ProcessPoolExecutor", no_executor)
+
+    settings = extend_dict(settings, {"workers": 2})
+    query_manager = QueryManager(jira, settings)
+    data = CycleTimeCalculator(query_manager, settings, {}).run(
+        now=datetime.datetime(2018, 1, 10, 15, 37, 0)
+    )
+
+    assert len(data) == len(jira.issues())
+
+
+def test_worker_issue(jira):
+    issue = jira.issues()[1]
+    issue.changelog.histories.append(
+        Change("2018-01-05 01:01:01", [("summary", "Old", "New")])
+    )
+
+    raw = worker_issue(issue)
+
+    assert raw["key"] == "A-2"
+    assert raw["fields"] == issue.raw["fields"]
+    assert [h["created"] for h in raw["changelog"]["histories"]] == [
+        h.created for h in issue.changelog.histories[:-1]
+    ]
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_vectorized_cycle_times_random_histories(
+    custom_fields, settings, workers, monkeypatch
+):
+    monkeypatch.setattr(cycletime, "MIN_WORKER_ISSUES", 100)
+    random.seed(21)
+    statuses = [
+        ("Backlog", "1"),
+        ("Next", "10"),
+        ("Build", "20"),
+        ("Code review", "30"),
+        ("QA", "31"),
+        ("Done", "40"),
+        ("Doing", "50"),  # not mapped
+        ("Ready", "10"),  # "Next" before it was renamed
+    ]
+
+    def timestamp(day, hour, offset):
+        return "2018-01-%02dT%02d:30:00.000%+03d00" % (day, hour, offset)
+
+    def issue(n):
+        status, status_id = "Backlog", "1"
+        changes = []
+        for _ in range(random.randint(0, 12)):
+            items = []
+            if random.random() < 0.8:
+                to, to_id = random.choice(statuses)
+                items.append(("status", status, to, status_id, to_id))
+                status, status_id = to, to_id
+            if random.random() < 0.3:
+                flag = random.choice([None, "", "Impediment"])
+                items.append(("Flagged", None, flag))
+            if items:
+                changes.append(
+                    Change(
+                        timestamp(
+                            random.randint(2, 28),
+                            random.randint(0, 23),
+                            random.choice([-5, 0, 1]),
+                        ),
+                        items,
+                    )
+                )
+        current = Value(status, status.lower())
+        current.id = status_id
+        return Issue(
+            "A-%d" % n,
+            summary="Random",
+            issuetype=Value("Story", "story"),
+            status=current,
+            resolution=None,
+            resolutiondate=random.choice([None, timestamp(29, 12, 0)]),
+            created=timestamp(1, random.randint(0, 23), -5),
+            customfield_001="Team 1",
+            customfield_002=Value(None, 10),
+            customfield_003=Value(None, []),
+            customfield_100=random.choice([None, "Impediment"]),
+            changes=changes,
+        )
+
+    jira = JIRA(fields=custom_fields, issues=[issue(n) for n in range(300)])
+    now = datetime.datetime(2018, 2, 10, 15, 37, 0)
+
+    def run(settings):
+        query_manager = QueryManager(jira, settings)
+        calculator = CycleTimeCalculator(query_manager, settings, {})
+        return (
+            calculator.run(now=now),
+            calculator.get_result(name="impediments"),
+        )
+
+    data, impediments = run(settings)
+    vectorized_data, vectorized_impediments = run(
+        extend_dict(
+            settings, {"vectorized_cycle_times": True, "workers": workers}
+        )
+    )
+
+    assert_frame_equal(vectorized_data, data)
+    assert_frame_equal(vectorized_impediments, impediments)
+    assert data["cycle_time"].notnull().any()
+    assert len(impediments) > 0
+
+
+def test_compact_cycle_data(jira, settings, tmp_path):
+    now = datetime.datetime(2018, 1, 10, 15, 37, 0)
+
+    query_manager = QueryManager(jira, settings)
+    data = CycleTimeCalculator(query_manager, settings, {}).run(now=now)
+
+    compact_settings = extend_dict(settings, {"compact_cycle_data": True})
+    compact_data = CycleTimeCalculator(
+        query_manager, compact_settings, {}
+    ).run(now=now)
+
+    assert "url" not in compact_data
+    assert compact_data["issue_type"].dtype == "category"
+    assert compact_data["Release"].dtype == "category"
+    assert compact_data["summary"].dtype == "object"
+    assert compact_data["blocked_days"].dtype == "Int32"
+
+    assert_frame_equal(
+        expand_cycle_data(compact_data, "https://example.org"), data
+    )
+
+    # The same files are written
+    def write_files(settings, name):
+        settings = extend_dict(
+            settings,
+            {
+                "cycle_time_data": [
+                    str(tmp_path / (name + ".csv")),
+                    str(tmp_path / (name + ".json")),
+                ],
+                "scatterplot_data": [str(tmp_path / (name + "-scatter.csv"))],
+                "scatterplot_chart": None,
+            },
+        )
+        results = {}
+        for calculator_class in [CycleTimeCalculator, ScatterplotCalculator]:
+            calculator = calculator_class(query_manager, settings, results)
+            results[calculator_class] = calculator.run()
+            calculator.write()
+
+    write_files(settings, "data")
+    write_files(compact_settings, "compact")
+
+    for suffix in [".csv", ".json", "-scatter.csv"]:
+        assert (tmp_path / ("compact" + suffix)).read_text() == (
+            tmp_path / ("data" + suffix)
+        ).read_text()
@@ -6,6 +6,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 
 from ..calculator import Calculator
+from ..scheduler import PRIORITY_LOW
 from ..utils import (
     breakdown_by_month,
     Chart,
@@ -31,6 +32,12 @@ class DebtCalculator(Calculator):
     `debt_age_chart_title`, grouping by item age.
     """
 
+    priority = PRIORITY_LOW
+
+    def queries(self):
+        query = self.settings["debt_query"]
+        return [(query, None)] if query else []
+
     def run(self, now=None):
 
         query = self.settings["debt_query"]
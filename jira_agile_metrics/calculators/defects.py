@@ -5,6 +5,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 
 from ..calculator import Calculator
+from ..scheduler import PRIORITY_LOW
 from ..utils import (
     breakdown_by_month,
     Chart,
@@ -39,6 +40,12 @@ class DefectsCalculator(Calculator):
       `defects_by_environment_chart_title`.
     """
 
+    priority = PRIORITY_LOW
+
+    def queries(self):
+        query = self.settings["defects_query"]
+        return [(query, None)] if query else []
+
     def run(self):
 
         query = self.settings["defects_query"]
@@ -1,5 +1,4 @@
 import logging
-import pandas as pd
 import matplotlib.pyplot as plt
 
 from ..calculator import Calculator
@@ -49,34 +48,17 @@ class ImpedimentsCalculator(Calculator):
         done_column = self.settings["done_column"]
 
         cycle_data = self.get_result(CycleTimeCalculator)
-        cycle_data = cycle_data[cycle_data.blocked_days > 0][
-            ["key", "impediments"]
-        ]
-
-        data = []
-
-        for row in cycle_data.itertuples():
-            for idx, event in enumerate(row.impediments):
-                # Ignore things that were impeded whilst in the backlog and/or
-                # done column (these are mostly nonsensical,
-                # and don't really indicate blocked/wasted time)
-                if event["status"] in (backlog_column, done_column):
-                    continue
-                data.append(
-                    {
-                        "key": row.key,
-                        "status": event["status"],
-                        "flag": event["flag"],
-                        "start": pd.Timestamp(event["start"]),
-                        "end": pd.Timestamp(event["end"])
-                        if event["end"]
-                        else pd.NaT,
-                    }
-                )
+        impediments = self.get_result(CycleTimeCalculator, name="impediments")
 
-        return pd.DataFrame(
-            data, columns=["key", "status", "flag", "start", "end"]
-        )
+        blocked_keys = cycle_data.loc[cycle_data.blocked_days > 0, "key"]
+
+        # Ignore things that were impeded whilst in the backlog and/or
+        # done column (these are mostly nonsensical,
+        # and don't really indicate blocked/wasted time)
+        return impediments[
+            impediments["key"].isin(blocked_keys)
+            & ~impediments["status"].isin([backlog_column, done_column])
+        ].reset_index(drop=True)
 
     def write(self):
         data = self.get_result()
@@ -2,7 +2,7 @@ import pytest
 from datetime import date
 from pandas import DataFrame, NaT, Timestamp
 
-from .cycletime import CycleTimeCalculator
+from .cycletime import CycleTimeCalculator, impediments_table
 from .impediments import ImpedimentsCalculator
 
 from ..utils import extend_dict
@@ -49,83 +49,89 @@ def columns(minimal_cycle_time_columns):
 def cycle_time_results(minimal_cycle_time_columns):
     """A results dict mimicing a minimal result from the
     CycleTimeCalculator."""
+    cycle_data = DataFrame(
+        _issues(
+            [
+                dict(
+                    Backlog=_ts("2018-01-01"),
+                    Committed=NaT,
+                    Build=NaT,
+                    Test=NaT,
+                    Done=NaT,
+                    blocked_days=0,
+                    impediments=[],
+                ),
+                dict(
+                    Backlog=_ts("2018-01-02"),
+                    Committed=_ts("2018-01-03"),
+                    Build=NaT,
+                    Test=NaT,
+                    Done=NaT,
+                    blocked_days=4,
+                    impediments=[
+                        {
+                            "start": date(2018, 1, 5),
+                            "end": date(2018, 1, 7),
+                            "status": "Backlog",
+                            "flag": "Impediment",
+                        },  # ignored because it was blocked in backlog
+                        {
+                            "start": date(2018, 1, 10),
+                            "end": date(2018, 1, 12),
+                            "status": "Committed",
+                            "flag": "Impediment",
+                        },  # included
+                    ],
+                ),
+                dict(
+                    Backlog=_ts("2018-01-03"),
+                    Committed=_ts("2018-01-03"),
+                    Build=_ts("2018-01-04"),
+                    Test=_ts("2018-01-05"),
+                    Done=_ts("2018-01-06"),
+                    blocked_days=4,
+                    impediments=[
+                        {
+                            "start": date(2018, 1, 4),
+                            "end": date(2018, 1, 5),
+                            "status": "Build",
+                            "flag": "Impediment",
+                        },  # included
+                        {
+                            "start": date(2018, 1, 7),
+                            "end": date(2018, 1, 10),
+                            "status": "Done",
+                            "flag": "Impediment",
+                        },  # ignored because it was blocked in done
+                    ],
+                ),
+                dict(
+                    Backlog=_ts("2018-01-04"),
+                    Committed=_ts("2018-01-04"),
+                    Build=NaT,
+                    Test=NaT,
+                    Done=NaT,
+                    blocked_days=100,
+                    impediments=[
+                        {
+                            "start": date(2018, 1, 5),
+                            "end": None,
+                            "status": "Committed",
+                            "flag": "Awaiting input",
+                        },  # open ended, still included
+                    ],
+                ),
+            ]
+        ),
+        columns=minimal_cycle_time_columns,
+    )
     return {
-        CycleTimeCalculator: DataFrame(
-            _issues(
-                [
-                    dict(
-                        Backlog=_ts("2018-01-01"),
-                        Committed=NaT,
-                        Build=NaT,
-                        Test=NaT,
-                        Done=NaT,
-                        blocked_days=0,
-                        impediments=[],
-                    ),
-                    dict(
-                        Backlog=_ts("2018-01-02"),
-                        Committed=_ts("2018-01-03"),
-                        Build=NaT,
-                        Test=NaT,
-                        Done=NaT,
-                        blocked_days=4,
-                        impediments=[
-                            {
-                                "start": date(2018, 1, 5),
-                                "end": date(2018, 1, 7),
-                                "status": "Backlog",
-                                "flag": "Impediment",
-                            },  # ignored because it was blocked in backlog
-                            {
-                                "start": date(2018, 1, 10),
-                                "end": date(2018, 1, 12),
-                                "status": "Committed",
-                                "flag": "Impediment",
-                            },  # included
-                        ],
-                    ),
-                    dict(
-                        Backlog=_ts("2018-01-03"),
-                        Committed=_ts("2018-01-03"),
-                        Build=_ts("2018-01-04"),
-                        Test=_ts("2018-01-05"),
-                        Done=_ts("2018-01-06"),
-                        blocked_days=4,
-                        impediments=[
-                            {
-                                "start": date(2018, 1, 4),
-                                "end": date(2018, 1, 5),
-                                "status": "Build",
-                                "flag": "Impediment",
-                            },  # included
-                            {
-                                "start": date(2018, 1, 7),
-                                "end": date(2018, 1, 10),
-                                "status": "Done",
-                                "flag": "Impediment",
-                            },  # ignored because it was blocked in done
-                        ],
-                    ),
-                    dict(
-                        Backlog=_ts("2018-01-04"),
-                        Committed=_ts("2018-01-04"),
-                        Build=NaT,
-                        Test=NaT,
-                        Done=NaT,
-                        blocked_days=100,
-                        impediments=[
-                            {
-                                "start": date(2018, 1, 5),
-                                "end": None,
-                                "status": "Committed",
-                                "flag": "Awaiting input",
-                            },  # open ended, still included
-                        ],
-                    ),
-                ]
-            ),
-            columns=minimal_cycle_time_columns,
-        )
+        CycleTimeCalculator: cycle_data,
+        (CycleTimeCalculator, "impediments"): impediments_table(
+            (row.key, impediment)
+            for row in cycle_data.itertuples()
+            for impediment in row.impediments
+        ),
     }
 
 
@@ -234,7 +240,11 @@ def test_only_runs_if_charts_set(query_manager, settings, cycle_time_results):
 
 
 def test_empty(query_manager, settings, columns):
-    results = {CycleTimeCalculator: DataFrame([], columns=columns)}
+    cycle_data = DataFrame([], columns=columns)
+    results = {
+        CycleTimeCalculator: cycle_data,
+        (CycleTimeCalculator, "impediments"): impediments_table([]),
+    }
 
     calculator = ImpedimentsCalculator(query_manager, settings, results)
 
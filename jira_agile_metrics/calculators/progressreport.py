@@ -1,4 +1,5 @@
 import io
+import re
 import logging
 import random
 import math
@@ -17,7 +18,7 @@ import matplotlib.transforms
 import jinja2
 
 from ..calculator import Calculator
-from ..utils import to_days_since_epoch
+from ..utils import chunks, to_days_since_epoch
 
 from .cycletime import calculate_cycle_times
 from .throughput import calculate_throughput
@@ -27,6 +28,24 @@ from .scatterplot import calculate_scatterplot_data
 
 logger = logging.getLogger(__name__)
 
+# A story query template that selects stories by a single field compared
+# to the epic key, e.g. `"Epic Link" = {epic}`, can be run for many epics at
+# once with `"Epic Link" IN (...)`.
+BULK_STORY_QUERY_PATTERN = re.compile(
+    r'("[^"]+"|[A-Za-z_][\w.]*)\s*=\s*\{epic\}'
+)
+
+# The `{epic}` placeholder, with or without a format spec
+EPIC_PLACEHOLDER_PATTERN = re.compile(r"\{epic[^}]*\}")
+
+# Parts of JQL that change how a term combines with the rest of the query
+JQL_STRING_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'')
+JQL_OR_PATTERN = re.compile(r"\bor\b|\|\|", re.IGNORECASE)
+JQL_NOT_PATTERN = re.compile(r"(\bnot|!)\s*$", re.IGNORECASE)
+
+# Maximum number of epics to fetch stories for in one query
+EPIC_BATCH_SIZE = 50
+
 jinja_env = jinja2.Environment(
     loader=jinja2.PackageLoader("jira_agile_metrics", "calculators"),
     autoescape=jinja2.select_autoescape(["html", "xml"]),
@@ -36,6 +55,54 @@ jinja_env = jinja2.Environment(
 class ProgressReportCalculator(Calculator):
     """Output a progress report based on Monte Carlo forecast to completion"""
 
+    def queries(self):
+        if self.settings["progress_report"] is None:
+            return []
+
+        queries = []
+
+        outcome_query = self.settings["progress_report_outcome_query"]
+        if outcome_query:
+            queries.append(outcome_query)
+
+        epic_query_template = self.settings[
+            "progress_report_epic_query_template"
+        ]
+        for outcome in self.settings["progress_report_outcomes"] or []:
+            if outcome["epic_query"]:
+                queries.append(outcome["epic_query"])
+            elif epic_query_template:
+                queries.append(
+                    epic_query_template.format(
+                        outcome='"%s"'
+                        % (
+                            outcome["key"]
+                            if outcome["key"]
+                            else outcome["name"]
+                        )
+                    )
+                )
+
+        for team in self.settings["progress_report_teams"] or []:
+            if team["throughput_samples"] and team["name"]:
+                queries.append(
+                    team["throughput_samples"].format(
+                        team='"%s"' % team["name"]
+                    )
+                )
+
+        return [(query, "changelog") for query in queries]
+
+    def fields(self):
+        if self.settings["progress_report"] is None:
+            return []
+
+        # The field stories are split up by when fetched in bulk
+        bulk_query = parse_bulk_story_query(
+            self.settings["progress_report_story_query_template"]
+        )
+        return [bulk_query[0]] if bulk_query is not None else []
+
     def run(self, now=None, trials=1000):
 
         if self.settings["progress_report"] is None:
@@ -277,6 +344,10 @@ class ProgressReportCalculator(Calculator):
         #  - Run `story_query_template` to find stories, count by backlog,
         #        in progress, done
 
+        self.query_manager.prefetch(
+            [(outcome.epic_query, "changelog") for outcome in outcomes]
+        )
+
         for outcome in outcomes:
             for epic in find_epics(
                 query_manager=self.query_manager,
@@ -321,13 +392,27 @@ class ProgressReportCalculator(Calculator):
                     outcome='"%s"' % outcome.key,
                 )
 
-                update_story_counts(
-                    epic=epic,
-                    query_manager=self.query_manager,
-                    cycle=cycle,
-                    backlog_column=backlog_column,
-                    done_column=done_column,
-                )
+        epics = [epic for outcome in outcomes for epic in outcome.epics]
+
+        find_stories_in_bulk(
+            query_manager=self.query_manager,
+            story_query_template=story_query_template,
+            epics=epics,
+        )
+
+        # Any story queries not already answered in bulk
+        self.query_manager.prefetch(
+            [(epic.story_query, "changelog") for epic in epics]
+        )
+
+        for epic in epics:
+            update_story_counts(
+                epic=epic,
+                query_manager=self.query_manager,
+                cycle=cycle,
+                backlog_column=backlog_column,
+                done_column=done_column,
+            )
 
         # Run Monte Carlo simulation to complete
         teams.sort(key=lambda t: t.name)
@@ -380,7 +465,7 @@ class ProgressReportCalculator(Calculator):
         with open(output_file, "w") as of:
             of.write(
                 template.render(
-                    jira_url=self.query_manager.jira.client_info(),
+                    jira_url=self.query_manager.server_url,
                     title=self.settings["progress_report_title"],
                     story_query_template=self.settings[
                         "progress_report_story_query_template"
@@ -701,6 +786,161 @@ def find_epics(
         )
 
 
+def parse_bulk_story_query(story_query_template):
+    """If the story query template selects stories by comparing a single
+    field to the epic key, e.g. `"Epic Link" = {epic}`, return a tuple of
+    the name of the field, the JQL before the comparison, the field as
+    written in the template and the JQL after the comparison. Otherwise,
+    return `None`.
+    """
+
+    if not story_query_template:
+        return None
+
+    matches = list(BULK_STORY_QUERY_PATTERN.finditer(story_query_template))
+    if (
+        len(matches) != 1
+        or len(EPIC_PLACEHOLDER_PATTERN.findall(story_query_template)) != 1
+    ):
+        return None
+
+    match = matches[0]
+    start, end = match.span()
+
+    # The rest of the template must not use any placeholders, and the
+    # comparison must be ANDed with it, so that splitting the stories by
+    # epic gives the same stories as running the template for each epic
+    try:
+        before = story_query_template[:start].format()
+        after = story_query_template[end:].format()
+    except (KeyError, IndexError, ValueError):
+        return None
+
+    if not is_top_level_and_term(
+        story_query_template[:start], story_query_template[end:]
+    ):
+        return None
+
+    return match.group(1).strip('"'), before, match.group(1), after
+
+
+def find_stories_in_bulk(query_manager, story_query_template, epics):
+    """If the story query template selects stories by comparing a single
+    field to the epic key (see `parse_bulk_story_query()`), fetch the
+    stories for up to `EPIC_BATCH_SIZE` epics at a time using `IN (...)`,
+    and split them up by the value of that field. The stories for each epic
+    are then recorded as the result of its story query, so that
+    `update_story_counts()` doesn't need to run one query per epic.
+
+    The field must be fetched with the stories, which it is if it was
+    requested before any issues were fetched (see
+    `ProgressReportCalculator.fields()`).
+    """
+
+    bulk_query = parse_bulk_story_query(story_query_template)
+    if bulk_query is None or query_manager.settings["max_results"]:
+        return
+
+    field_name, before, field, after = bulk_query
+
+    if field_name in query_manager.jira_fields_to_names:
+        field_id = field_name
+    elif field_name.casefold() in query_manager.field_names_to_ids:
+        field_id = query_manager.field_name_to_id(field_name)
+    else:
+        return
+
+    if (
+        query_manager.fields is not None
+        and field_id not in query_manager.fields
+    ):
+        logger.debug(
+            "Not fetching stories in bulk, as field %s is not fetched",
+            field_name,
+        )
+        return
+
+    batches = [
+        (
+            batch,
+            "%s%s IN (%s)%s"
+            % (
+                before,
+                field,
+                ", ".join('"%s"' % epic.key for epic in batch),
+                after,
+            ),
+        )
+        for batch in chunks(epics, EPIC_BATCH_SIZE)
+    ]
+    query_manager.prefetch([(query, "changelog") for _, query in batches])
+
+    for batch, query in batches:
+        stories = {epic.key: [] for epic in batch}
+
+        for issue in query_manager.find_issues(query):
+            epic_key = epic_key_value(query_manager, issue, field_id)
+            if epic_key in stories:
+                stories[epic_key].append(issue)
+
+        for epic in batch:
+            query_manager.add_query_results(
+                epic.story_query, stories[epic.key]
+            )
+
+
+def is_top_level_and_term(before, after):
+    """Return whether a term of a JQL query, with the text `before` and
+    `after` it, is combined with the rest of the query by `AND` only, i.e.
+    it is outside any parentheses, and the query has no top level `OR` and
+    doesn't negate the term.
+    """
+
+    before, depth = top_level_jql(before, 0)
+    if depth != 0:
+        return False
+
+    after, _ = top_level_jql(after, 0)
+
+    return not (
+        JQL_OR_PATTERN.search(before)
+        or JQL_OR_PATTERN.search(after)
+        or JQL_NOT_PATTERN.search(before)
+    )
+
+
+def top_level_jql(jql, depth):
+    """Return the parts of `jql` outside quoted strings and parentheses,
+    given the depth of parentheses it starts at, and the depth it ends at.
+    """
+
+    jql = JQL_STRING_PATTERN.sub('""', jql)
+    text = []
+
+    for char in jql:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0:
+            text.append(char)
+
+    return "".join(text), depth
+
+
+def epic_key_value(query_manager, issue, field_id):
+    """Return the key of the epic an issue belongs to, given the id of the
+    field that links them. Handles both plain key values (e.g. `Epic Link`)
+    and issue references (e.g. `parent`).
+    """
+    value = getattr(getattr(issue.fields, field_id, None), "key", None)
+    return (
+        value
+        if value is not None
+        else query_manager.resolve_field_value(issue, field_id)
+    )
+
+
 def update_story_counts(
     epic, query_manager, cycle, backlog_column, done_column
 ):
@@ -19,6 +19,8 @@ from .progressreport import (
     calculate_epic_target,
     find_outcomes,
     find_epics,
+    find_stories_in_bulk,
+    is_top_level_and_term,
     update_story_counts,
     forecast_to_complete,
     Outcome,
@@ -981,6 +983,117 @@ def test_update_story_counts(query_manager, settings):
     assert isinstance(e3.story_cycle_times, pd.DataFrame)
 
 
+def test_find_stories_in_bulk(query_manager, settings, monkeypatch):
+    def make_epic(key):
+        return Epic(
+            key=key,
+            summary="Epic",
+            status="in-progress",
+            resolution=None,
+            resolution_date=None,
+            min_stories=None,
+            max_stories=None,
+            team_name=None,
+            deadline=None,
+            story_query='issuetype=story AND Epic="%s"' % key,
+        )
+
+    epics = [make_epic("E-1"), make_epic("E-2"), make_epic("E-3")]
+
+    queries = []
+    search_issues = query_manager.jira.search_issues
+
+    def recording_search_issues(jql, *args, **kwargs):
+        queries.append(jql)
+        return search_issues(jql, *args, **kwargs)
+
+    monkeypatch.setattr(
+        query_manager.jira, "search_issues", recording_search_issues
+    )
+
+    # The field stories are split up by must be fetched with them
+    find_stories_in_bulk(
+        query_manager, "issuetype=story AND Epic={epic}", epics
+    )
+    assert queries == []
+
+    query_manager.request_fields(["Epic"])
+    find_stories_in_bulk(
+        query_manager, "issuetype=story AND Epic={epic}", epics
+    )
+    assert queries == ['issuetype=story AND Epic IN ("E-1", "E-2", "E-3")']
+
+    for epic in epics:
+        update_story_counts(
+            epic=epic,
+            query_manager=query_manager,
+            cycle=settings["cycle"],
+            backlog_column=settings["backlog_column"],
+            done_column=settings["done_column"],
+        )
+
+    assert len(queries) == 1
+    assert [epic.stories_raised for epic in epics] == [4, 1, 0]
+    assert epics[0].stories_done == 1
+
+    # Templates using other placeholders are run one epic at a time
+    queries.clear()
+    find_stories_in_bulk(
+        query_manager, "issuetype=story AND Epic={epic} AND team={team}", epics
+    )
+    assert queries == []
+
+    # As are templates that compare more than one field to the epic, or
+    # where other stories could match
+    for template in [
+        '"Epic Link" = {epic} OR parent = {epic}',
+        "issuetype=story OR Epic={epic}",
+        "(issuetype=story OR Epic={epic}) AND status=Done",
+        "issuetype=story AND NOT Epic={epic}",
+        "Unknown={epic}",
+    ]:
+        find_stories_in_bulk(query_manager, template, epics)
+    assert queries == []
+
+
+def test_fields(query_manager, settings):
+    calculator = ProgressReportCalculator(query_manager, settings, {})
+    assert calculator.fields() == ["Epic"]
+
+    for template in [
+        "issuetype=story AND Epic={epic} AND team={team}",
+        "issuetype=story OR Epic={epic}",
+    ]:
+        calculator = ProgressReportCalculator(
+            query_manager,
+            extend_dict(
+                settings, {"progress_report_story_query_template": template}
+            ),
+            {},
+        )
+        assert calculator.fields() == []
+
+    calculator = ProgressReportCalculator(
+        query_manager, extend_dict(settings, {"progress_report": None}), {}
+    )
+    assert calculator.fields() == []
+
+
+def test_is_top_level_and_term():
+    assert is_top_level_and_term("issuetype=story AND ", "")
+    assert is_top_level_and_term("", " AND status=Done ORDER BY rank")
+    assert is_top_level_and_term(
+        "(issuetype=story OR issuetype=bug) AND ",
+        ' AND summary ~ "this or that"',
+    )
+
+    assert not is_top_level_and_term("issuetype=story OR ", "")
+    assert not is_top_level_and_term("", " || status=Done")
+    assert not is_top_level_and_term("(issuetype=story OR ", ")")
+    assert not is_top_level_and_term("issuetype=story AND NOT ", "")
+    assert not is_top_level_and_term("!", "")
+
+
 def test_calculate_team_throughput(query_manager, settings):
 
     t = Team(
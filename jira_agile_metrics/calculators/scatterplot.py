@@ -6,7 +6,7 @@ import matplotlib.dates as mdates
 from ..calculator import Calculator
 from ..utils import Chart, get_extension
 
-from .cycletime import CycleTimeCalculator
+from .cycletime import CycleTimeCalculator, expand_cycle_data
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +27,10 @@ class ScatterplotCalculator(Calculator):
         data = self.get_result()
 
         if self.settings["scatterplot_data"]:
-            self.write_file(data, self.settings["scatterplot_data"])
+            self.write_file(
+                expand_cycle_data(data, self.query_manager.server_url),
+                self.settings["scatterplot_data"],
+            )
         else:
             logger.debug("No output file specified for scatterplot data")
 
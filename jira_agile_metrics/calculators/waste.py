@@ -4,7 +4,9 @@ import pandas as pd
 from matplotlib import pyplot as plt
 
 from ..calculator import Calculator
+from ..scheduler import PRIORITY_LOW
 from ..utils import Chart, filter_by_window
+from ..workflow import compile_workflow
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +20,12 @@ class WasteCalculator(Calculator):
     `waste_chart_window` months (if given).
     """
 
+    priority = PRIORITY_LOW
+
+    def queries(self):
+        query = self.settings["waste_query"]
+        return [(query, "changelog")] if query else []
+
     def run(self):
 
         query = self.settings["waste_query"]
@@ -30,14 +38,10 @@ class WasteCalculator(Calculator):
         backlog_column = self.settings["backlog_column"]
         done_column = self.settings["done_column"]
 
-        cycle_lookup = {}
-        for idx, cycle_step in enumerate(self.settings["cycle"]):
-            for status in cycle_step["statuses"]:
-                cycle_lookup[status.lower()] = dict(
-                    index=idx,
-                    name=cycle_step["name"],
-                    type=cycle_step["type"],
-                )
+        workflow = compile_workflow(self.settings["cycle"])
+        status_ids = workflow.status_id_indexes(
+            self.query_manager.status_names()
+        )
 
         columns = ["key", "last_status", "resolution", "withdrawn_date"]
         series = {
@@ -52,15 +56,19 @@ class WasteCalculator(Calculator):
             if not issue.fields.resolution:
                 continue
 
-            last_status = None
+            last_status = last_status_id = None
             status_changes = list(
                 self.query_manager.iter_changes(issue, ["status"])
             )
             if len(status_changes) > 0:
                 last_status = status_changes[-1].from_string
+                last_status_id = status_changes[-1].from_id
 
-            if last_status is not None and last_status.lower() in cycle_lookup:
-                last_status = cycle_lookup.get(last_status.lower())["name"]
+            last_step = workflow.step_name(
+                last_status, last_status_id, status_ids
+            )
+            if last_step is not None:
+                last_status = last_step
             else:
                 logger.warning(
                     "Issue %s transitioned from unknown JIRA status %s",
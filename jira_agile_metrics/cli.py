@@ -8,7 +8,10 @@ from jira import JIRA
 from .config import config_to_options, CALCULATORS
 from .webapp.app import app as webapp
 from .querymanager import QueryManager
+from .issuecache import metadata_cache
 from .calculator import run_calculators
+from .connection import configure_session
+from .recording import RecordingJIRA, ReplayJIRA
 from .utils import Chart
 
 logger = logging.getLogger(__name__)
@@ -44,6 +47,67 @@ def configure_argument_parser():
         help="Only fetch N most recently updated issues",
     )
 
+    parser.add_argument(
+        "--cache-directory",
+        metavar="cache",
+        help=(
+            "Store issues fetched from JIRA in this directory, and only fetch "
+            "issues that have changed on subsequent runs."
+        ),
+    )
+
+    parser.add_argument(
+        "--fetch-concurrency",
+        metavar="N",
+        type=int,
+        help="Fetch up to N pages of search results from JIRA at a time",
+    )
+    parser.add_argument(
+        "--query-concurrency",
+        metavar="N",
+        type=int,
+        help="Run up to N queries against JIRA at a time",
+    )
+    parser.add_argument(
+        "--request-rate",
+        metavar="N",
+        type=float,
+        help="Make at most N requests to JIRA per second",
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="N",
+        type=int,
+        help="Calculate cycle time data in N processes at a time",
+    )
+    parser.add_argument(
+        "--refresh-metadata",
+        action="store_true",
+        default=None,
+        help=(
+            "Fetch the list of fields and server information from JIRA even "
+            "if they are in the cache directory"
+        ),
+    )
+
+    parser.add_argument(
+        "--record",
+        metavar="archive.jam",
+        help=(
+            "Record everything fetched from JIRA in the given archive file, "
+            "so that it can be used with --replay later."
+        ),
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="archive.jam",
+        help=(
+            "Use the JIRA data recorded in the given archive file instead of "
+            "connecting to JIRA. The configuration must be the same as when "
+            "the archive was recorded, apart from output options."
+        ),
+    )
+
     parser.add_argument(
         "--server",
         metavar="127.0.0.1:8080",
@@ -138,6 +202,10 @@ def run_command_line(parser, args):
             config.read(), cwd=os.path.dirname(os.path.abspath(args.config))
         )
 
+    # The cache directory is relative to the original working directory
+    if args.cache_directory:
+        args.cache_directory = os.path.abspath(args.cache_directory)
+
     # Allow command line arguments to override options
     override_options(options["connection"], args)
     override_options(options["settings"], args)
@@ -145,17 +213,46 @@ def run_command_line(parser, args):
     # Set charting context, which determines how charts are rendered
     Chart.set_style(palette=options["settings"]["chart_palette"])
 
+    # Archive paths are relative to the original working directory
+    record = os.path.abspath(args.record) if args.record else None
+    replay = os.path.abspath(args.replay) if args.replay else None
+
+    # Recording and replaying need every request to be made, so that the
+    # archive has all the data a run needs without any cache
+    if (record or replay) and options["settings"]["cache_directory"]:
+        logger.warning(
+            "Not using the cache directory %s when recording or replaying",
+            options["settings"]["cache_directory"],
+        )
+        options["settings"]["cache_directory"] = None
+
     # Set output directory if required
     if args.output_directory:
         logger.info("Changing working directory to %s" % args.output_directory)
         os.chdir(args.output_directory)
 
-    # Query JIRA and run calculators
-    jira = get_jira_client(options["connection"])
+    # Query JIRA (or replay an archive) and run calculators
+    if replay:
+        jira = ReplayJIRA.load(replay)
+    else:
+        jira = get_jira_client(
+            options["connection"],
+            metadata_cache(
+                options["settings"], options["connection"]["domain"]
+            ),
+        )
 
-    logger.info("Running calculators")
-    query_manager = QueryManager(jira, options["settings"])
-    run_calculators(CALCULATORS, query_manager, options["settings"])
+    if record:
+        jira = RecordingJIRA(jira)
+
+    try:
+        logger.info("Running calculators")
+        query_manager = QueryManager(jira, options["settings"])
+        run_calculators(CALCULATORS, query_manager, options["settings"])
+        query_manager.log_statistics()
+    finally:
+        if record:
+            jira.save(record)
 
 
 def override_options(options, arguments):
@@ -167,7 +264,7 @@ def override_options(options, arguments):
             options[key] = getattr(arguments, key)
 
 
-def get_jira_client(connection):
+def get_jira_client(connection, metadata=None):
     url = connection["domain"]
     username = connection["username"]
     password = connection["password"]
@@ -197,9 +294,29 @@ def get_jira_client(connection):
 
     options.update(jira_client_options)
 
-    return JIRA(
+    # Use the server information from the metadata cache, if we have it
+    server_info = None
+    if jira_server_version_check and metadata is not None:
+        server_info = metadata.get("server_info")
+
+    jira = JIRA(
         options,
         basic_auth=(username, password),
         proxies=proxies,
-        get_server_info=jira_server_version_check,
+        get_server_info=jira_server_version_check and server_info is None,
     )
+
+    if server_info is not None:
+        jira._version = tuple(server_info["versionNumbers"])
+        jira.deploymentType = server_info["deploymentType"]
+    elif jira_server_version_check and metadata is not None:
+        metadata.set(
+            "server_info",
+            {
+                "versionNumbers": list(jira._version),
+                "deploymentType": jira.deploymentType,
+            },
+        )
+
+    configure_session(jira._session, connection)
+    return jira
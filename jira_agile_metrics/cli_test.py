@@ -1,6 +1,14 @@
 import json
 
-from .cli import override_options
+from . import cli
+from .cli import get_jira_client, override_options
+from .conftest import (
+    FauxJIRA,
+    FauxIssue as Issue,
+    FauxChange as Change,
+    FauxFieldValue as Value,
+)
+from .issuecache import MetadataCache
 
 
 def test_override_options():
@@ -21,3 +29,169 @@ def test_override_options():
     options = {"one": 1, "two": 2}
     override_options(options, FauxArgs({"three": 3}))
     assert json.dumps(options) == json.dumps({"one": 1, "two": 2})
+
+
+def test_get_jira_client_uses_cached_server_info(tmp_path, monkeypatch):
+    server_info_requests = []
+
+    class JIRA(object):
+        def __init__(self, options, get_server_info=True, **kwargs):
+            self._session = None
+            self._version = (9, 4, 0) if get_server_info else (0, 0, 0)
+            self.deploymentType = "Server" if get_server_info else None
+            server_info_requests.append(get_server_info)
+
+    monkeypatch.setattr(cli, "JIRA", JIRA)
+    monkeypatch.setattr(cli, "configure_session", lambda session, c: None)
+
+    connection = {
+        "domain": "https://jira.example.org",
+        "username": "user",
+        "password": "secret",
+        "http_proxy": None,
+        "https_proxy": None,
+        "jira_server_version_check": True,
+        "jira_client_options": {},
+    }
+    filename = str(tmp_path / "metadata.json")
+
+    jira = get_jira_client(connection, MetadataCache(filename))
+    assert jira._version == (9, 4, 0)
+
+    # The next client doesn't ask the server
+    jira = get_jira_client(connection, MetadataCache(filename))
+    assert (jira._version, jira.deploymentType) == ((9, 4, 0), "Server")
+
+    # Unless the cache is refreshed
+    jira = get_jira_client(connection, MetadataCache(filename, refresh=True))
+    assert jira.deploymentType == "Server"
+    assert server_info_requests == [True, False, True]
+
+
+def test_cache_directory_relative_to_working_directory(tmp_path, monkeypatch):
+    config = tmp_path / "config.yml"
+    config.write_text(
+        """\
+Connection:
+    Domain: https://foo.com
+
+Query: (filter=123)
+
+Workflow:
+    Backlog: Backlog
+    In progress: Build
+    Done: Done
+"""
+    )
+    output_directory = tmp_path / "output"
+    output_directory.mkdir()
+
+    settings = []
+
+    class QueryManager(object):
+        def __init__(self, jira, options):
+            settings.append(options)
+
+        def log_statistics(self):
+            pass
+
+    monkeypatch.setattr(cli, "get_jira_client", lambda c, m: None)
+    monkeypatch.setattr(cli, "QueryManager", QueryManager)
+    monkeypatch.setattr(cli, "run_calculators", lambda c, q, s: None)
+    monkeypatch.chdir(tmp_path)
+
+    parser = cli.configure_argument_parser()
+    args = parser.parse_args(
+        [
+            str(config),
+            "--cache-directory",
+            "cache",
+            "--output-directory",
+            str(output_directory),
+        ]
+    )
+    cli.run_command_line(parser, args)
+
+    assert settings[0]["cache_directory"] == str(tmp_path / "cache")
+
+
+def test_record_with_cache_and_replay_without(
+    minimal_fields, tmp_path, monkeypatch
+):
+    config = tmp_path / "config.yml"
+    config.write_text(
+        """\
+Connection:
+    Domain: https://example.org
+
+Query: (filter=1)
+
+Workflow:
+    Backlog: Backlog
+    In progress: Build
+    Done: Done
+
+Output:
+    Cache directory: cache
+    Cycle time data: cycletime.csv
+"""
+    )
+
+    jira = FauxJIRA(
+        fields=minimal_fields,
+        issues=[
+            Issue(
+                "A-%d" % i,
+                summary="Issue A-%d" % i,
+                issuetype=Value("Story", "story"),
+                status=Value("Done", "3"),
+                resolution=Value("Done", "Done"),
+                resolutiondate="2018-01-05 01:01:01",
+                created="2018-01-01 01:01:01",
+                updated="2018-01-05 01:01:01",
+                changes=[
+                    Change(
+                        "2018-01-02 01:01:01",
+                        [("status", "Backlog", "Build", "1", "2")],
+                    ),
+                    Change(
+                        "2018-01-05 01:01:01",
+                        [("status", "Build", "Done", "2", "3")],
+                    ),
+                ],
+            )
+            for i in range(1, 4)
+        ],
+    )
+
+    monkeypatch.setattr(cli, "get_jira_client", lambda c, m: jira)
+    monkeypatch.chdir(tmp_path)
+
+    def run(name, *options):
+        output_directory = tmp_path / name
+        output_directory.mkdir()
+
+        parser = cli.configure_argument_parser()
+        args = parser.parse_args(
+            [str(config), "--output-directory", str(output_directory)]
+            + list(options)
+        )
+        cli.run_command_line(parser, args)
+        monkeypatch.chdir(tmp_path)
+
+        return (output_directory / "cycletime.csv").read_text()
+
+    # Warm up the issue and metadata caches
+    run("first")
+    cached = run("second")
+
+    # Record with the caches in place, and replay without them, e.g. on
+    # another machine
+    recorded = run("recorded", "--record", "archive.jam")
+    assert "A-3" in recorded
+    assert recorded == cached
+
+    monkeypatch.setattr(cli, "get_jira_client", None)
+    config.write_text(config.read_text().replace("Cache directory", "#"))
+
+    assert run("replayed", "--replay", "archive.jam") == recorded
@@ -196,6 +196,10 @@ def config_to_options(data, cwd=None, extended=False):
             "https_proxy": None,
             "jira_server_version_check": True,
             "jira_client_options": {},
+            "pool_size": None,
+            "keep_alive": True,
+            "compression": True,
+            "http_adapter": None,
         },
         "settings": {
             "queries": [],
@@ -204,6 +208,22 @@ def config_to_options(data, cwd=None, extended=False):
             "known_values": {},
             "cycle": [],
             "max_results": None,
+            "cache_directory": None,
+            "fetch_concurrency": None,
+            "fetch_page_size": 100,
+            "field_projection": True,
+            "query_concurrency": None,
+            "stream_issues": False,
+            "window_pushdown": False,
+            "lean_issues": False,
+            "metadata_ttl": 24,
+            "refresh_metadata": False,
+            "workers": None,
+            "unique_issues": False,
+            "compact_cycle_data": False,
+            "vectorized_cycle_times": False,
+            "request_rate": None,
+            "max_concurrent_requests": None,
             "verbose": False,
             "quantiles": [0.5, 0.85, 0.95],
             "backlog_column": None,
@@ -388,6 +408,33 @@ def config_to_options(data, cwd=None, extended=False):
                 "connection"
             ]["jira server version check"]
 
+        if "pool size" in config["connection"]:
+            options["connection"]["pool_size"] = force_int(
+                "pool_size", config["connection"]["pool size"]
+            )
+
+        if "keep alive" in config["connection"]:
+            options["connection"]["keep_alive"] = bool(
+                config["connection"]["keep alive"]
+            )
+
+        if "compression" in config["connection"]:
+            options["connection"]["compression"] = bool(
+                config["connection"]["compression"]
+            )
+
+        # Not supported in server mode, where we don't want an uploaded file
+        # to be able to load arbitrary code
+        if "http adapter" in config["connection"]:
+            if cwd is None:
+                logger.warning(
+                    "`HTTP adapter` is not supported here and will be ignored."
+                )
+            else:
+                options["connection"]["http_adapter"] = config["connection"][
+                    "http adapter"
+                ]
+
     # Parse and validate output options
     if "output" in config:
         if "quantiles" in config["output"]:
@@ -403,6 +450,11 @@ def config_to_options(data, cwd=None, extended=False):
 
         # int values
         for key in [
+            "fetch_concurrency",
+            "fetch_page_size",
+            "query_concurrency",
+            "max_concurrent_requests",
+            "workers",
             "scatterplot_window",
             "histogram_window",
             "wip_window",
@@ -426,6 +478,8 @@ def config_to_options(data, cwd=None, extended=False):
 
         # float values
         for key in [
+            "request_rate",
+            "metadata_ttl",
             "burnup_forecast_chart_deadline_confidence",
             "defects_priority_threshold",
             "defects_type_threshold",
@@ -574,6 +628,47 @@ def config_to_options(data, cwd=None, extended=False):
             if expand_key(key) in config["output"]:
                 options["settings"][key] = config["output"][expand_key(key)]
 
+        # boolean values
+        for key in [
+            "field_projection",
+            "stream_issues",
+            "window_pushdown",
+            "lean_issues",
+            "refresh_metadata",
+            "compact_cycle_data",
+            "vectorized_cycle_times",
+            "unique_issues",
+        ]:
+            if expand_key(key) in config["output"]:
+                options["settings"][key] = bool(
+                    config["output"][expand_key(key)]
+                )
+
+        # Directories, which are resolved relative to the configuration file.
+        # Not supported in server mode, where we don't want an uploaded file
+        # to be able to write to arbitrary paths.
+        for key in [
+            "cache_directory",
+        ]:
+            if expand_key(key) in config["output"]:
+                if cwd is None:
+                    logger.warning(
+                        "`%s` is not supported here and will be ignored.",
+                        expand_key(key).capitalize(),
+                    )
+                    continue
+
+                options["settings"][key] = os.path.abspath(
+                    os.path.normpath(
+                        os.path.join(
+                            cwd,
+                            config["output"][expand_key(key)].replace(
+                                "/", os.path.sep
+                            ),
+                        )
+                    )
+                )
+
         # Special objects for progress reports
         if expand_key("progress_report_teams") in config["output"]:
             options["settings"][
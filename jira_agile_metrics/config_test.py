@@ -284,6 +284,10 @@ Output:
         "http_proxy": "https://proxy1.local",
         "https_proxy": "https://proxy2.local",
         "jira_server_version_check": True,
+        "pool_size": None,
+        "keep_alive": True,
+        "compression": True,
+        "http_adapter": None,
     }
 
     assert options["settings"] == {
@@ -301,6 +305,22 @@ Output:
         "attributes": {"Release": "Fix version/s", "Team": "Team"},
         "known_values": {"Release": ["R01", "R02", "R03"]},
         "max_results": None,
+        "cache_directory": None,
+        "fetch_concurrency": None,
+        "fetch_page_size": 100,
+        "field_projection": True,
+        "query_concurrency": None,
+        "stream_issues": False,
+        "window_pushdown": False,
+        "lean_issues": False,
+        "metadata_ttl": 24,
+        "refresh_metadata": False,
+        "workers": None,
+        "unique_issues": False,
+        "compact_cycle_data": False,
+        "vectorized_cycle_times": False,
+        "request_rate": None,
+        "max_concurrent_requests": None,
         "verbose": False,
         "queries": [
             {"jql": "(filter=123)", "value": "Team 1"},
@@ -688,3 +708,55 @@ Workflow:
 
     assert options["connection"]["domain"] == "https://foo.com"
     assert not options["connection"]["jira_server_version_check"]
+
+
+def test_config_to_options_cache_directory():
+
+    config = """\
+Connection:
+    Domain: https://foo.com
+
+Query: (filter=123)
+
+Workflow:
+    Backlog: Backlog
+    In progress: Build
+    Done: Done
+
+Output:
+    Cache directory: cache/jira
+"""
+
+    options = config_to_options(config, cwd="/tmp/metrics")
+    assert options["settings"]["cache_directory"] == os.path.join(
+        os.path.abspath("/tmp/metrics"), "cache", "jira"
+    )
+
+    # Not allowed in server mode
+    options = config_to_options(config, cwd=None)
+    assert options["settings"]["cache_directory"] is None
+
+
+def test_config_to_options_http_adapter():
+
+    config = """\
+Connection:
+    Domain: https://foo.com
+    HTTP adapter: package.module.AdapterClass
+
+Query: (filter=123)
+
+Workflow:
+    Backlog: Backlog
+    In progress: Build
+    Done: Done
+"""
+
+    options = config_to_options(config, cwd="/tmp/metrics")
+    assert (
+        options["connection"]["http_adapter"] == "package.module.AdapterClass"
+    )
+
+    # Not allowed in server mode
+    options = config_to_options(config, cwd=None)
+    assert options["connection"]["http_adapter"] is None
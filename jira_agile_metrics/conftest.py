@@ -28,10 +28,13 @@ class FauxFields(object):
 class FauxChangeItem(object):
     """An item in a changelog change"""
 
-    def __init__(self, field, fromString, toString):
+    def __init__(self, field, fromString, toString, from_=None, to=None):
         self.field = field
-        self.from_ = self.fromString = fromString
-        self.to = self.toString = toString
+        self.fromString = fromString
+        self.toString = toString
+        self.from_ = fromString if from_ is None else from_
+        self.to = toString if to is None else to
+        setattr(self, "from", self.from_)
 
 
 class FauxChange(object):
@@ -57,6 +60,44 @@ class FauxIssue(object):
         self.fields = FauxFields(fields)
         self.changelog = FauxChangelog(changes)
 
+    @property
+    def raw(self):
+        """The issue as JSON data, as it would be returned by the JIRA API"""
+        return {
+            "key": self.key,
+            "fields": {
+                name: _to_raw(value)
+                for name, value in self.fields.__dict__.items()
+            },
+            "changelog": {
+                "histories": [
+                    {
+                        "id": str(i),
+                        "created": change.created,
+                        "items": [
+                            {
+                                "field": item.field,
+                                "from": item.from_,
+                                "fromString": item.fromString,
+                                "to": item.to,
+                                "toString": item.toString,
+                            }
+                            for item in change.items
+                        ],
+                    }
+                    for i, change in enumerate(self.changelog.histories)
+                ]
+            },
+        }
+
+
+def _to_raw(value):
+    if isinstance(value, FauxFieldValue):
+        return {"name": value.name, "value": _to_raw(value.value)}
+    if isinstance(value, (list, tuple)):
+        return [_to_raw(v) for v in value]
+    return value
+
 
 class FauxJIRA(object):
     """JIRA interface. Initialised with a set of issues, which will be returned
@@ -67,6 +108,7 @@ class FauxJIRA(object):
         if options is None:
             options = {"server": "https://example.org"}
         self._options = options
+        self._session = None
         self._fields = fields  # [{ id, name }]
         self._issues = issues
         self._filter = filter_
@@ -81,12 +123,53 @@ class FauxJIRA(object):
     def issues(self):
         return self._issues
 
-    def search_issues(self, jql, *args, **kwargs):
-        return (
+    def search_issues(self, jql, startAt=0, maxResults=False, **kwargs):
+        issues = (
             self._issues
             if self._filter is None
             else [i for i in self._issues if self._filter(i, jql)]
         )
+        return FauxResultList(
+            issues[startAt:][: maxResults or None], total=len(issues)
+        )
+
+    def _get_json(self, path, params=None):
+        """Search or list statuses through the REST API, returning the JSON
+        response. The statuses are the current statuses of the issues that
+        have an id.
+        """
+        if path == "status":
+            statuses = {}
+            for issue in self._issues:
+                status = getattr(issue.fields, "status", None)
+                if getattr(status, "id", None) is not None:
+                    statuses[status.id] = {
+                        "id": status.id,
+                        "name": status.name,
+                    }
+            return list(statuses.values())
+
+        assert path == "search"
+
+        page = self.search_issues(
+            params["jql"],
+            startAt=params["startAt"],
+            maxResults=params["maxResults"],
+        )
+        return {
+            "startAt": params["startAt"],
+            "maxResults": params["maxResults"],
+            "total": page.total,
+            "issues": [issue.raw for issue in page],
+        }
+
+
+class FauxResultList(list):
+    """A page of search results, with the total number of results"""
+
+    def __init__(self, iterable, total):
+        super().__init__(iterable)
+        self.total = total
 
 
 # Fixtures
@@ -102,6 +185,10 @@ def minimal_settings():
         "known_values": {"Release": ["R1", "R3"]},
         "max_results": None,
         "verbose": False,
+        "workers": None,
+        "unique_issues": False,
+        "compact_cycle_data": False,
+        "vectorized_cycle_times": False,
         "cycle": [
             {"name": "Backlog", "statuses": ["Backlog"], "type": "backlog"},
             {"name": "Committed", "statuses": ["Next"], "type": "accepted"},
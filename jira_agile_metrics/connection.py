@@ -0,0 +1,110 @@
+import collections
+import hashlib
+import importlib
+import json
+import logging
+import threading
+
+from requests.adapters import HTTPAdapter
+
+from .config import ConfigError, force_int
+
+logger = logging.getLogger(__name__)
+
+# Number of connections to keep open to JIRA, unless configured. Should be
+# at least the number of requests we make at the same time.
+DEFAULT_POOL_SIZE = 16
+
+
+def configure_session(session, connection):
+    """Configure the `requests` session of a JIRA client according to the
+    connection options: the size of its connection pool, whether to keep
+    connections alive between requests, whether to ask for compressed
+    responses, and the transport adapter to use (e.g. for HTTP/2).
+    """
+
+    pool_size = (
+        force_int("pool_size", connection["pool_size"])
+        if connection["pool_size"]
+        else DEFAULT_POOL_SIZE
+    )
+    adapter_class = connection["http_adapter"]
+
+    if adapter_class:
+        adapter = load_adapter(adapter_class)()
+        logger.debug("Using HTTP adapter %s", adapter_class)
+    else:
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    session.headers["Connection"] = (
+        "keep-alive" if connection["keep_alive"] else "close"
+    )
+    session.headers["Accept-Encoding"] = (
+        "gzip, deflate" if connection["compression"] else "identity"
+    )
+
+    return session
+
+
+def load_adapter(name):
+    """Return the transport adapter class with the given dotted name, e.g.
+    `package.module.AdapterClass`.
+    """
+    module_name, _, class_name = name.rpartition(".")
+
+    try:
+        return getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError, ValueError):
+        raise ConfigError(
+            "Could not load HTTP adapter `%s`. Check that the package "
+            "providing it is installed." % name
+        ) from None
+
+
+class ClientPool(object):
+    """Keep JIRA clients for reuse, so that connections (and TLS sessions)
+    to the same server, with the same credentials and options, are reused
+    across runs. At most `size` clients are kept, dropping the least
+    recently used first.
+    """
+
+    def __init__(self, size=8):
+        self.size = size
+        self.clients = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, connection, create):
+        """Return a client for the given connection options, calling
+        `create(connection)` to make one if there isn't one already.
+        """
+        key = client_key(connection)
+
+        with self.lock:
+            client = self.clients.get(key)
+            if client is not None:
+                self.clients.move_to_end(key)
+                logger.debug("Reusing connection to %s", connection["domain"])
+                return client
+
+        client = create(connection)
+
+        with self.lock:
+            self.clients[key] = client
+            while len(self.clients) > self.size:
+                self.clients.popitem(last=False)
+
+        return client
+
+
+def client_key(connection):
+    """Return a string identifying the given connection options, without
+    including the password in the clear.
+    """
+    return hashlib.sha256(
+        json.dumps(connection, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
@@ -0,0 +1,104 @@
+import pytest
+import requests
+
+from .config import ConfigError
+from .connection import ClientPool, configure_session, load_adapter
+
+
+@pytest.fixture
+def connection():
+    return {
+        "domain": "https://example.org",
+        "username": "user",
+        "password": "secret",
+        "pool_size": None,
+        "keep_alive": True,
+        "compression": True,
+        "http_adapter": None,
+    }
+
+
+class FauxAdapter(requests.adapters.HTTPAdapter):
+    pass
+
+
+def test_configure_session(connection):
+    session = configure_session(requests.Session(), connection)
+
+    adapter = session.get_adapter("https://example.org")
+    assert adapter._pool_maxsize == 16
+    assert session.headers["Connection"] == "keep-alive"
+    assert session.headers["Accept-Encoding"] == "gzip, deflate"
+
+    connection.update(
+        {
+            "pool_size": 4,
+            "keep_alive": False,
+            "compression": False,
+        }
+    )
+    session = configure_session(requests.Session(), connection)
+
+    assert session.get_adapter("https://example.org")._pool_maxsize == 4
+    assert session.headers["Connection"] == "close"
+    assert session.headers["Accept-Encoding"] == "identity"
+
+    # E.g. from a form
+    connection["pool_size"] = "8"
+    session = configure_session(requests.Session(), connection)
+    assert session.get_adapter("https://example.org")._pool_maxsize == 8
+
+    connection["pool_size"] = "many"
+    with pytest.raises(ConfigError):
+        configure_session(requests.Session(), connection)
+
+
+def test_configure_session_adapter(connection):
+    connection[
+        "http_adapter"
+    ] = "jira_agile_metrics.connection_test.FauxAdapter"
+    session = configure_session(requests.Session(), connection)
+
+    assert isinstance(session.get_adapter("https://example.org"), FauxAdapter)
+    assert isinstance(session.get_adapter("http://example.org"), FauxAdapter)
+
+
+def test_load_adapter():
+    assert (
+        load_adapter("requests.adapters.HTTPAdapter")
+        is requests.adapters.HTTPAdapter
+    )
+
+    for name in ["unknown.Adapter", "requests.adapters.Unknown", "Adapter"]:
+        with pytest.raises(ConfigError):
+            load_adapter(name)
+
+
+def test_client_pool(connection):
+    created = []
+
+    def create(connection):
+        created.append(connection["domain"])
+        return object()
+
+    pool = ClientPool(size=2)
+
+    client = pool.get(connection, create)
+    assert pool.get(dict(connection), create) is client
+    assert created == ["https://example.org"]
+
+    # Different credentials or servers get different clients
+    other = pool.get(dict(connection, password="other"), create)
+    assert other is not client
+    assert len(created) == 2
+
+    pool.get(dict(connection, domain="https://example.com"), create)
+    assert len(created) == 3
+
+    # Least recently used client was dropped
+    assert len(pool.clients) == 2
+    assert pool.get(connection, create) is not client
+    assert len(created) == 4
+
+    # Passwords are not kept in the clear
+    assert not any("secret" in key for key in pool.clients)
@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import os.path
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+from urllib.parse import urlparse
+
+from .utils import chunks
+
+logger = logging.getLogger(__name__)
+
+
+def cache_filename(directory, server, suffix):
+    """Return the name of a file in the cache `directory` used to store data
+    of the given kind (`suffix`) for the JIRA instance at `server`. The
+    directory is created if it does not exist.
+    """
+    url = urlparse(server)
+    name = re.sub(r"[^A-Za-z0-9.-]+", "_", (url.netloc + url.path).strip("/"))
+
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, "%s.%s" % (name or "jira", suffix))
+
+
+def metadata_cache(settings, server):
+    """Return the metadata cache for the JIRA instance at `server` in the
+    `cache_directory` given in `settings`, or `None` if there isn't one.
+    """
+    if not settings.get("cache_directory"):
+        return None
+
+    ttl = settings.get("metadata_ttl")
+    return MetadataCache(
+        cache_filename(settings["cache_directory"], server, "metadata.json"),
+        ttl=ttl * 3600 if ttl is not None else None,
+        refresh=settings.get("refresh_metadata", False),
+    )
+
+
+class MetadataCache(object):
+    """Metadata about a JIRA instance, such as the list of fields and the
+    server version, kept in a JSON file between runs so that it need not be
+    fetched from JIRA every time.
+
+    Entries older than `ttl` seconds (if given) are ignored, as are all
+    entries saved before if `refresh` is true. Entries are saved as soon as
+    they are set, keeping any other entries in the file.
+    """
+
+    def __init__(self, filename, ttl=None, refresh=False, clock=time.time):
+        self.filename = filename
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = {}
+
+        if not refresh:
+            self.entries = self.load()
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            return {}
+
+        try:
+            with open(self.filename) as f:
+                return dict(json.load(f)["entries"])
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning(
+                "Ignoring unreadable metadata cache %s", self.filename
+            )
+            return {}
+
+    def get(self, name):
+        """Return the value saved for `name`, or `None` if there isn't one or
+        it has expired.
+        """
+        with self.lock:
+            entry = self.entries.get(name)
+
+        if entry is None:
+            return None
+
+        if self.ttl is not None and self.clock() - entry["saved"] > self.ttl:
+            logger.debug("Cached JIRA metadata `%s` has expired", name)
+            return None
+
+        return entry["value"]
+
+    def set(self, name, value):
+        with self.lock:
+            entry = self.entries[name] = {
+                "saved": self.clock(),
+                "value": value,
+            }
+
+            entries = self.load()
+            entries[name] = entry
+
+            temporary_filename = self.filename + ".tmp"
+            with open(temporary_filename, "w") as f:
+                json.dump({"entries": entries}, f)
+            os.replace(temporary_filename, self.filename)
+
+
+class IssueCache(object):
+    """A persistent, on-disk store of raw JIRA issues, keyed by issue key and
+    a `variant` string describing how they were fetched, e.g. the `expand`
+    parameter and list of fields (so that an issue fetched without its
+    changelog is never used where the changelog is required).
+
+    For each query, we also store a watermark: the latest `updated`
+    timestamp seen amongst the matching issues. This allows a subsequent run
+    to only fetch the issues that have changed since.
+
+    Calculated cycle time data for each issue is stored too, as JSON, keyed
+    by issue key and a hash of the configuration used to calculate it,
+    along with the `updated` timestamp of the issue it was calculated from.
+
+    The cache may be shared by threads fetching different queries at the
+    same time.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS issues (
+                key TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                raw BLOB NOT NULL,
+                PRIMARY KEY (key, variant)
+            );
+            CREATE TABLE IF NOT EXISTS queries (
+                jql TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                watermark TEXT,
+                PRIMARY KEY (jql, variant)
+            );
+            CREATE TABLE IF NOT EXISTS cycle_rows (
+                key TEXT NOT NULL,
+                config TEXT NOT NULL,
+                updated TEXT NOT NULL,
+                row BLOB NOT NULL,
+                PRIMARY KEY (key, config)
+            );
+            """
+        )
+
+    def close(self):
+        self.connection.close()
+
+    def get_watermark(self, jql, variant):
+        """Return the watermark saved for the given query, or `None` if the
+        query has not been run before.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT watermark FROM queries WHERE jql = ? AND variant = ?",
+                (jql, variant),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def save_watermark(self, jql, variant, watermark):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO queries (jql, variant, watermark) "
+                "VALUES (?, ?, ?)",
+                (jql, variant, watermark),
+            )
+
+    def get_issues(self, keys, variant):
+        """Return a dict of raw issue data for the given keys. Keys that are
+        not in the cache are omitted.
+        """
+        issues = {}
+
+        # Stay well within SQLite's limit on the number of query parameters
+        for chunk in chunks(list(keys), 500):
+            with self.lock:
+                rows = self.connection.execute(
+                    "SELECT key, raw FROM issues "
+                    "WHERE variant = ? AND key IN (%s)"
+                    % ", ".join("?" * len(chunk)),
+                    [variant] + chunk,
+                ).fetchall()
+
+            for key, raw in rows:
+                issues[key] = json.loads(zlib.decompress(raw))
+
+        return issues
+
+    def save_issues(self, raw_issues, variant):
+        """Store (or replace) the given raw issue data."""
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO issues (key, variant, raw) "
+                "VALUES (?, ?, ?)",
+                (
+                    (
+                        raw["key"],
+                        variant,
+                        zlib.compress(json.dumps(raw).encode("utf-8")),
+                    )
+                    for raw in raw_issues
+                ),
+            )
+
+    def get_cycle_rows(self, keys, config):
+        """Return a dict of `(updated, row)` tuples for the given keys, as
+        saved with `save_cycle_rows()`. Keys without a row are omitted.
+        """
+        rows = {}
+
+        for chunk in chunks(list(keys), 500):
+            with self.lock:
+                result = self.connection.execute(
+                    "SELECT key, updated, row FROM cycle_rows "
+                    "WHERE config = ? AND key IN (%s)"
+                    % ", ".join("?" * len(chunk)),
+                    [config] + chunk,
+                ).fetchall()
+
+            for key, updated, row in result:
+                try:
+                    rows[key] = (updated, json.loads(zlib.decompress(row)))
+                except (zlib.error, ValueError):
+                    logger.debug("Ignoring unreadable cycle time row %s", key)
+
+        return rows
+
+    def save_cycle_rows(self, rows, config):
+        """Store (or replace) cycle time data, given as a list of
+        `(key, updated, row)` tuples, where `row` can be stored as JSON.
+        Rows that can't be are not stored.
+        """
+        values = []
+        for key, updated, row in rows:
+            try:
+                data = json.dumps(row).encode("utf-8")
+            except (TypeError, ValueError):
+                logger.debug("Not caching cycle time row %s", key)
+                continue
+            values.append((key, config, updated, zlib.compress(data)))
+
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO cycle_rows "
+                "(key, config, updated, row) VALUES (?, ?, ?, ?)",
+                values,
+            )
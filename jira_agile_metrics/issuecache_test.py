@@ -0,0 +1,119 @@
+import os.path
+
+from .issuecache import IssueCache, MetadataCache, cache_filename
+
+
+def test_cache_filename(tmp_path):
+    directory = str(tmp_path / "cache")
+
+    assert cache_filename(
+        directory, "https://jira.example.org/", "issues.sqlite"
+    ) == os.path.join(directory, "jira.example.org.issues.sqlite")
+    assert cache_filename(
+        directory, "https://example.org:8080/jira", "issues.sqlite"
+    ) == os.path.join(directory, "example.org_8080_jira.issues.sqlite")
+    assert os.path.isdir(directory)
+
+
+def test_issue_cache(tmp_path):
+    filename = str(tmp_path / "issues.sqlite")
+
+    cache = IssueCache(filename)
+    assert cache.get_watermark("(filter=123)", "changelog") is None
+
+    cache.save_issues(
+        [
+            {"key": "A-1", "fields": {"summary": "One"}},
+            {"key": "A-2", "fields": {"summary": "Two"}},
+        ],
+        "changelog",
+    )
+    cache.save_issues([{"key": "A-1", "fields": {}}], "")
+    cache.save_watermark("(filter=123)", "changelog", "2018-01-01T01:01:01")
+    cache.close()
+
+    cache = IssueCache(filename)
+    assert (
+        cache.get_watermark("(filter=123)", "changelog")
+        == "2018-01-01T01:01:01"
+    )
+    assert cache.get_watermark("(filter=123)", "") is None
+    assert cache.get_issues(["A-1", "A-3"], "changelog") == {
+        "A-1": {"key": "A-1", "fields": {"summary": "One"}}
+    }
+    assert cache.get_issues(["A-1", "A-2"], "") == {
+        "A-1": {"key": "A-1", "fields": {}}
+    }
+
+
+def test_cycle_rows(tmp_path):
+    filename = str(tmp_path / "issues.sqlite")
+
+    cache = IssueCache(filename)
+    assert cache.get_cycle_rows(["A-1"], "abc") == {}
+
+    cache.save_cycle_rows(
+        [
+            ("A-1", "2018-01-01T01:01:01", {"key": "A-1", "Done": None}),
+            ("A-2", "2018-01-02T01:01:01", {"key": "A-2", "Done": None}),
+        ],
+        "abc",
+    )
+    cache.save_cycle_rows(
+        [("A-1", "2018-01-03T01:01:01", {"key": "A-1", "Done": 1})], "abc"
+    )
+    cache.close()
+
+    cache = IssueCache(filename)
+    assert cache.get_cycle_rows(["A-1", "A-3"], "abc") == {
+        "A-1": ("2018-01-03T01:01:01", {"key": "A-1", "Done": 1})
+    }
+    assert cache.get_cycle_rows(["A-1", "A-2"], "def") == {}
+
+    # Rows that can't be stored as JSON aren't stored
+    cache.save_cycle_rows(
+        [
+            ("A-1", "2018-01-04T01:01:01", {"key": "A-1", "Done": b"1"}),
+            ("A-2", "2018-01-04T01:01:01", {"key": "A-2", "Done": 2}),
+        ],
+        "abc",
+    )
+    assert cache.get_cycle_rows(["A-1", "A-2"], "abc") == {
+        "A-1": ("2018-01-03T01:01:01", {"key": "A-1", "Done": 1}),
+        "A-2": ("2018-01-04T01:01:01", {"key": "A-2", "Done": 2}),
+    }
+
+    # Rows that can't be read, e.g. saved in another format, are ignored
+    with cache.connection:
+        cache.connection.execute(
+            "UPDATE cycle_rows SET row = ? WHERE key = ?", (b"\x80", "A-1")
+        )
+    assert list(cache.get_cycle_rows(["A-1", "A-2"], "abc")) == ["A-2"]
+
+
+def test_metadata_cache(tmp_path):
+    filename = str(tmp_path / "metadata.json")
+    now = [1000.0]
+
+    cache = MetadataCache(filename, ttl=60, clock=lambda: now[0])
+    assert cache.get("fields") is None
+
+    cache.set("fields", [{"id": "summary", "name": "Summary"}])
+    assert cache.get("fields") == [{"id": "summary", "name": "Summary"}]
+
+    now[0] = 1050.0
+    cache = MetadataCache(filename, ttl=60, clock=lambda: now[0])
+    assert cache.get("fields") == [{"id": "summary", "name": "Summary"}]
+
+    # Entries expire...
+    now[0] = 1061.0
+    assert cache.get("fields") is None
+
+    # ...or can be ignored, without losing other entries when saving
+    cache = MetadataCache(filename, refresh=True, clock=lambda: now[0])
+    assert cache.get("fields") is None
+    cache.set("server_info", {"versionNumbers": [8, 0, 0]})
+
+    cache = MetadataCache(filename)
+    assert cache.get("fields") == [{"id": "summary", "name": "Summary"}]
+    assert cache.get("server_info") == {"versionNumbers": [8, 0, 0]}
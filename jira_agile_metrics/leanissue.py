@@ -0,0 +1,94 @@
+# Keys that hold a human-readable value for a JSON object, in order of
+# preference, as used by `jira.resources.Resource.__str__()`
+READABLE_KEYS = (
+    "displayName",
+    "key",
+    "name",
+    "accountId",
+    "filename",
+    "value",
+    "scope",
+    "votes",
+    "id",
+    "mimeType",
+    "closed",
+)
+
+
+def wrap(value):
+    """Wrap JSON objects in `value` so that their keys can be read as
+    attributes.
+    """
+    if isinstance(value, dict):
+        return LeanValue(value)
+    if isinstance(value, list):
+        return [wrap(v) for v in value]
+    return value
+
+
+class LeanValue(object):
+    """A JSON object, e.g. the value of a field, with its keys readable as
+    attributes. Missing keys raise `AttributeError`, as they do for `jira`
+    resources.
+    """
+
+    __slots__ = ("raw",)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def __getattr__(self, name):
+        try:
+            return wrap(self.raw[name])
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __eq__(self, other):
+        return isinstance(other, LeanValue) and self.raw == other.raw
+
+    def __str__(self):
+        for key in READABLE_KEYS:
+            if key in self.raw:
+                value = str(self.raw[key])
+                if "child" in self.raw:
+                    value += " - " + str(self.child)
+                return value
+        return repr(self)
+
+    def __repr__(self):
+        return "<LeanValue %r>" % (self.raw,)
+
+
+class LeanIssue(object):
+    """An issue built directly from the JSON data returned by the JIRA
+    search API, as a lightweight alternative to `jira.resources.Issue`,
+    which converts every field into a tree of resource objects up front.
+    Only the parts that are actually read are wrapped, so that calculators
+    can use it in the same way, e.g. `issue.fields.status.name` or
+    `issue.changelog.histories`.
+
+    `values` holds the values of fields already resolved by the query
+    manager, keyed by field id.
+    """
+
+    __slots__ = ("raw", "key", "fields", "values", "_changelog_index")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.key = raw["key"]
+        self.fields = LeanValue(raw.get("fields", {}))
+        self.values = {}
+        self._changelog_index = None
+
+    @property
+    def changelog(self):
+        try:
+            return LeanValue(self.raw["changelog"])
+        except KeyError:
+            raise AttributeError("changelog") from None
+
+    def __eq__(self, other):
+        return isinstance(other, LeanIssue) and self.raw == other.raw
+
+    def __repr__(self):
+        return "<LeanIssue %s>" % self.key
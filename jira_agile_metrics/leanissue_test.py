@@ -0,0 +1,56 @@
+import pytest
+
+from .leanissue import LeanIssue, LeanValue
+
+
+def test_lean_issue():
+    issue = LeanIssue(
+        {
+            "key": "A-1",
+            "fields": {
+                "summary": "Issue A-1",
+                "status": {"name": "Next", "id": "3"},
+                "resolution": None,
+                "customfield_001": [{"value": "R1"}, {"value": "R2"}],
+                "customfield_002": {
+                    "value": "Parent",
+                    "child": {"value": "Child"},
+                },
+            },
+            "changelog": {
+                "histories": [
+                    {
+                        "created": "2018-01-02T01:01:01.000+0000",
+                        "items": [
+                            {
+                                "field": "status",
+                                "fromString": "Backlog",
+                                "toString": "Next",
+                            }
+                        ],
+                    }
+                ]
+            },
+        }
+    )
+
+    assert issue.key == "A-1"
+    assert issue.fields.summary == "Issue A-1"
+    assert issue.fields.status.name == "Next"
+    assert issue.fields.resolution is None
+    assert [v.value for v in issue.fields.customfield_001] == ["R1", "R2"]
+    assert str(issue.fields.status) == "Next"
+    assert str(issue.fields.customfield_002) == "Parent - Child"
+
+    with pytest.raises(AttributeError):
+        issue.fields.customfield_003
+    assert getattr(issue.fields, "updated", None) is None
+
+    (history,) = issue.changelog.histories
+    assert history.created == "2018-01-02T01:01:01.000+0000"
+    assert history.items[0].toString == "Next"
+
+    assert LeanValue({"name": "Next"}) == LeanValue({"name": "Next"})
+
+    with pytest.raises(AttributeError):
+        LeanIssue({"key": "A-2", "fields": {}}).changelog
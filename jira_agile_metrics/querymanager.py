@@ -1,35 +1,357 @@
+import re
 import json
+import datetime
 import itertools
 import logging
+import time
 import dateutil.parser
 import dateutil.tz
 
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+
+from jira import JIRAError
+from jira.resources import Issue
+
 from .config import ConfigError
+from .issuecache import IssueCache, cache_filename, metadata_cache
+from .leanissue import LeanIssue
+from .scheduler import (
+    PRIORITY_NORMAL,
+    RequestScheduler,
+    THROTTLED_RETRY_DELAY,
+    count_requests,
+    in_current_context,
+    request_priority,
+    retry_after,
+    summarize_stats,
+)
+from .utils import chunks, parse_date
 
 logger = logging.getLogger(__name__)
 
+# JIRA compares `updated` against the watermark in the user's timezone,
+# which may differ from the offset in the timestamps it returns, so we
+# re-fetch a little more than we strictly need to.
+WATERMARK_OVERLAP = datetime.timedelta(days=1)
+
+# Number of keys to include in each `key in (...)` query
+KEY_QUERY_CHUNK_SIZE = 100
+
+# How many times to retry a page that JIRA refused with HTTP 429 (Too Many
+# Requests), and how long to wait before the first retry if JIRA doesn't
+# tell us. The wait is doubled for each subsequent retry.
+MAX_THROTTLED_RETRIES = 5
+
+# Upper limit for the number of requests in flight, unless configured
+DEFAULT_MAX_CONCURRENT_REQUESTS = 8
+
+# Fields read from every issue by the calculators
+BASE_FIELDS = [
+    "summary",
+    "issuetype",
+    "status",
+    "resolution",
+    "resolutiondate",
+    "created",
+    "updated",
+]
+
+# Settings naming additional fields read by some calculators
+FIELD_SETTINGS = [
+    "debt_priority_field",
+    "defects_priority_field",
+    "defects_type_field",
+    "defects_environment_field",
+    "progress_report_epic_deadline_field",
+    "progress_report_epic_min_stories_field",
+    "progress_report_epic_max_stories_field",
+    "progress_report_epic_team_field",
+    "progress_report_outcome_deadline_field",
+]
+
+# Number of changelog histories to request per page, and number of issues
+# to fetch changelogs for at a time if `fetch_concurrency` is not set, when
+# completing truncated changelogs
+CHANGELOG_PAGE_SIZE = 100
+CHANGELOG_FETCH_CONCURRENCY = 4
+
+ORDER_BY_PATTERN = re.compile(r"\border\s+by\b", re.IGNORECASE)
+
+# Types of values used as they are when resolving field values
+PLAIN_VALUE_TYPES = (int, float, bool, str, bytes)
+
+# Types of fields in JIRA (`schema.type` in the list of fields) whose values
+# are plain JSON values, or a single object (resolved to its `value`, or its
+# readable name)
+PLAIN_SCHEMA_TYPES = {"string", "number", "date", "datetime", "any"}
+OBJECT_SCHEMA_TYPES = {
+    "option",
+    "user",
+    "version",
+    "priority",
+    "issuetype",
+    "status",
+    "resolution",
+    "project",
+    "component",
+}
+
+# Outputs that only show recent data when a window is set, with the setting
+# giving the size of the window, and its unit: days, months, or periods of
+# the frequency given by another setting
+WINDOWED_OUTPUTS = [
+    (["scatterplot_data", "scatterplot_chart"], "scatterplot_window", "days"),
+    (["histogram_data", "histogram_chart"], "histogram_window", "days"),
+    (
+        ["throughput_data", "throughput_chart"],
+        "throughput_window",
+        "throughput_frequency",
+    ),
+    (["wip_chart"], "wip_window", "wip_frequency"),
+    (["net_flow_chart"], "net_flow_window", "net_flow_frequency"),
+    (
+        [
+            "impediments_data",
+            "impediments_chart",
+            "impediments_days_chart",
+            "impediments_status_chart",
+            "impediments_status_days_chart",
+        ],
+        "impediments_window",
+        "months",
+    ),
+    (
+        [
+            "defects_by_priority_chart",
+            "defects_by_type_chart",
+            "defects_by_environment_chart",
+        ],
+        "defects_window",
+        "months",
+    ),
+    (["debt_chart", "debt_age_chart"], "debt_window", "months"),
+    (["waste_chart"], "waste_window", "waste_frequency"),
+]
+
+# Outputs that always use the complete history of the issues found
+FULL_HISTORY_OUTPUTS = [
+    "cycle_time_data",
+    "percentiles_data",
+    "cfd_data",
+    "cfd_chart",
+    "burnup_chart",
+    "burnup_forecast_chart",
+    "progress_report",
+]
+
+
+def add_jql_condition(jql, condition):
+    """Return `jql` further restricted by `condition`, keeping any
+    `ORDER BY` clause at the end of the query.
+    """
+    match = ORDER_BY_PATTERN.search(jql)
+    start = match.start() if match else len(jql)
+    query, order_by = jql[:start], jql[start:]
+
+    query = query.strip()
+    if query:
+        condition = "(%s) AND (%s)" % (
+            query,
+            condition,
+        )
+
+    return ("%s %s" % (condition, order_by)).strip()
+
+
+def plain_value(value):
+    """Return `value` as a plain value, e.g. a string rather than a JIRA
+    resource.
+    """
+    if not isinstance(value, PLAIN_VALUE_TYPES):
+        try:
+            value = str(value)
+        except TypeError:
+            pass
+    return value
+
+
+def make_value_resolver(schema, known_values=None):
+    """Return a function that turns the value of a field with the given
+    schema (as returned by JIRA with the list of fields) into a plain value.
+    For fields with several values, the first value is used, or the first
+    of `known_values` that the field has, if given. Fields with a schema we
+    don't know how to resolve more directly, or no schema, are resolved by
+    trying each possibility in turn.
+    """
+
+    def resolve_list(values):
+        if len(values) == 0:
+            return plain_value(None)
+
+        values = [getattr(v, "name", v) for v in values]
+
+        if known_values is None:
+            return plain_value(values[0])
+
+        return plain_value(
+            next((v for v in known_values if v in values), None)
+        )
+
+    def resolve_any(value):
+        if value is None:
+            return None
+
+        value = getattr(value, "value", value)
+        if isinstance(value, (list, tuple)):
+            return resolve_list(value)
+        return plain_value(value)
+
+    def resolve_plain(value):
+        if value is None or isinstance(value, PLAIN_VALUE_TYPES):
+            return value
+        return resolve_any(value)
+
+    def resolve_array(value):
+        if isinstance(value, list):
+            return resolve_list(value)
+        return resolve_any(value)
+
+    def resolve_option(value):
+        if value is None:
+            return None
+        return plain_value(getattr(value, "value", value))
+
+    field_type = (schema or {}).get("type")
+
+    if field_type in PLAIN_SCHEMA_TYPES:
+        return resolve_plain
+    if field_type == "array":
+        return resolve_array
+    if field_type in OBJECT_SCHEMA_TYPES:
+        return resolve_option
+    return resolve_any
+
+
+def history_window(settings, today=None):
+    """Return the number of days of history needed for the outputs enabled
+    in `settings`, going by their windows, and a list of the outputs that
+    need the complete history of the issues found instead.
+    """
+
+    today = pd.Timestamp(today or datetime.date.today())
+    days = 0
+    full_history = []
+
+    for outputs, window_setting, unit in WINDOWED_OUTPUTS:
+        enabled = [output for output in outputs if settings.get(output)]
+        if len(enabled) == 0:
+            continue
+
+        window = settings.get(window_setting)
+        if not window:
+            full_history.extend(enabled)
+            continue
+
+        # Allow for a partial period at the start of the window
+        if unit == "days":
+            offset = pd.Timedelta(window + 1, "D")
+        elif unit == "months":
+            offset = pd.DateOffset(months=window + 1)
+        else:
+            offset = pd.tseries.frequencies.to_offset(settings[unit]) * (
+                window + 1
+            )
+
+        days = max(days, (today - (today - offset)).days)
+
+    full_history.extend(
+        output for output in FULL_HISTORY_OUTPUTS if settings.get(output)
+    )
+
+    return days, full_history
+
+
+def is_changelog_truncated(raw):
+    """Return whether the raw data of an issue found by a search has fewer
+    changelog histories than the issue actually has.
+    """
+    changelog = raw.get("changelog") if raw else None
+    return bool(changelog) and changelog.get("total", 0) > len(
+        changelog.get("histories", [])
+    )
+
+
+def merge_changelog(raw, histories):
+    """Return a copy of the raw data of an issue with `histories` added to
+    its changelog, ignoring histories it already has.
+    """
+    changelog = raw["changelog"]
+    merged = list(changelog.get("histories", []))
+    seen = set(h.get("id") for h in merged if h.get("id") is not None)
+
+    for history in histories:
+        if history.get("id") is None or history["id"] not in seen:
+            merged.append(history)
+
+    raw = dict(raw)
+    raw["changelog"] = dict(
+        changelog,
+        startAt=0,
+        maxResults=len(merged),
+        total=len(merged),
+        histories=merged,
+    )
+    return raw
+
 
 class IssueSnapshot(object):
     """A snapshot of the key fields of an issue at a point in its change
     history
     """
 
-    def __init__(self, change, key, date, from_string, to_string):
+    # There is one of these for every change of every issue, so keep them
+    # small
+    __slots__ = (
+        "change",
+        "key",
+        "date",
+        "from_string",
+        "to_string",
+        "from_id",
+        "to_id",
+    )
+
+    def __init__(
+        self,
+        change,
+        key,
+        date,
+        from_string,
+        to_string,
+        from_id=None,
+        to_id=None,
+    ):
         self.change = change
         self.key = key
         self.date = date
         self.from_string = from_string
         self.to_string = to_string
+        self.from_id = from_id
+        self.to_id = to_id
 
     def __eq__(self, other):
-        return all(
-            (
-                self.change == other.change,
-                self.key == other.key,
-                self.date.isoformat() == other.date.isoformat(),
-                self.from_string == other.from_string,
-                self.to_string == other.to_string,
-            )
+        # Dates in different timezones are not considered equal, even if
+        # they refer to the same point in time. Ids are not compared: they
+        # only help to identify the values.
+        return (
+            self.change == other.change
+            and self.key == other.key
+            and self.date == other.date
+            and self.date.utcoffset() == other.date.utcoffset()
+            and self.from_string == other.from_string
+            and self.to_string == other.to_string
         )
 
     def __repr__(self):
@@ -42,6 +364,63 @@ class IssueSnapshot(object):
         )
 
 
+class ChangelogIndex(object):
+    """The items in an issue's changelog, sorted by date and grouped by
+    field. Building the index parses each timestamp once, so it is cached on
+    the issue with `for_issue()` and shared by everything that looks at the
+    issue's history.
+    """
+
+    def __init__(self, histories):
+        changes = sorted(
+            ((parse_date(change.created), change) for change in histories),
+            key=lambda c: c[0],
+        )
+
+        # (date, item) tuples in chronological order. Dates are in the
+        # timezone JIRA reported them in, without the timezone information.
+        self.items = []
+
+        # field name -> positions in `self.items`
+        self.fields = {}
+
+        for change_date, change in changes:
+            change_date = change_date.replace(tzinfo=None)
+            for item in change.items:
+                self.fields.setdefault(item.field, []).append(len(self.items))
+                self.items.append((change_date, item))
+
+    @classmethod
+    def for_issue(cls, issue):
+        """Return the index for `issue`, building it the first time"""
+        index = getattr(issue, "_changelog_index", None)
+        if index is None:
+            index = cls(issue.changelog.histories)
+            issue._changelog_index = index
+        return index
+
+    def first_item(self, field):
+        """Return the earliest change item for `field`, or `None`"""
+        positions = self.fields.get(field)
+        return self.items[positions[0]][1] if positions else None
+
+    def iter_items(self, fields):
+        """Yield `(date, item)` for each change to any of `fields`, in
+        chronological order.
+        """
+        positions = [p for f in set(fields) for p in self.fields.get(f, [])]
+        for position in sorted(positions):
+            yield self.items[position]
+
+
+class IssuePage(list):
+    """A page of search results, with the total number of results"""
+
+    def __init__(self, issues, total):
+        super().__init__(issues)
+        self.total = total
+
+
 class QueryManager(object):
     """Manage and execute queries"""
 
@@ -49,6 +428,18 @@ class QueryManager(object):
         attributes={},
         known_values={},
         max_results=False,
+        cache_directory=None,
+        fetch_concurrency=None,
+        fetch_page_size=100,
+        field_projection=True,
+        query_concurrency=None,
+        stream_issues=False,
+        request_rate=None,
+        max_concurrent_requests=None,
+        window_pushdown=False,
+        lean_issues=False,
+        metadata_ttl=24,
+        refresh_metadata=False,
     )
 
     def __init__(self, jira, settings):
@@ -56,28 +447,272 @@ class QueryManager(object):
         self.settings = self.settings.copy()
         self.settings.update(settings)
 
+        # Schedule requests made with a real JIRA connection. A client shared
+        # with other runs keeps the scheduler it already has, so requests
+        # made for this run are counted separately.
+        self.scheduler = None
+        self.request_stats = None
+        if getattr(self.jira, "_session", None) is not None:
+            self.scheduler = RequestScheduler(
+                rate=self.settings["request_rate"],
+                max_concurrency=self.settings["max_concurrent_requests"]
+                or DEFAULT_MAX_CONCURRENT_REQUESTS,
+            ).install(self.jira._session)
+            self.request_stats = count_requests()
+
         self.attributes_to_fields = {}
         self.fields_to_attributes = {}
 
+        # The server URL doesn't change, so only ask the client once
+        self.server_url = self.jira.client_info()
+
+        # Metadata about the JIRA instance kept between runs, if possible
+        self.metadata = metadata_cache(self.settings, self.server_url)
+
+        # JIRA Cloud only supports searching through the `jira` library,
+        # which can't fetch pages of results from a given offset there
+        self.is_cloud = getattr(self.jira, "_is_cloud", False)
+
+        # Build lean issues from the JSON returned by searches, rather than
+        # `jira` resources
+        self.lean_issues = self.settings["lean_issues"] and not self.is_cloud
+
         # Look up fields in JIRA and resolve attributes to fields
-        logger.debug("Resolving JIRA fields")
-        self.jira_fields = self.jira.fields()
+        self.load_fields()
 
-        if len(self.jira_fields) == 0:
+        for name, field in self.settings["attributes"].items():
+            field_id = self.field_name_to_id(field)
+            self.attributes_to_fields[name] = field_id
+            self.fields_to_attributes[field_id] = name
+
+        # Only fetch the fields we need, if possible
+        self.fields = (
+            self.find_required_fields()
+            if self.settings["field_projection"]
+            else None
+        )
+
+        # Whether any issues have been fetched yet, after which the fields
+        # fetched can't change (see `request_fields()`)
+        self.issues_fetched = False
+
+        # Whether JIRA has the paginated changelog resource. JIRA Server
+        # doesn't, which we find out the first time we ask for it.
+        self.has_changelog_resource = True
+
+        # Names of the statuses defined in JIRA by id, fetched the first time
+        # they are needed (see `status_names()`)
+        self.jira_statuses = None
+
+        # Results of queries run so far, keyed by JQL and `expand`, so that
+        # calculators running the same query don't fetch the issues again
+        self.query_results = {}
+        self.query_hits = 0
+        self.query_misses = 0
+
+        self.issue_cache = None
+        if self.settings["cache_directory"]:
+            self.issue_cache = IssueCache(
+                cache_filename(
+                    self.settings["cache_directory"],
+                    self.server_url,
+                    "issues.sqlite",
+                )
+            )
+            logger.info("Using issue cache %s", self.issue_cache.filename)
+
+        # Only fetch issues resolved recently enough to be shown, if asked
+        self.window_days = None
+        if self.settings["window_pushdown"]:
+            days, full_history = history_window(self.settings)
+
+            if days > 0:
+                self.window_days = days
+                logger.info(
+                    "Only fetching issues resolved in the last %d days, or "
+                    "not resolved",
+                    days,
+                )
+            else:
+                logger.warning(
+                    "`Window pushdown` is set, but none of the outputs have "
+                    "a window. Fetching all issues."
+                )
+
+            if self.window_days is not None and len(full_history) > 0:
+                logger.warning(
+                    "`Window pushdown` is set, but %s use the full history "
+                    "of issues. Issues resolved more than %d days ago will "
+                    "be missing from them.",
+                    ", ".join(full_history),
+                    days,
+                )
+
+    def __getstate__(self):
+        """Leave out the JIRA client, the caches and the resolvers made so
+        far when pickling, e.g. to send the query manager to a worker
+        process. The copy can resolve field values and changes of issues,
+        but not run queries.
+        """
+        state = self.__dict__.copy()
+        state.update(
+            jira=None,
+            scheduler=None,
+            metadata=None,
+            issue_cache=None,
+            query_results={},
+            field_resolvers={},
+        )
+        return state
+
+    def find_required_fields(self):
+        """Return a list of the ids of all fields the calculators will read
+        from issues, given the current settings.
+        """
+
+        fields = BASE_FIELDS + list(self.attributes_to_fields.values())
+        fields.extend(
+            self.find_field_ids(
+                ["Flagged"]
+                + [self.settings.get(key) for key in FIELD_SETTINGS]
+            )
+        )
+
+        return list(dict.fromkeys(fields))
+
+    def find_field_ids(self, names):
+        """Return the ids of the fields with the given names or ids, leaving
+        out fields that don't exist.
+        """
+
+        field_ids = []
+        for name in names:
+            if not name:
+                continue
+
+            if name in self.jira_fields_to_names:
+                field_ids.append(name)
+                continue
+
+            try:
+                field_ids.append(self.field_name_to_id(name))
+            except ConfigError:
+                logger.debug("Not fetching unknown field %s", name)
+
+        return field_ids
+
+    def request_fields(self, names):
+        """Make sure the fields with the given names or ids are fetched by
+        all queries, if only the required fields are being fetched. This
+        must be done before any issues are fetched, so that all calculators
+        see the same fields (and use the same cached issues). Fields
+        requested later are not fetched.
+        """
+        if self.fields is None:
+            return
+
+        field_ids = [
+            f for f in self.find_field_ids(names) if f not in self.fields
+        ]
+        if len(field_ids) == 0:
+            return
+
+        if self.issues_fetched:
+            logger.warning(
+                "Not fetching fields %s, as they were requested after "
+                "issues were fetched",
+                ", ".join(field_ids),
+            )
+            return
+
+        self.fields.extend(field_ids)
+
+    def load_fields(self, refresh=False):
+        """Fetch the list of fields from JIRA and index them by name. If
+        `cache_directory` is set, the list is kept in the metadata cache
+        there between runs, and only fetched again if `refresh` is true, or
+        the cached list has expired (see `metadata_ttl`).
+        """
+
+        fields = None
+        if self.metadata is not None and not refresh:
+            fields = self.metadata.get("fields")
+
+        self.fields_from_cache = fields is not None
+
+        if fields is None:
+            logger.debug("Resolving JIRA fields")
+            fields = self.jira.fields()
+
+            if self.metadata is not None and len(fields) > 0:
+                self.metadata.set("fields", fields)
+
+        if len(fields) == 0:
             raise ConfigError(
                 "No field data retrieved from JIRA. This likely means a"
                 "problem with the JIRA API."
             ) from None
 
+        self.jira_fields = fields
         self.jira_fields_to_names = {
             field["id"]: field["name"] for field in self.jira_fields
         }
-        field_id = None
+        self.jira_fields_by_id = {
+            field["id"]: field for field in self.jira_fields
+        }
 
-        for name, field in self.settings["attributes"].items():
-            field_id = self.field_name_to_id(field)
-            self.attributes_to_fields[name] = field_id
-            self.fields_to_attributes[field_id] = name
+        # Field id -> function resolving its value (see `make_resolver()`)
+        self.field_resolvers = {}
+
+        # Case-folded field name -> id of the first field with that name
+        self.field_names_to_ids = {}
+        self.ambiguous_field_names = set()
+
+        for field in self.jira_fields:
+            name = field["name"].casefold()
+            if name in self.field_names_to_ids:
+                self.ambiguous_field_names.add(name)
+            else:
+                self.field_names_to_ids[name] = field["id"]
+
+    def status_names(self):
+        """Return a dict of the names of all statuses defined in JIRA, keyed
+        by status id. The statuses are only fetched once per run, and kept
+        in the metadata cache like the list of fields, if there is one. If
+        the statuses can't be fetched for any reason, the dict is empty.
+        """
+
+        if self.jira_statuses is not None:
+            return self.jira_statuses
+
+        statuses = None
+        if self.metadata is not None:
+            statuses = self.metadata.get("statuses")
+
+        if statuses is None:
+            logger.debug("Fetching JIRA statuses")
+            try:
+                statuses = {
+                    status["id"]: status["name"]
+                    for status in self.retry_throttled(
+                        "statuses", self.jira._get_json, "status"
+                    )
+                }
+            except Exception as e:
+                # E.g. an error from JIRA, or a replayed archive recorded
+                # without the list
+                logger.warning(
+                    "Could not fetch the list of statuses from JIRA (%s). "
+                    "Statuses will only be mapped to workflow steps by name.",
+                    getattr(e, "status_code", None) or e,
+                )
+                statuses = {}
+            else:
+                if self.metadata is not None and len(statuses) > 0:
+                    self.metadata.set("statuses", statuses)
+
+        self.jira_statuses = statuses
+        return statuses
 
     def field_name_to_id(self, name):
         """Given the name of a field, return the JIRA internal field ID. We
@@ -87,15 +722,19 @@ class QueryManager(object):
         """
         if name.lower() == "status":
             return "status"
-        try:
-            return next(
-                (
-                    f["id"]
-                    for f in self.jira_fields
-                    if f["name"].lower() == name.lower()
-                )
+
+        folded_name = name.casefold()
+        field_id = self.field_names_to_ids.get(folded_name)
+
+        if field_id is None and self.fields_from_cache:
+            logger.info(
+                "Field %s not found in cached fields. Fetching fields again.",
+                name,
             )
-        except StopIteration:
+            self.load_fields(refresh=True)
+            field_id = self.field_names_to_ids.get(folded_name)
+
+        if field_id is None:
 
             # XXX: we are having problems with this falsely claiming fields
             # don't exist
@@ -110,6 +749,17 @@ class QueryManager(object):
                 "(did you try to use the field id instead?)" % name
             ) from None
 
+        if folded_name in self.ambiguous_field_names:
+            logger.warning(
+                "There is more than one JIRA field with name `%s`. Using %s.",
+                name,
+                field_id,
+            )
+            # Only warn once per name
+            self.ambiguous_field_names.discard(folded_name)
+
+        return field_id
+
     def resolve_attribute_value(self, issue, attribute_name):
         """Given an attribute name (i.e. one named in the config file and
         mapped to a field in JIRA), return its value from the given issue.
@@ -125,51 +775,48 @@ class QueryManager(object):
         complex data types.
         """
 
-        try:
-            field_value = getattr(issue.fields, field_id)
-        except AttributeError:
-            field_name = self.jira_fields_to_names.get(
-                field_id, "Unknown name"
-            )
-            logger.debug(
-                "Could not get field value for field {}. Probably this is a"
-                "wrong workflow field mapping".format(field_name)
+        # Resolved when a lean issue was built
+        values = getattr(issue, "values", None)
+        if isinstance(values, dict) and field_id in values:
+            return values[field_id]
+
+        resolver = self.field_resolvers.get(field_id)
+        if resolver is None:
+            resolver = self.field_resolvers[field_id] = self.make_resolver(
+                field_id
             )
-            field_value = None
 
-        if field_value is None:
-            return None
+        return resolver(issue)
 
-        value = getattr(field_value, "value", field_value)
+    def make_resolver(self, field_id):
+        """Return a function that resolves the value of the field with the
+        given id from an issue, specialised for the type of the field as
+        given by its schema in JIRA.
+        """
 
-        if isinstance(value, (list, tuple)):
-            if len(value) == 0:
-                value = None
-            else:
-                values = [getattr(v, "name", v) for v in value]
+        attribute_name = self.fields_to_attributes.get(field_id, None)
+        known_values = self.settings["known_values"].get(attribute_name)
+        if attribute_name not in self.settings["known_values"]:
+            known_values = None
 
-                # is this a `Known Values` attribute?
-                attribute_name = self.fields_to_attributes.get(field_id, None)
-                if attribute_name not in self.settings["known_values"]:
-                    value = values[0]
-                else:
-                    try:
-                        value = next(
-                            filter(
-                                lambda v: v in values,
-                                self.settings["known_values"][attribute_name],
-                            )
-                        )
-                    except StopIteration:
-                        value = None
-
-        if not isinstance(value, (int, float, bool, str, bytes)):
+        schema = (self.jira_fields_by_id.get(field_id) or {}).get("schema")
+        resolve = make_value_resolver(schema, known_values)
+
+        def resolver(issue):
             try:
-                value = str(value)
-            except TypeError:
-                pass
+                field_value = getattr(issue.fields, field_id)
+            except AttributeError:
+                logger.debug(
+                    "Could not get field value for field {}. Probably this "
+                    "is a wrong workflow field mapping".format(
+                        self.jira_fields_to_names.get(field_id, "Unknown name")
+                    )
+                )
+                return None
 
-        return value
+            return resolve(field_value)
+
+        return resolver
 
     def iter_changes(self, issue, fields):
         """Yield an IssueSnapshot for each time the issue changed, including an
@@ -177,70 +824,693 @@ class QueryManager(object):
         `['status']`.
         """
 
+        for (
+            change,
+            date,
+            from_string,
+            to_string,
+            from_id,
+            to_id,
+        ) in self.iter_change_values(issue, fields):
+            yield IssueSnapshot(
+                change=change,
+                key=issue.key,
+                date=date,
+                from_string=from_string,
+                to_string=to_string,
+                from_id=from_id,
+                to_id=to_id,
+            )
+
+    def iter_change_values(self, issue, fields):
+        """Yield the same changes as `iter_changes()`, as plain
+        `(change, date, from_string, to_string, from_id, to_id)` tuples. The
+        ids are those JIRA gives the values, e.g. status ids, if any.
+        """
+
+        changelog = ChangelogIndex.for_issue(issue)
+        created = parse_date(issue.fields.created)
+
         for field in fields:
-            initial_value = self.resolve_field_value(
-                issue, self.field_name_to_id(field)
+            field_id = self.field_name_to_id(field)
+            initial_value = self.resolve_field_value(issue, field_id)
+            initial_id = getattr(
+                getattr(issue.fields, field_id, None), "id", None
             )
-            try:
-                initial_value = next(
-                    filter(
-                        lambda h: h.field == field,
-                        itertools.chain.from_iterable(
-                            [
-                                c.items
-                                for c in sorted(
-                                    issue.changelog.histories,
-                                    key=lambda c: dateutil.parser.parse(
-                                        c.created
-                                    ),
-                                )
-                            ]
-                        ),
-                    )
-                ).fromString
-            except StopIteration:
-                pass
 
-            yield IssueSnapshot(
-                change=field,
-                key=issue.key,
-                date=dateutil.parser.parse(issue.fields.created),
-                from_string=None,
-                to_string=initial_value,
+            first_item = changelog.first_item(field)
+            if first_item is not None:
+                initial_value = first_item.fromString
+                initial_id = getattr(first_item, "from", None)
+
+            yield field, created, None, initial_value, None, initial_id
+
+        for change_date, item in changelog.iter_items(fields):
+            yield (
+                item.field,
+                change_date,
+                item.fromString,
+                item.toString,
+                getattr(item, "from", None),
+                getattr(item, "to", None),
             )
 
-        for change in sorted(
-            issue.changelog.histories,
-            key=lambda c: dateutil.parser.parse(c.created),
-        ):
-            change_date = dateutil.parser.parse(change.created, ignoretz=True)
+    def windowed_jql(self, jql):
+        """Return `jql` restricted to issues that are not resolved or were
+        resolved within the window worked out for `window_pushdown`, if set.
+        """
+        if self.window_days is None:
+            return jql
 
-            for item in change.items:
-                if item.field in fields:
-                    yield IssueSnapshot(
-                        change=item.field,
-                        key=issue.key,
-                        date=change_date,
-                        from_string=item.fromString,
-                        to_string=item.toString,
-                    )
+        return add_jql_condition(
+            jql,
+            "resolved >= -%dd OR resolution is EMPTY" % self.window_days,
+        )
 
     # Basic queries
 
     def find_issues(self, jql, expand="changelog"):
         """Return a list of issues with changelog metadata for the given
-        JQL.
+        JQL. Issues are only fetched once per query: if the same query has
+        already been run with the same `expand` parameter, or with one that
+        expands at least as much, the previous result is returned.
         """
 
+        issues = self.find_query_results(jql, expand)
+        if issues is not None:
+            self.query_hits += 1
+            logger.info(
+                "Using %d issues already fetched with query `%s` "
+                "(%d queries saved so far)",
+                len(issues),
+                jql,
+                self.query_hits,
+            )
+            return issues
+
+        self.query_misses += 1
+
         max_results = self.settings["max_results"]
 
         logger.info("Fetching issues with query `%s`", jql)
         if max_results:
             logger.info("Limiting to %d results", max_results)
 
-        issues = self.jira.search_issues(
-            jql, expand=expand, maxResults=max_results
-        )
+        search_jql = self.windowed_jql(jql)
+
+        if self.issue_cache is not None and not max_results:
+            issues = self.find_cached_issues(search_jql, expand)
+        else:
+            issues = self.search_issues(
+                search_jql,
+                expand=expand,
+                fields=self.fields,
+                max_results=max_results,
+            )
         logger.info("Fetched %d issues", len(issues))
 
+        self.query_results[(jql, expand)] = issues
+        return list(issues)
+
+    def iter_issues(self, jql, expand="changelog"):
+        """Yield the issues found by the given JQL. If `stream_issues` is
+        set, issues are fetched one page at a time and not kept once they
+        have been yielded, so that memory use doesn't grow with the number
+        of issues. The results are then not shared with other calculators.
+        Otherwise, this is the same as iterating over `find_issues()`.
+        """
+
+        # On JIRA Cloud, streaming needs a client that can page through
+        # results with a token, which a recording client can't
+        if (
+            not self.settings["stream_issues"]
+            or self.issue_cache is not None
+            or self.find_query_results(jql, expand) is not None
+            or (
+                self.is_cloud
+                and not hasattr(self.jira, "enhanced_search_issues")
+            )
+        ):
+            yield from self.find_issues(jql, expand)
+            return
+
+        max_results = self.settings["max_results"]
+        page_size = self.settings["fetch_page_size"]
+
+        options = {"expand": expand}
+        if self.fields is not None:
+            options["fields"] = self.fields
+
+        logger.info("Streaming issues with query `%s`", jql)
+        if max_results:
+            logger.info("Limiting to %d results", max_results)
+
+        self.issues_fetched = True
+
+        # JIRA Cloud pages through results with a token rather than an
+        # offset
+        start_at, next_page_token = 0, None
+        while True:
+            if max_results:
+                page_size = min(page_size, max_results - start_at)
+
+            if self.is_cloud:
+                page = self.retry_throttled(
+                    "results from %d" % start_at,
+                    self.jira.enhanced_search_issues,
+                    self.windowed_jql(jql),
+                    nextPageToken=next_page_token,
+                    maxResults=page_size,
+                    **options,
+                )
+                next_page_token = getattr(page, "nextPageToken", None)
+                is_last = next_page_token is None
+            else:
+                page = self.search_issues_page(
+                    self.windowed_jql(jql), start_at, page_size, **options
+                )
+                is_last = start_at + len(page) >= page.total
+
+            count = len(page)
+            page = self.complete_changelogs(page)
+
+            yield from page
+            del page
+
+            start_at += count
+            if (
+                count == 0
+                or is_last
+                or (max_results and start_at >= max_results)
+            ):
+                break
+
+        logger.info("Fetched %d issues", start_at)
+
+    def iter_new_issues(self, jql, seen_keys, expand="changelog"):
+        """Yield a `(key, issue)` tuple for each issue found by the given
+        JQL, where `issue` is `None` if the key is in `seen_keys`, e.g.
+        because the issue was found by a previous query. Where possible,
+        only the keys of the matching issues are fetched at first, so that
+        issues already seen are not fetched again.
+        """
+
+        if (
+            len(seen_keys) == 0
+            or self.issue_cache is not None
+            or self.settings["stream_issues"]
+            or self.settings["max_results"]
+            or self.find_query_results(jql, expand) is not None
+        ):
+            for issue in self.iter_issues(jql, expand):
+                if issue.key in seen_keys:
+                    logger.debug(
+                        "Issue %s found again with query `%s`", issue.key, jql
+                    )
+                    yield issue.key, None
+                else:
+                    yield issue.key, issue
+            return
+
+        keys = [
+            issue.key
+            for issue in self.search_issues(
+                self.windowed_jql(jql), fields="key"
+            )
+        ]
+        new_keys = [key for key in keys if key not in seen_keys]
+
+        logger.info(
+            "Fetching %d issues with query `%s` (%d found by earlier queries)",
+            len(new_keys),
+            jql,
+            len(keys) - len(new_keys),
+        )
+
+        issues = {}
+        for chunk in chunks(new_keys, KEY_QUERY_CHUNK_SIZE):
+            for issue in self.search_issues(
+                "key in (%s)" % ", ".join(chunk),
+                expand=expand,
+                fields=self.fields,
+            ):
+                issues[issue.key] = issue
+
+        # In the order of the original query
+        new_keys = set(new_keys)
+        for key in keys:
+            if key in issues:
+                yield key, issues.pop(key)
+            elif key not in new_keys:
+                yield key, None
+
+    def log_statistics(self):
+        """Log how many queries were run, and how many requests were made"""
+        logger.info(
+            "Ran %d queries, %d more answered with issues already fetched",
+            self.query_misses,
+            self.query_hits,
+        )
+        if self.request_stats is not None:
+            logger.info(summarize_stats(self.request_stats))
+
+    def prefetch(self, queries):
+        """Fetch the issues for a list of `(jql, expand)` tuples ahead of
+        time, so that subsequent calls to `find_issues()` can use them. A
+        request priority (see `scheduler.request_priority()`) may be given
+        for each query as a third item in the tuple. If
+        `query_concurrency` is set, up to that many queries are run at the
+        same time, so that fetching takes roughly as long as the slowest
+        query rather than the sum of all of them. Otherwise, this does
+        nothing and queries are run when they are first needed.
+        """
+
+        concurrency = self.settings["query_concurrency"]
+        if not concurrency or concurrency <= 1:
+            return
+
+        # Keep the first (i.e. highest) priority given for each query
+        priorities = {}
+        for query in queries:
+            jql, expand, priority = (tuple(query) + (None,))[:3]
+            if jql and (jql, expand) not in priorities:
+                priorities[(jql, expand)] = priority
+
+        queries = [
+            (jql, expand, priority)
+            for (jql, expand), priority in priorities.items()
+            if self.find_query_results(jql, expand) is None
+        ]
+        if len(queries) == 0:
+            return
+
+        logger.info(
+            "Fetching issues for %d queries, %d at a time",
+            len(queries),
+            concurrency,
+        )
+        self.fetch_concurrently(queries, concurrency)
+
+    def fetch_concurrently(self, queries, concurrency):
+        """Run `find_issues()` for each `(jql, expand, priority)` tuple in
+        `queries`, in up to `concurrency` threads, starting with the highest
+        priority queries. Failures are logged and otherwise ignored: the
+        query will be run again (and fail in context) when a calculator
+        needs it.
+        """
+
+        queries = sorted(
+            queries,
+            key=lambda q: PRIORITY_NORMAL if q[2] is None else q[2],
+        )
+
+        def fetch(jql, expand, priority):
+            with request_priority(
+                PRIORITY_NORMAL if priority is None else priority
+            ):
+                self.find_issues(jql, expand)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(in_current_context(fetch), *query)
+                for query in queries
+            ]
+
+        for (jql, expand, _), future in zip(queries, futures):
+            error = future.exception()
+            if error is not None:
+                logger.warning(
+                    "Could not fetch issues with query `%s` ahead of time: "
+                    "%s",
+                    jql,
+                    error,
+                )
+
+    def add_query_results(self, jql, issues, expand="changelog"):
+        """Record `issues` as the result of running `jql`, e.g. because they
+        were found by a broader query, so that `find_issues()` doesn't need
+        to fetch them again.
+        """
+        self.query_results[(jql, expand)] = list(issues)
+
+    def find_query_results(self, jql, expand):
+        """Return a copy of the issues previously fetched for `jql` with an
+        `expand` parameter covering `expand`, or `None`.
+        """
+        required = set((expand or "").split(",")) - {""}
+
+        for (previous_jql, previous_expand), issues in list(
+            self.query_results.items()
+        ):
+            if previous_jql == jql and required <= set(
+                (previous_expand or "").split(",")
+            ):
+                return list(issues)
+
+        return None
+
+    def search_issues(self, jql, expand=None, fields=None, max_results=False):
+        """Run a JIRA search and return the list of issues found. If
+        `fetch_concurrency` is set, the total number of issues is found
+        with the first page of results, and the remaining pages are fetched
+        concurrently, using at most `fetch_concurrency` threads. Otherwise,
+        the JIRA client fetches all pages in turn, as it always does on JIRA
+        Cloud, where pages can't be fetched from a given offset.
+        """
+
+        self.issues_fetched = True
+
+        concurrency = self.settings["fetch_concurrency"]
+        if self.is_cloud:
+            concurrency = None
+
+        options = {"expand": expand}
+        if fields is not None:
+            options["fields"] = fields
+
+        if (not concurrency or concurrency <= 1) and not self.lean_issues:
+            return self.complete_changelogs(
+                self.jira.search_issues(jql, maxResults=max_results, **options)
+            )
+
+        page_size = self.settings["fetch_page_size"]
+        if max_results:
+            page_size = min(page_size, max_results)
+
+        first_page = self.search_issues_page(jql, 0, page_size, **options)
+
+        if not concurrency or concurrency <= 1:
+            return self.complete_changelogs(
+                list(
+                    itertools.chain(
+                        first_page,
+                        *self.iter_pages(
+                            jql, first_page, page_size, max_results, **options
+                        ),
+                    )
+                )
+            )
+
+        # JIRA may return fewer issues per page than requested
+        page_size = len(first_page)
+        total = first_page.total
+        if max_results:
+            total = min(total, max_results)
+
+        if page_size == 0 or page_size >= total:
+            return self.complete_changelogs(list(first_page))
+
+        logger.debug(
+            "Fetching %d issues in pages of %d, %d at a time",
+            total,
+            page_size,
+            concurrency,
+        )
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pages = executor.map(
+                in_current_context(
+                    lambda start_at: self.search_issues_page(
+                        jql,
+                        start_at,
+                        min(page_size, total - start_at),
+                        **options,
+                    )
+                ),
+                range(page_size, total, page_size),
+            )
+
+            return self.complete_changelogs(
+                list(itertools.chain(first_page, *pages))
+            )
+
+    def iter_pages(self, jql, first_page, page_size, max_results, **options):
+        """Yield the pages of search results following `first_page`, one
+        after another.
+        """
+
+        start_at, page = len(first_page), first_page
+        while len(page) > 0 and start_at < page.total:
+            if max_results:
+                if start_at >= max_results:
+                    break
+                page_size = min(page_size, max_results - start_at)
+
+            page = self.search_issues_page(jql, start_at, page_size, **options)
+            start_at += len(page)
+            yield page
+
+    def search_issues_page(self, jql, start_at, max_results, **options):
+        """Fetch a single page of search results, backing off and retrying
+        if JIRA tells us we are making too many requests. With
+        `lean_issues`, the results are fetched as JSON and returned as lean
+        issues.
+        """
+
+        if not self.lean_issues:
+            return self.retry_throttled(
+                "results from %d" % start_at,
+                self.jira.search_issues,
+                jql,
+                startAt=start_at,
+                maxResults=max_results,
+                **options,
+            )
+
+        fields = options.get("fields")
+        if isinstance(fields, (list, tuple)):
+            fields = ",".join(fields)
+
+        result = self.retry_throttled(
+            "results from %d" % start_at,
+            self.jira._get_json,
+            "search",
+            params={
+                "jql": jql,
+                "startAt": start_at,
+                "maxResults": max_results,
+                "fields": fields or "*all",
+                "expand": options.get("expand"),
+            },
+        )
+
+        issues = [self.issue_from_raw(raw) for raw in result["issues"]]
+        return IssuePage(issues, result.get("total", len(issues)))
+
+    def retry_throttled(self, description, function, *args, **kwargs):
+        """Call `function` with the given arguments, backing off and retrying
+        if JIRA tells us we are making too many requests. `description` is
+        used in log messages.
+        """
+
+        # The scheduler retries requests itself
+        if self.scheduler is not None:
+            return function(*args, **kwargs)
+
+        delay = THROTTLED_RETRY_DELAY
+
+        for attempt in itertools.count(1):
+            try:
+                return function(*args, **kwargs)
+            except JIRAError as e:
+                if e.status_code != 429 or attempt > MAX_THROTTLED_RETRIES:
+                    raise
+
+                wait = retry_after(e.response, delay)
+
+                logger.warning(
+                    "JIRA is throttling requests. Retrying %s in %.1f seconds",
+                    description,
+                    wait,
+                )
+                time.sleep(wait)
+                delay *= 2
+
+    def complete_changelogs(self, issues):
+        """JIRA only includes a limited number of changes in the changelog
+        of each issue found by a search. Find issues with truncated
+        changelogs, fetch their full changelogs (for several issues at a
+        time, up to `fetch_concurrency`), and return `issues` with those
+        issues replaced by complete ones.
+        """
+
+        truncated = [
+            i
+            for i, issue in enumerate(issues)
+            if is_changelog_truncated(getattr(issue, "raw", None))
+        ]
+        if len(truncated) == 0:
+            return issues
+
+        logger.info(
+            "Fetching complete changelogs for %d issues", len(truncated)
+        )
+
+        concurrency = max(
+            self.settings["fetch_concurrency"] or CHANGELOG_FETCH_CONCURRENCY,
+            1,
+        )
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            histories = list(
+                executor.map(
+                    in_current_context(self.fetch_changelog),
+                    [issues[i].key for i in truncated],
+                )
+            )
+
+        issues = list(issues)
+        for i, fetched in zip(truncated, histories):
+            issues[i] = self.issue_from_raw(
+                merge_changelog(issues[i].raw, fetched)
+            )
+
+        return issues
+
+    def fetch_changelog(self, key):
+        """Return the complete list of raw changelog histories for the issue
+        with the given key. Uses the paginated changelog resource where
+        available (JIRA Cloud), and otherwise the issue resource, which
+        includes the full changelog.
+        """
+
+        if not self.has_changelog_resource:
+            return self.fetch_issue_changelog(key)
+
+        histories = []
+        start_at = 0
+
+        while True:
+            try:
+                page = self.retry_throttled(
+                    "changelog of %s" % key,
+                    self.jira._get_json,
+                    "issue/%s/changelog" % key,
+                    params={
+                        "startAt": start_at,
+                        "maxResults": CHANGELOG_PAGE_SIZE,
+                    },
+                )
+            except JIRAError as e:
+                if e.status_code != 404 or start_at > 0:
+                    raise
+
+                # Don't ask for the changelog resource again
+                self.has_changelog_resource = False
+                return self.fetch_issue_changelog(key)
+
+            values = page.get("values", [])
+            histories.extend(values)
+            start_at += len(values)
+
+            if (
+                len(values) == 0
+                or page.get("isLast")
+                or start_at >= page.get("total", 0)
+            ):
+                return histories
+
+    def fetch_issue_changelog(self, key):
+        """Return the complete list of raw changelog histories for the issue
+        with the given key from the issue resource.
+        """
+        issue = self.retry_throttled(
+            "changelog of %s" % key,
+            self.jira._get_json,
+            "issue/%s" % key,
+            params={"expand": "changelog", "fields": "key"},
+        )
+        return issue["changelog"]["histories"]
+
+    def find_cached_issues(self, jql, expand="changelog"):
+        """Return a list of issues for the given JQL, using the issue cache.
+        The first time a query is run, all issues are fetched and stored.
+        Subsequently, only issues updated since the last run (as per the
+        query's watermark) are fetched in full. A light-weight query for the
+        keys alone is used to find out which issues currently match, so that
+        issues that no longer match the query are dropped.
+        """
+
+        # Cached issues can only be used if fetched in the same way
+        variant = "%s;%s" % (
+            expand or "",
+            ",".join(sorted(self.fields)) if self.fields else "*all",
+        )
+        watermark = self.issue_cache.get_watermark(jql, variant)
+
+        if watermark is None:
+            issues = list(
+                self.search_issues(jql, expand=expand, fields=self.fields)
+            )
+            self.issue_cache.save_issues([i.raw for i in issues], variant)
+        else:
+            since = dateutil.parser.parse(watermark) - WATERMARK_OVERLAP
+            fresh = {
+                issue.key: issue
+                for issue in self.search_issues(
+                    add_jql_condition(
+                        jql,
+                        'updated >= "%s"' % since.strftime("%Y/%m/%d %H:%M"),
+                    ),
+                    expand=expand,
+                    fields=self.fields,
+                )
+            }
+            logger.info(
+                "%d issues updated since %s", len(fresh), since.isoformat()
+            )
+
+            keys = [
+                issue.key for issue in self.search_issues(jql, fields="key")
+            ]
+            cached = self.issue_cache.get_issues(
+                [k for k in keys if k not in fresh], variant
+            )
+
+            # Issues that match now, but were never cached, e.g. because
+            # the query has relative dates or uses a filter that changed
+            missing = [k for k in keys if k not in fresh and k not in cached]
+            for chunk in chunks(missing, KEY_QUERY_CHUNK_SIZE):
+                for issue in self.search_issues(
+                    "key in (%s)" % ", ".join(chunk),
+                    expand=expand,
+                    fields=self.fields,
+                ):
+                    fresh[issue.key] = issue
+
+            self.issue_cache.save_issues(
+                [i.raw for i in fresh.values()], variant
+            )
+            logger.info("Using %d cached issues", len(keys) - len(fresh))
+
+            issues = [
+                fresh[k] if k in fresh else self.issue_from_raw(cached[k])
+                for k in keys
+                if k in fresh or k in cached
+            ]
+
+        updated = [
+            dateutil.parser.parse(i.raw["fields"]["updated"])
+            for i in issues
+            if i.raw.get("fields", {}).get("updated")
+        ]
+        if len(updated) > 0:
+            self.issue_cache.save_watermark(
+                jql, variant, max(updated).isoformat()
+            )
+
         return issues
+
+    def issue_from_raw(self, raw):
+        """Build an issue resource from raw JSON data, as returned by the
+        JIRA search API. With `lean_issues`, this is a `LeanIssue` with the
+        values of the attributes already resolved.
+        """
+        if not self.lean_issues:
+            return Issue(self.jira._options, self.jira._session, raw=raw)
+
+        issue = LeanIssue(raw)
+        issue.values = {
+            field_id: self.resolve_field_value(issue, field_id)
+            for field_id in self.fields_to_attributes
+        }
+        return issue
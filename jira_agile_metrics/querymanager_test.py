@@ -1,5 +1,15 @@
+import time
+import logging
+import asyncio
+import pickle
+import contextvars
+import threading
 import pytest
 import datetime
+import dateutil.tz
+
+from jira import JIRAError
+from jira.resources import Issue as JIRAIssue
 
 from .conftest import (
     FauxJIRA as JIRA,
@@ -8,7 +18,15 @@ from .conftest import (
     FauxFieldValue as Value,
 )
 
-from .querymanager import QueryManager, IssueSnapshot
+from .config import ConfigError
+from .querymanager import (
+    QueryManager,
+    IssueSnapshot,
+    ChangelogIndex,
+    add_jql_condition,
+    history_window,
+    make_value_resolver,
+)
 from .utils import extend_dict
 
 
@@ -106,6 +124,55 @@ def test_search(jira, settings):
     assert issues == jira.issues()
 
 
+def test_search_lean_issues(jira, settings):
+    qm = QueryManager(jira, settings)
+    lean_qm = QueryManager(
+        jira,
+        extend_dict(settings, {"lean_issues": True, "fetch_page_size": 3}),
+    )
+
+    issues = qm.find_issues("(filter=123)")
+    lean_issues = lean_qm.find_issues("(filter=123)")
+
+    assert [i.key for i in lean_issues] == [i.key for i in issues]
+    assert [i.raw for i in lean_issues] == [i.raw for i in issues]
+
+    for issue, lean_issue in zip(issues, lean_issues):
+        assert lean_issue.fields.status.name == issue.fields.status.name
+        for attribute in ["Team", "Estimate", "Release"]:
+            assert lean_qm.resolve_attribute_value(
+                lean_issue, attribute
+            ) == qm.resolve_attribute_value(issue, attribute)
+        assert list(lean_qm.iter_changes(lean_issue, ["status"])) == list(
+            qm.iter_changes(issue, ["status"])
+        )
+
+
+def test_pickle(jira, settings):
+    qm = QueryManager(jira, settings)
+    issues = qm.find_issues("(filter=123)")
+    qm.resolve_attribute_value(issues[0], "Team")
+
+    copy = pickle.loads(pickle.dumps(qm))
+    assert copy.jira is None
+    assert copy.query_results == {}
+    assert copy.field_resolvers == {}
+
+    # The original is unchanged
+    assert qm.jira is jira
+    assert len(qm.field_resolvers) > 0
+
+    # The copy can still resolve values and changes of issues
+    for issue in issues:
+        for attribute in ["Team", "Estimate", "Release"]:
+            assert copy.resolve_attribute_value(
+                issue, attribute
+            ) == qm.resolve_attribute_value(issue, attribute)
+        assert list(copy.iter_changes(issue, ["status"])) == list(
+            qm.iter_changes(issue, ["status"])
+        )
+
+
 def test_resolve_attribute_value(jira, settings):
     qm = QueryManager(jira, settings)
     issues = qm.find_issues("(filter=123)")
@@ -128,6 +195,57 @@ def test_resolve_field_value(jira, settings):
     )  # due to known_value
 
 
+def test_resolve_field_value_with_schema(jira, custom_fields, settings):
+    fields = [dict(f) for f in custom_fields]
+    for field in fields:
+        if field["id"] == "customfield_001":
+            field["schema"] = {"type": "string"}
+        elif field["id"] == "customfield_003":
+            field["schema"] = {"type": "array", "items": "version"}
+
+    qm = QueryManager(JIRA(fields=fields, issues=jira.issues()), settings)
+    issues = qm.find_issues("(filter=123)")
+
+    assert qm.resolve_field_value(issues[0], "customfield_001") == "Team 1"
+    assert qm.resolve_field_value(issues[0], "customfield_002") == 30
+    assert qm.resolve_field_value(issues[0], "customfield_003") == "R3"
+    assert qm.resolve_field_value(issues[0], "customfield_100") is None
+
+    # Resolvers are made once per field
+    assert sorted(qm.field_resolvers) == [
+        "customfield_001",
+        "customfield_002",
+        "customfield_003",
+        "customfield_100",
+    ]
+
+
+def test_make_value_resolver():
+    option = Value("Option", "Value")
+
+    resolve = make_value_resolver({"type": "number"})
+    assert resolve(3.5) == 3.5
+    assert resolve(None) is None
+    assert resolve(option) == "Value"
+
+    resolve = make_value_resolver({"type": "option"})
+    assert resolve(option) == "Value"
+    assert resolve(None) is None
+
+    resolve = make_value_resolver({"type": "array", "items": "version"})
+    assert resolve([Value("R1", None), Value("R2", None)]) == "R1"
+    assert resolve([]) == "None"
+
+    resolve = make_value_resolver(
+        {"type": "array", "items": "version"}, known_values=["R2"]
+    )
+    assert resolve([Value("R1", None), Value("R2", None)]) == "R2"
+
+    resolve = make_value_resolver(None)
+    assert resolve(option) == "Value"
+    assert resolve(Value(None, ["R1", "R2"])) == "R1"
+
+
 def test_iter_changes(jira, settings):
     qm = QueryManager(jira, settings)
     issues = qm.find_issues("(filter=123)")
@@ -177,3 +295,777 @@ def test_iter_changes(jira, settings):
             to_string="QA",
         ),
     ]
+
+
+def test_add_jql_condition():
+    assert (
+        add_jql_condition("project = A", "updated >= -1d")
+        == "(project = A) AND (updated >= -1d)"
+    )
+    assert (
+        add_jql_condition("project = A ORDER BY rank", "updated >= -1d")
+        == "(project = A) AND (updated >= -1d) ORDER BY rank"
+    )
+    assert (
+        add_jql_condition("order by rank", "updated >= -1d")
+        == "updated >= -1d order by rank"
+    )
+
+
+def test_find_issues_cached(custom_fields, settings, tmp_path):
+    def make_issue(key, summary, updated, created="2018-01-01 01:01:01"):
+        return Issue(
+            key,
+            summary=summary,
+            issuetype=Value("Story", "story"),
+            status=Value("Next", "next"),
+            resolution=None,
+            created=created,
+            updated=updated,
+            customfield_001="Team 1",
+            changes=[
+                Change("2018-01-02 01:01:01", [("status", "Backlog", "Next")])
+            ],
+        )
+
+    queries = []
+
+    def simple_ql(issue, jql):
+        if "updated >=" in jql:
+            since = datetime.datetime.strptime(
+                jql.split('"')[1], "%Y/%m/%d %H:%M"
+            )
+            return issue.fields.updated >= since.isoformat()
+        if jql.startswith("key in"):
+            return issue.key in jql
+        return True
+
+    class RecordingJIRA(JIRA):
+        def search_issues(self, jql, *args, **kwargs):
+            queries.append(jql)
+            return super().search_issues(jql, *args, **kwargs)
+
+    settings = extend_dict(settings, {"cache_directory": str(tmp_path)})
+
+    jira = RecordingJIRA(
+        fields=custom_fields,
+        filter_=simple_ql,
+        issues=[
+            make_issue("A-1", "One", "2018-01-05T01:01:01"),
+            make_issue("A-2", "Two", "2018-01-10T01:01:01"),
+        ],
+    )
+
+    issues = QueryManager(jira, settings).find_issues("(filter=123)")
+    assert [i.key for i in issues] == ["A-1", "A-2"]
+    assert queries == ["(filter=123)"]
+
+    # A-1 no longer matches, A-2 changed, A-3 is new, and A-4 now matches
+    # the query but hasn't been updated recently.
+    queries.clear()
+    jira = RecordingJIRA(
+        fields=custom_fields,
+        filter_=simple_ql,
+        issues=[
+            make_issue("A-2", "Two (updated)", "2018-02-01T01:01:01"),
+            make_issue("A-4", "Four", "2017-06-01T01:01:01"),
+            make_issue("A-3", "Three", "2018-01-09T03:01:01"),
+        ],
+    )
+
+    issues = QueryManager(jira, settings).find_issues("(filter=123)")
+    assert [i.key for i in issues] == ["A-2", "A-4", "A-3"]
+    assert [i.fields.summary for i in issues] == [
+        "Two (updated)",
+        "Four",
+        "Three",
+    ]
+    assert queries == [
+        '((filter=123)) AND (updated >= "2018/01/09 01:01")',
+        "(filter=123)",
+        "key in (A-4)",
+    ]
+
+    # Nothing changed: issues are served from the cache
+    queries.clear()
+    jira = RecordingJIRA(
+        fields=custom_fields,
+        filter_=lambda issue, jql: "updated >=" not in jql,
+        issues=jira.issues(),
+    )
+
+    qm = QueryManager(jira, settings)
+    issues = qm.find_issues("(filter=123)")
+    assert [i.key for i in issues] == ["A-2", "A-4", "A-3"]
+    assert [i.fields.summary for i in issues] == [
+        "Two (updated)",
+        "Four",
+        "Three",
+    ]
+    assert list(qm.iter_changes(issues[0], ["status"])) == list(
+        qm.iter_changes(jira.issues()[0], ["status"])
+    )
+
+
+def test_search_issues_concurrently(custom_fields, settings, monkeypatch):
+    issues = [
+        Issue(
+            "A-%d" % i,
+            summary="Issue A-%d" % i,
+            issuetype=Value("Story", "story"),
+            status=Value("Backlog", "backlog"),
+            resolution=None,
+            created="2018-01-01 01:01:01",
+            changes=[],
+        )
+        for i in range(1, 12)
+    ]
+
+    class ThrottledResponse:
+        headers = {"Retry-After": "3"}
+
+    requests = []
+    sleeps = []
+
+    class ThrottlingJIRA(JIRA):
+        def search_issues(self, jql, startAt=0, maxResults=False, **kwargs):
+            requests.append((startAt, maxResults))
+            if startAt == 3 and requests.count((startAt, maxResults)) == 1:
+                raise JIRAError(status_code=429, response=ThrottledResponse())
+            return super().search_issues(jql, startAt, maxResults, **kwargs)
+
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+
+    qm = QueryManager(
+        ThrottlingJIRA(fields=custom_fields, issues=issues),
+        extend_dict(settings, {"fetch_concurrency": 4, "fetch_page_size": 3}),
+    )
+
+    assert qm.find_issues("(filter=123)") == issues
+    assert sorted(requests) == [
+        (0, 3),
+        (3, 3),
+        (3, 3),
+        (6, 3),
+        (9, 2),
+    ]
+    assert sleeps == [3.0]
+
+    # `max_results` limits the number of pages fetched
+    requests.clear()
+    qm = QueryManager(
+        ThrottlingJIRA(fields=custom_fields, issues=issues),
+        extend_dict(
+            settings,
+            {"fetch_concurrency": 4, "fetch_page_size": 3, "max_results": 5},
+        ),
+    )
+    assert qm.find_issues("(filter=123)") == issues[:5]
+    assert sorted(requests) == [(0, 3), (3, 2), (3, 2)]
+
+
+def test_search_issues_cloud(custom_fields, settings):
+    issues = [
+        Issue(
+            "A-%d" % i,
+            summary="Issue A-%d" % i,
+            issuetype=Value("Story", "story"),
+            status=Value("Backlog", "backlog"),
+            resolution=None,
+            created="2018-01-01 01:01:01",
+            changes=[],
+        )
+        for i in range(1, 12)
+    ]
+
+    requests = []
+
+    class CloudJIRA(JIRA):
+        _is_cloud = True
+
+        def search_issues(self, jql, startAt=0, maxResults=False, **kwargs):
+            requests.append((startAt, maxResults))
+            if startAt > 0:
+                raise JIRAError("The `search` API is deprecated in Jira Cloud")
+            return super().search_issues(jql, startAt, maxResults, **kwargs)
+
+    # The client fetches all pages itself
+    qm = QueryManager(
+        CloudJIRA(fields=custom_fields, issues=issues),
+        extend_dict(settings, {"fetch_concurrency": 4, "fetch_page_size": 3}),
+    )
+    assert qm.find_issues("(filter=123)") == issues
+    assert requests == [(0, None)]
+
+
+def test_shared_session(jira, settings):
+    class Session(object):
+        def request(self, method, url, **kwargs):
+            return None
+
+    jira._session = Session()
+
+    def run(settings):
+        qm = QueryManager(jira, settings)
+        jira._session.request("GET", "/search")
+        return qm
+
+    one = contextvars.Context().run(run, settings)
+    two = contextvars.Context().run(
+        run, extend_dict(settings, {"request_rate": 5})
+    )
+
+    # The scheduler of the first run is kept, with the limits of the
+    # latest run, and requests are counted for each run
+    assert two.scheduler is one.scheduler
+    assert one.scheduler.rate == 5
+    assert one.request_stats["requests"] == 1
+    assert two.request_stats["requests"] == 1
+    assert one.scheduler.stats["requests"] == 2
+
+
+def test_find_required_fields(jira, settings):
+    qm = QueryManager(
+        jira,
+        extend_dict(
+            settings,
+            {
+                "debt_priority_field": "Team",
+                "defects_type_field": "customfield_002",
+                "defects_environment_field": "Unknown field",
+            },
+        ),
+    )
+
+    assert qm.fields == [
+        "summary",
+        "issuetype",
+        "status",
+        "resolution",
+        "resolutiondate",
+        "created",
+        "updated",
+        "customfield_003",
+        "customfield_001",
+        "customfield_002",
+        "customfield_100",
+    ]
+
+    searches = []
+
+    class RecordingJIRA(JIRA):
+        def search_issues(self, jql, *args, **kwargs):
+            searches.append(kwargs)
+            return super().search_issues(jql, *args, **kwargs)
+
+    qm = QueryManager(
+        RecordingJIRA(fields=jira.fields(), issues=jira.issues()), settings
+    )
+    qm.find_issues("(filter=123)")
+    assert searches[0]["fields"] == qm.fields
+
+    qm = QueryManager(jira, extend_dict(settings, {"field_projection": False}))
+    assert qm.fields is None
+
+
+def test_request_fields(jira, settings, caplog):
+    qm = QueryManager(jira, settings)
+    required = list(qm.fields)
+
+    qm.request_fields(["Team", "Flagged", "Unknown field", "customfield_999"])
+    assert qm.fields == required
+
+    qm.request_fields(["Size", "summary"])
+    assert qm.fields == required
+
+    fields = jira.fields() + [{"id": "customfield_205", "name": "Epic"}]
+    qm = QueryManager(JIRA(fields=fields, issues=jira.issues()), settings)
+    qm.request_fields(["Epic"])
+    assert qm.fields == required + ["customfield_205"]
+
+    # Fields can't be added once issues have been fetched
+    qm = QueryManager(JIRA(fields=fields, issues=jira.issues()), settings)
+    qm.find_issues("(filter=123)")
+    with caplog.at_level(logging.WARNING):
+        qm.request_fields(["Epic"])
+    assert qm.fields == required
+    assert "customfield_205" in caplog.text
+
+
+def test_find_issues_reuses_query_results(jira, settings):
+    searches = []
+
+    class RecordingJIRA(JIRA):
+        def search_issues(self, jql, *args, **kwargs):
+            searches.append((jql, kwargs.get("expand")))
+            return super().search_issues(jql, *args, **kwargs)
+
+    qm = QueryManager(
+        RecordingJIRA(fields=jira.fields(), issues=jira.issues()), settings
+    )
+
+    assert qm.find_issues("(filter=123)") == jira.issues()
+    assert qm.find_issues("(filter=123)") == jira.issues()
+    assert qm.find_issues("(filter=123)", expand=None) == jira.issues()
+    assert searches == [("(filter=123)", "changelog")]
+
+    # Different query, or one that needs more than what was fetched before
+    assert qm.find_issues("(filter=124)", expand=None) == jira.issues()
+    assert qm.find_issues("(filter=124)") == jira.issues()
+    assert searches == [
+        ("(filter=123)", "changelog"),
+        ("(filter=124)", None),
+        ("(filter=124)", "changelog"),
+    ]
+
+    assert (qm.query_hits, qm.query_misses) == (2, 3)
+
+    # Callers can't modify the stored results
+    qm.find_issues("(filter=123)").clear()
+    assert qm.find_issues("(filter=123)") == jira.issues()
+
+
+def test_history_window():
+    today = datetime.date(2018, 3, 1)
+
+    assert history_window({}, today) == (0, [])
+
+    # The largest window of the outputs that are enabled, plus a period
+    assert history_window(
+        {
+            "scatterplot_chart": "scatterplot.png",
+            "scatterplot_window": 30,
+            "throughput_chart": "throughput.png",
+            "throughput_window": 6,
+            "throughput_frequency": "1W-MON",
+            "histogram_window": 100,
+            "debt_chart": "debt.png",
+            "debt_window": 1,
+        },
+        today,
+    ) == (59, [])
+
+    # Outputs without a window need the full history
+    assert history_window(
+        {
+            "cycle_time_data": "cycletime.csv",
+            "wip_chart": "wip.png",
+            "wip_frequency": "D",
+            "waste_chart": "waste.png",
+            "waste_window": 2,
+            "waste_frequency": "MS",
+        },
+        today,
+    ) == (90, ["wip_chart", "cycle_time_data"])
+
+
+def test_window_pushdown(jira, settings, caplog):
+    searches = []
+
+    class RecordingJIRA(JIRA):
+        def search_issues(self, jql, *args, **kwargs):
+            searches.append(jql)
+            return super().search_issues(jql, *args, **kwargs)
+
+    settings = extend_dict(
+        settings,
+        {
+            "window_pushdown": True,
+            "scatterplot_chart": "scatterplot.png",
+            "scatterplot_window": 30,
+            "cfd_chart": "cfd.png",
+        },
+    )
+
+    qm = QueryManager(
+        RecordingJIRA(fields=jira.fields(), issues=jira.issues()), settings
+    )
+    assert "cfd_chart use the full history" in caplog.text
+
+    qm.find_issues("project = A ORDER BY rank")
+    assert searches == [
+        "(project = A) AND (resolved >= -31d OR resolution is EMPTY) "
+        "ORDER BY rank"
+    ]
+
+    # Results are still kept by the original query
+    qm.find_issues("project = A ORDER BY rank")
+    assert len(searches) == 1
+
+
+def test_prefetch_concurrently(jira, settings):
+    queries = ["(filter=1)", "(filter=2)", "(filter=3)"]
+
+    # Each query waits for the others to start, so they only succeed if
+    # they are run at the same time
+    barrier = threading.Barrier(len(queries), timeout=5)
+    requests = []
+
+    class SlowJIRA(JIRA):
+        def search_issues(self, jql, *args, **kwargs):
+            requests.append(jql)
+            if jql == "(filter=4)":
+                raise JIRAError(status_code=400)
+            if jql in queries:
+                barrier.wait()
+            return super().search_issues(jql, *args, **kwargs)
+
+    qm = QueryManager(
+        SlowJIRA(fields=jira.fields(), issues=jira._issues),
+        extend_dict(settings, {"query_concurrency": 3}),
+    )
+
+    qm.prefetch([(jql, "changelog") for jql in queries + queries])
+    assert sorted(requests) == queries
+
+    # Queries that have been prefetched aren't run again
+    for jql in queries:
+        assert qm.find_issues(jql) == jira._issues
+    assert len(requests) == 3
+
+    # Failures are ignored until the query is run for real
+    qm.prefetch([("(filter=4)", "changelog"), ("(filter=1)", "changelog")])
+    assert requests[3:] == ["(filter=4)"]
+
+    with pytest.raises(JIRAError):
+        qm.find_issues("(filter=4)")
+
+
+def test_prefetch_in_event_loop(jira, settings):
+    qm = QueryManager(jira, extend_dict(settings, {"query_concurrency": 2}))
+
+    async def run():
+        qm.prefetch([("(filter=1)", "changelog"), ("(filter=2)", "changelog")])
+
+    # E.g. in a notebook
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+    assert qm.find_query_results("(filter=1)", "changelog") == jira._issues
+
+
+def test_prefetch_without_concurrency(jira, settings):
+    qm = QueryManager(jira, settings)
+    qm.prefetch([("(filter=1)", "changelog")])
+
+    assert qm.query_results == {}
+
+
+def test_changelog_index(jira):
+    issue = Issue(
+        "A-1",
+        summary="Issue A-1",
+        issuetype=Value("Story", "story"),
+        status=Value("Done", "done"),
+        resolution=None,
+        created="2018-01-01T01:01:01.000+0100",
+        changes=[
+            Change(
+                "2018-01-03T01:01:01.000+0100",
+                [("status", "Next", "Done"), ("Team", "Team 1", "Team 2")],
+            ),
+            Change(
+                "2018-01-02T01:01:01.000-0500", [("status", "Backlog", "Next")]
+            ),
+            Change("2018-01-02T03:01:01.000+0100", [("Team", None, "Team 1")]),
+        ],
+    )
+
+    index = ChangelogIndex.for_issue(issue)
+    assert ChangelogIndex.for_issue(issue) is index
+
+    assert index.first_item("status").toString == "Next"
+    assert index.first_item("Team").toString == "Team 1"
+    assert index.first_item("Flagged") is None
+
+    # Sorted by actual time, but dates are reported without the timezone
+    assert [
+        (date, item.field, item.toString)
+        for date, item in index.iter_items(["status", "Team"])
+    ] == [
+        (datetime.datetime(2018, 1, 2, 3, 1, 1), "Team", "Team 1"),
+        (datetime.datetime(2018, 1, 2, 1, 1, 1), "status", "Next"),
+        (datetime.datetime(2018, 1, 3, 1, 1, 1), "status", "Done"),
+        (datetime.datetime(2018, 1, 3, 1, 1, 1), "Team", "Team 2"),
+    ]
+    assert [
+        item.toString for _, item in index.iter_items(["status", "status"])
+    ] == ["Next", "Done"]
+
+
+def test_issue_snapshot_equality():
+    date = datetime.datetime(2018, 1, 1, 1, 1, 1)
+    snapshot = IssueSnapshot("status", "A-1", date, None, "Backlog")
+
+    assert snapshot == IssueSnapshot("status", "A-1", date, None, "Backlog")
+    assert snapshot != IssueSnapshot("status", "A-1", date, None, "Next")
+    assert snapshot != IssueSnapshot(
+        "status", "A-1", date.replace(tzinfo=dateutil.tz.UTC), None, "Backlog"
+    )
+
+    with pytest.raises(AttributeError):
+        snapshot.other = None
+
+
+def test_field_name_to_id(custom_fields, settings, caplog):
+    qm = QueryManager(
+        JIRA(
+            fields=custom_fields
+            + [
+                {"id": "customfield_100", "name": "TEAM"},
+                {"id": "customfield_101", "name": "Status"},
+            ],
+            issues=[],
+        ),
+        settings,
+    )
+
+    assert qm.field_name_to_id("status") == "status"
+    assert qm.field_name_to_id("Status") == "status"
+    assert qm.field_name_to_id("size") == "customfield_002"
+
+    # The first field wins, with a warning (only once, when resolving the
+    # `Team` attribute)
+    assert qm.field_name_to_id("team") == "customfield_001"
+    assert qm.field_name_to_id("Team") == "customfield_001"
+    assert (
+        len([r for r in caplog.records if "more than one" in r.getMessage()])
+        == 1
+    )
+
+    with pytest.raises(ConfigError):
+        qm.field_name_to_id("Unknown")
+
+
+def test_fields_cached(custom_fields, settings, tmp_path):
+    calls = []
+
+    class CountingJIRA(JIRA):
+        def fields(self):
+            calls.append(True)
+            return super().fields()
+
+    settings = extend_dict(settings, {"cache_directory": str(tmp_path)})
+
+    QueryManager(CountingJIRA(fields=list(custom_fields), issues=[]), settings)
+    assert len(calls) == 1
+
+    # Field list is read from the cache on subsequent runs...
+    jira = CountingJIRA(fields=list(custom_fields), issues=[])
+    qm = QueryManager(jira, settings)
+    assert len(calls) == 1
+    assert qm.field_name_to_id("Team") == "customfield_001"
+
+    # ...and fetched again if a field can't be found
+    jira._fields.append({"id": "customfield_100", "name": "New field"})
+    assert qm.field_name_to_id("New field") == "customfield_100"
+    assert len(calls) == 2
+
+    qm = QueryManager(jira, settings)
+    assert qm.field_name_to_id("New field") == "customfield_100"
+    assert len(calls) == 2
+
+
+def test_status_names(custom_fields, settings, tmp_path):
+    calls = []
+
+    class StatusJIRA(JIRA):
+        statuses = [{"id": "10", "name": "Next"}, {"id": "20", "name": "QA"}]
+
+        def _get_json(self, path, params=None):
+            assert path == "status"
+            calls.append(path)
+            if self.statuses is None:
+                raise JIRAError(status_code=403)
+            return self.statuses
+
+    settings = extend_dict(settings, {"cache_directory": str(tmp_path)})
+
+    # Statuses are fetched once per run...
+    qm = QueryManager(StatusJIRA(fields=custom_fields, issues=[]), settings)
+    assert qm.status_names() == {"10": "Next", "20": "QA"}
+    assert qm.status_names() == {"10": "Next", "20": "QA"}
+    assert len(calls) == 1
+
+    # ...and read from the metadata cache on subsequent runs
+    qm = QueryManager(StatusJIRA(fields=custom_fields, issues=[]), settings)
+    assert qm.status_names() == {"10": "Next", "20": "QA"}
+    assert len(calls) == 1
+
+    # Without the list of statuses, statuses are only mapped by name
+    jira = StatusJIRA(fields=custom_fields, issues=[])
+    jira.statuses = None
+    qm = QueryManager(jira, extend_dict(settings, {"cache_directory": None}))
+    assert qm.status_names() == {}
+    assert len(calls) == 2
+
+
+def test_iter_issues_streaming(custom_fields, settings):
+    issues = [
+        Issue(
+            "A-%d" % i,
+            summary="Issue A-%d" % i,
+            issuetype=Value("Story", "story"),
+            status=Value("Backlog", "backlog"),
+            resolution=None,
+            created="2018-01-01 01:01:01",
+            changes=[],
+        )
+        for i in range(1, 8)
+    ]
+
+    requests = []
+
+    class PagingJIRA(JIRA):
+        def search_issues(self, jql, startAt=0, maxResults=False, **kwargs):
+            requests.append((startAt, maxResults))
+            return super().search_issues(jql, startAt, maxResults, **kwargs)
+
+    jira = PagingJIRA(fields=custom_fields, issues=issues)
+    settings = extend_dict(
+        settings, {"stream_issues": True, "fetch_page_size": 3}
+    )
+
+    qm = QueryManager(jira, settings)
+    stream = qm.iter_issues("(filter=123)")
+
+    # Pages are fetched as they are needed
+    assert next(stream) == issues[0]
+    assert requests == [(0, 3)]
+
+    assert list(stream) == issues[1:]
+    assert requests == [(0, 3), (3, 3), (6, 3)]
+    assert qm.query_results == {}
+
+    # Limited by `max_results`
+    requests.clear()
+    qm = QueryManager(jira, extend_dict(settings, {"max_results": 4}))
+    assert list(qm.iter_issues("(filter=123)")) == issues[:4]
+    assert requests == [(0, 3), (3, 1)]
+
+    # Results already fetched are used
+    requests.clear()
+    qm.add_query_results("(filter=123)", issues[:2])
+    assert list(qm.iter_issues("(filter=123)")) == issues[:2]
+    assert requests == []
+
+    # JIRA Cloud pages through results with a token
+    class CloudJIRA(JIRA):
+        _is_cloud = True
+
+        def search_issues(self, jql, startAt=0, maxResults=False, **kwargs):
+            raise JIRAError("The `search` API is deprecated in Jira Cloud")
+
+        def enhanced_search_issues(
+            self, jql, nextPageToken=None, maxResults=50, **kwargs
+        ):
+            requests.append((nextPageToken, maxResults))
+            start_at = int(nextPageToken or 0)
+            page = super().search_issues(jql, start_at, maxResults)
+            end = start_at + len(page)
+            page.nextPageToken = str(end) if end < len(issues) else None
+            return page
+
+    requests.clear()
+    qm = QueryManager(CloudJIRA(fields=custom_fields, issues=issues), settings)
+    assert list(qm.iter_issues("(filter=123)")) == issues
+    assert requests == [(None, 3), ("3", 3), ("6", 3)]
+
+
+def test_complete_changelogs(custom_fields, settings):
+    issues = [
+        Issue(
+            "A-%d" % i,
+            summary="Issue A-%d" % i,
+            issuetype=Value("Story", "story"),
+            status=Value("Done", "done"),
+            resolution=None,
+            created="2018-01-01 01:01:01",
+            changes=[
+                Change(
+                    "2018-01-%02d 01:01:01" % (day + 2),
+                    [("status", "Status %d" % day, "Status %d" % (day + 1))],
+                )
+                for day in range(i * 2)
+            ],
+        )
+        for i in range(1, 4)
+    ]
+    by_key = {issue.key: issue for issue in issues}
+
+    requests = []
+
+    class TruncatingJIRA(JIRA):
+        """Returns at most 3 changes per issue in search results, and up to
+        2 at a time from the changelog resource, which only exists with
+        `changelog_resource` (as on JIRA Cloud).
+        """
+
+        changelog_resource = True
+
+        def search_issues(self, jql, startAt=0, maxResults=False, **kwargs):
+            result = super().search_issues(jql, startAt, maxResults, **kwargs)
+            for i, issue in enumerate(result):
+                raw = issue.raw
+                histories = raw["changelog"]["histories"]
+                raw["changelog"] = {
+                    "startAt": 0,
+                    "maxResults": 3,
+                    "total": len(histories),
+                    "histories": histories[-3:],
+                }
+                result[i] = JIRAIssue(self._options, None, raw=raw)
+            return result
+
+        def _get_json(self, path, params=None):
+            requests.append(path)
+            _, key, resource = (path.split("/") + [None])[:3]
+            histories = by_key[key].raw["changelog"]["histories"]
+
+            if resource is None:
+                return {"key": key, "changelog": {"histories": histories}}
+            if not self.changelog_resource:
+                raise JIRAError(status_code=404)
+
+            start, end = params["startAt"], params["startAt"] + 2
+            return {
+                "startAt": start,
+                "maxResults": 2,
+                "total": len(histories),
+                "isLast": end >= len(histories),
+                "values": histories[start:end],
+            }
+
+    jira = TruncatingJIRA(fields=custom_fields, issues=issues)
+    qm = QueryManager(jira, settings)
+    found = qm.find_issues("(filter=123)")
+
+    assert [issue.key for issue in found] == ["A-1", "A-2", "A-3"]
+    for issue in found:
+        assert list(qm.iter_changes(issue, ["status"])) == list(
+            qm.iter_changes(by_key[issue.key], ["status"])
+        )
+
+    # A-1 has only 2 changes, so it isn't truncated
+    assert sorted(requests) == [
+        "issue/A-2/changelog",
+        "issue/A-2/changelog",
+        "issue/A-3/changelog",
+        "issue/A-3/changelog",
+        "issue/A-3/changelog",
+    ]
+
+    # Without the changelog resource, the issue resource is used. The
+    # changelog resource is only asked for once.
+    requests.clear()
+    jira.changelog_resource = False
+    qm = QueryManager(jira, extend_dict(settings, {"fetch_concurrency": 1}))
+    found = qm.find_issues("(filter=123)")
+
+    for issue in found:
+        assert list(qm.iter_changes(issue, ["status"])) == list(
+            qm.iter_changes(by_key[issue.key], ["status"])
+        )
+    assert requests == ["issue/A-2/changelog", "issue/A-2", "issue/A-3"]
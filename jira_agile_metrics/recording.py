@@ -0,0 +1,229 @@
+import gzip
+import json
+import logging
+
+from jira import JIRAError
+from jira.client import ResultList
+from jira.resources import Issue
+
+from .config import ConfigError
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_VERSION = 1
+
+
+def search_key(jql, startAt=0, maxResults=False, fields=None, expand=None):
+    """Return a string identifying a call to `search_issues()`"""
+    if isinstance(fields, str):
+        fields = fields.split(",")
+
+    return json.dumps(
+        [jql, startAt or 0, maxResults or None, fields, expand],
+        sort_keys=True,
+    )
+
+
+class RecordingJIRA(object):
+    """Wraps a JIRA client, recording everything fetched through it, so that
+    it can be saved to an archive with `save()` and replayed later with
+    `ReplayJIRA`. Supports the parts of the JIRA API used by `QueryManager`.
+    """
+
+    def __init__(self, jira):
+        self.jira = jira
+        self.searches = {}
+        self.resources = {}
+        self._client_info = None
+        self._fields = None
+
+    @property
+    def _options(self):
+        return self.jira._options
+
+    @property
+    def _session(self):
+        return self.jira._session
+
+    @property
+    def _is_cloud(self):
+        return getattr(self.jira, "_is_cloud", False)
+
+    @property
+    def deploymentType(self):
+        return getattr(self.jira, "deploymentType", None)
+
+    @deploymentType.setter
+    def deploymentType(self, value):
+        self.jira.deploymentType = value
+
+    def client_info(self):
+        self._client_info = self.jira.client_info()
+        return self._client_info
+
+    def fields(self):
+        self._fields = self.jira.fields()
+        return self._fields
+
+    def search_issues(
+        self, jql, startAt=0, maxResults=False, fields=None, expand=None
+    ):
+        options = {"expand": expand}
+        if fields is not None:
+            options["fields"] = fields
+
+        issues = self.jira.search_issues(
+            jql, startAt=startAt, maxResults=maxResults, **options
+        )
+
+        self.searches[search_key(jql, startAt, maxResults, fields, expand)] = {
+            "total": getattr(issues, "total", len(issues)),
+            "issues": [issue.raw for issue in issues],
+        }
+
+        return issues
+
+    def _get_json(self, path, params=None):
+        key = json.dumps([path, params], sort_keys=True)
+        try:
+            result = self.jira._get_json(path, params=params)
+        except JIRAError as e:
+            self.resources[key] = {"status_code": e.status_code}
+            raise
+
+        self.resources[key] = {"json": result}
+        return result
+
+    def server_info(self):
+        """Return what is known about the JIRA server: its version, its
+        deployment type and whether it is JIRA Cloud.
+        """
+        version = getattr(self.jira, "_version", None)
+        return {
+            "versionNumbers": list(version) if version is not None else None,
+            "deploymentType": self.deploymentType,
+            "isCloud": bool(self._is_cloud),
+        }
+
+    def save(self, filename):
+        """Write everything recorded so far to the archive `filename`. The
+        list of statuses is always included, as it is only fetched from
+        JIRA if it isn't in the metadata cache.
+        """
+        logger.info(
+            "Writing %d recorded searches to %s", len(self.searches), filename
+        )
+
+        if json.dumps(["status", None]) not in self.resources:
+            try:
+                self._get_json("status")
+            except JIRAError:
+                pass
+
+        with gzip.open(filename, "wt", encoding="utf-8") as archive:
+            json.dump(
+                {
+                    "version": ARCHIVE_VERSION,
+                    "client_info": self._client_info
+                    or self.jira.client_info(),
+                    "server_info": self.server_info(),
+                    "fields": self._fields
+                    if self._fields is not None
+                    else self.jira.fields(),
+                    "searches": self.searches,
+                    "resources": self.resources,
+                },
+                archive,
+            )
+
+
+class ReplayJIRA(object):
+    """A stand-in for a JIRA client that answers the calls made by
+    `QueryManager` from an archive written by `RecordingJIRA`, without any
+    network access. Searches that were not recorded raise `ConfigError`.
+    """
+
+    def __init__(
+        self, client_info, fields, searches, resources=None, server_info=None
+    ):
+        self._options = {"server": client_info}
+        self._session = None
+        self._fields = fields
+        self.searches = searches
+        self.resources = resources or {}
+
+        # Behave like the recorded client, e.g. paging through results in
+        # the same way on JIRA Cloud
+        server_info = server_info or {}
+        if server_info.get("versionNumbers") is not None:
+            self._version = tuple(server_info["versionNumbers"])
+        self.deploymentType = server_info.get("deploymentType")
+        self._is_cloud = server_info.get("isCloud", False)
+
+    @classmethod
+    def load(cls, filename):
+        logger.info("Replaying JIRA responses from %s", filename)
+
+        try:
+            with gzip.open(filename, "rt", encoding="utf-8") as archive:
+                data = json.load(archive)
+        except (OSError, ValueError):
+            raise ConfigError(
+                "Could not read JIRA archive `%s`." % filename
+            ) from None
+
+        if data.get("version") != ARCHIVE_VERSION:
+            raise ConfigError(
+                "JIRA archive `%s` has an unsupported version." % filename
+            )
+
+        return cls(
+            data["client_info"],
+            data["fields"],
+            data["searches"],
+            data.get("resources"),
+            data.get("server_info"),
+        )
+
+    def client_info(self):
+        return self._options["server"]
+
+    def fields(self):
+        if self._fields is None:
+            raise ConfigError("No field data recorded in JIRA archive.")
+        return self._fields
+
+    def search_issues(
+        self, jql, startAt=0, maxResults=False, fields=None, expand=None
+    ):
+        try:
+            result = self.searches[
+                search_key(jql, startAt, maxResults, fields, expand)
+            ]
+        except KeyError:
+            raise ConfigError(
+                "Query `%s` was not recorded in the JIRA archive. Record the "
+                "archive again with the current configuration." % jql
+            ) from None
+
+        return ResultList(
+            [
+                Issue(self._options, self._session, raw=raw)
+                for raw in result["issues"]
+            ],
+            _startAt=startAt,
+            _maxResults=maxResults or 0,
+            _total=result["total"],
+        )
+
+    def _get_json(self, path, params=None):
+        try:
+            result = self.resources[json.dumps([path, params], sort_keys=True)]
+        except KeyError:
+            raise ConfigError(
+                "Resource `%s` was not recorded in the JIRA archive." % path
+            ) from None
+
+        if "status_code" in result:
+            raise JIRAError(status_code=result["status_code"])
+        return result["json"]
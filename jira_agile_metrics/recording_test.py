@@ -0,0 +1,161 @@
+import logging
+import pytest
+
+from .conftest import (
+    FauxJIRA as JIRA,
+    FauxIssue as Issue,
+    FauxChange as Change,
+    FauxFieldValue as Value,
+)
+
+from .calculators.cycletime import CycleTimeCalculator
+from .config import ConfigError
+from .querymanager import QueryManager
+from .recording import RecordingJIRA, ReplayJIRA
+from .utils import extend_dict
+
+
+@pytest.fixture
+def jira(custom_fields):
+    return JIRA(
+        fields=custom_fields,
+        issues=[
+            Issue(
+                "A-%d" % i,
+                summary="Issue A-%d" % i,
+                issuetype=Value("Story", "story"),
+                status=Value("Next", "next"),
+                resolution=None,
+                resolutiondate=None,
+                created="2018-01-01 01:01:01",
+                customfield_001="Team %d" % i,
+                customfield_002=Value(None, 10),
+                customfield_003=Value(None, ["R2", "R3"]),
+                changes=[
+                    Change(
+                        "2018-01-02 01:01:01", [("status", "Backlog", "Next")]
+                    )
+                ],
+            )
+            for i in range(1, 6)
+        ],
+    )
+
+
+def test_record_and_replay(jira, custom_settings, tmp_path):
+    archive = str(tmp_path / "archive.jam")
+    settings = extend_dict(
+        custom_settings, {"fetch_concurrency": 2, "fetch_page_size": 2}
+    )
+
+    recorder = RecordingJIRA(jira)
+    qm = QueryManager(recorder, settings)
+    recorded = qm.find_issues("(filter=123)")
+    recorder.save(archive)
+
+    replay = ReplayJIRA.load(archive)
+    assert replay.client_info() == "https://example.org"
+    assert replay.fields() == jira.fields()
+
+    qm = QueryManager(replay, settings)
+    replayed = qm.find_issues("(filter=123)")
+
+    assert [i.key for i in replayed] == [i.key for i in recorded]
+    for recorded_issue, replayed_issue in zip(recorded, replayed):
+        for attribute in ["Team", "Estimate", "Release"]:
+            assert qm.resolve_attribute_value(
+                replayed_issue, attribute
+            ) == qm.resolve_attribute_value(recorded_issue, attribute)
+        assert list(qm.iter_changes(replayed_issue, ["status"])) == list(
+            qm.iter_changes(recorded_issue, ["status"])
+        )
+
+    with pytest.raises(ConfigError):
+        qm.find_issues("(filter=124)")
+
+
+def test_replay_invalid_archive(tmp_path):
+    archive = tmp_path / "archive.jam"
+    archive.write_text("not an archive")
+
+    with pytest.raises(ConfigError):
+        ReplayJIRA.load(str(archive))
+
+
+def test_record_cloud(jira, custom_settings):
+    jira.deploymentType = "Cloud"
+    jira._is_cloud = True
+
+    recorder = RecordingJIRA(jira)
+    assert recorder.deploymentType == "Cloud"
+    assert recorder._is_cloud
+
+    qm = QueryManager(
+        recorder, extend_dict(custom_settings, {"lean_issues": True})
+    )
+    assert not qm.lean_issues
+
+    recorder.deploymentType = "Server"
+    assert jira.deploymentType == "Server"
+
+
+def test_replay_cloud(jira, custom_settings, tmp_path):
+    archive = str(tmp_path / "archive.jam")
+    settings = extend_dict(
+        custom_settings, {"fetch_concurrency": 2, "fetch_page_size": 2}
+    )
+
+    jira.deploymentType = "Cloud"
+    jira._is_cloud = True
+    jira._version = (1001, 0, 0)
+
+    recorder = RecordingJIRA(jira)
+    recorded = QueryManager(recorder, settings).find_issues("(filter=123)")
+    recorder.save(archive)
+
+    # Pages are fetched one after another on JIRA Cloud, as they were when
+    # recording
+    replay = ReplayJIRA.load(archive)
+    assert replay._is_cloud
+    assert replay.deploymentType == "Cloud"
+    assert replay._version == (1001, 0, 0)
+
+    replayed = QueryManager(replay, settings).find_issues("(filter=123)")
+    assert [i.key for i in replayed] == [i.key for i in recorded]
+
+
+def test_record_statuses(jira, custom_settings, tmp_path):
+    archive = str(tmp_path / "archive.jam")
+    for issue in jira.issues():
+        issue.fields.status.id = "10"
+
+    # The statuses are saved even if they were not fetched while recording
+    recorder = RecordingJIRA(jira)
+    QueryManager(recorder, custom_settings).find_issues("(filter=123)")
+    recorder.save(archive)
+
+    qm = QueryManager(ReplayJIRA.load(archive), custom_settings)
+    assert qm.status_names() == {"10": "Next"}
+
+
+def test_replay_without_statuses(jira, custom_settings, tmp_path, caplog):
+    archive = str(tmp_path / "archive.jam")
+    for issue in jira.issues():
+        issue.fields.status.id = "10"
+
+    recorder = RecordingJIRA(jira)
+    QueryManager(recorder, custom_settings).find_issues("(filter=123)")
+    recorder.save(archive)
+
+    # As recorded before the list of statuses was kept in archives
+    replay = ReplayJIRA.load(archive)
+    replay.resources.clear()
+
+    qm = QueryManager(replay, custom_settings)
+    with caplog.at_level(logging.WARNING):
+        assert qm.status_names() == {}
+    assert "Could not fetch the list of statuses" in caplog.text
+
+    # Statuses are still mapped by name
+    data = CycleTimeCalculator(qm, custom_settings, {}).run()
+    assert data["Committed"].notnull().all()
@@ -0,0 +1,368 @@
+import contextlib
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Priority classes for requests. Requests with a lower value go first when
+# more requests are waiting than the scheduler lets through.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# HTTP status codes that mean JIRA wants us to slow down
+THROTTLED_STATUS_CODES = (429, 503)
+
+# How long to pause all requests after being throttled, if JIRA doesn't
+# say. Doubled for each consecutive retry of the same request.
+THROTTLED_RETRY_DELAY = 1.0
+
+# Requests taking more than this many times the (moving) average time are
+# taken as a sign that JIRA is under load
+LATENCY_TOLERANCE = 3.0
+LATENCY_SMOOTHING = 0.2
+
+_priority = contextvars.ContextVar("request_priority", default=PRIORITY_NORMAL)
+
+# Counters of the requests made in this context, e.g. for one run, as
+# opposed to all the requests made through a scheduler
+_run_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """Make requests in this context (and in worker threads started with
+    `in_current_context()`) with the given priority.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+def new_stats():
+    """Return a dict of request counters, all zero"""
+    return {
+        "requests": 0,
+        "bytes": 0,
+        "retries": 0,
+        "errors": 0,
+        "throttled_seconds": 0.0,
+    }
+
+
+def count_requests():
+    """Count the requests made from now on in this context (and in worker
+    threads started with `in_current_context()`), e.g. for one run, in a new
+    dict of counters, and return it. The requests are counted by the
+    scheduler that makes them, as well as in its own `stats`.
+    """
+    stats = new_stats()
+    _run_stats.set(stats)
+    return stats
+
+
+def summarize_stats(stats):
+    """Return a description of the request counters in `stats`"""
+    return (
+        "%(requests)d requests to JIRA, %(bytes)d bytes received, "
+        "%(retries)d retries, %(errors)d errors, "
+        "%(throttled_seconds).1f seconds throttled" % stats
+    )
+
+
+def in_current_context(function):
+    """Return a function that calls `function` in a copy of the current
+    context, so that the request priority carries over to worker threads.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+
+    return wrapper
+
+
+class RequestScheduler(object):
+    """Schedule the HTTP requests made to JIRA:
+
+    - At most `rate` requests per second are started (if set), with bursts
+      of up to `burst` requests (a token bucket).
+    - The number of requests in flight is limited. The limit adapts to how
+      JIRA is coping (additive increase, multiplicative decrease): it grows
+      slowly while requests succeed quickly, between `min_concurrency` and
+      `max_concurrency`, and is cut when JIRA throttles us (HTTP 429 or 503)
+      or responds much more slowly than usual.
+    - When JIRA throttles a request, all requests are paused for as long as
+      JIRA asks (`Retry-After`), and the request is retried up to
+      `max_retries` times.
+    - Waiting requests are let through in order of priority (see
+      `request_priority()`), then in the order they were made.
+
+    Counters of the requests made are kept in `stats`, and in the counters
+    of the current context, if any (see `count_requests()`).
+    """
+
+    def __init__(
+        self,
+        rate=None,
+        burst=None,
+        min_concurrency=1,
+        max_concurrency=8,
+        initial_concurrency=None,
+        max_retries=5,
+        clock=time.monotonic,
+    ):
+        self.rate = rate
+        self.burst = burst or max(1, rate or 1)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max(min_concurrency, max_concurrency)
+        self.limit = float(
+            initial_concurrency
+            if initial_concurrency is not None
+            else min(4, self.max_concurrency)
+        )
+        self.max_retries = max_retries
+        self.clock = clock
+
+        self.condition = threading.Condition()
+        self.waiting = []  # heap of (priority, sequence)
+        self.sequence = itertools.count()
+        self.active = 0
+
+        self.tokens = float(self.burst)
+        self.refilled = clock()
+        self.paused_until = 0.0
+        self.latency = None
+
+        self.stats = new_stats()
+
+    def install(self, session):
+        """Send all requests made with the `requests` session `session`
+        through this scheduler, and return the scheduler. The session's own
+        retries are turned off, since the scheduler retries throttled
+        requests itself. If the session already has a scheduler, e.g.
+        because its client is shared by several runs, that one is kept and
+        returned instead, so that all requests made with the session share
+        the same limits. If this scheduler has different limits, the
+        session's scheduler takes them on, with a warning.
+        """
+        scheduler = getattr(session, "request_scheduler", None)
+        if scheduler is not None:
+            if scheduler.limits() != self.limits():
+                logger.warning(
+                    "Changing the limits of a connection to JIRA shared "
+                    "with other runs from %s to %s",
+                    scheduler.describe_limits(),
+                    self.describe_limits(),
+                )
+                scheduler.set_limits(*self.limits())
+            return scheduler
+
+        session.request = functools.partial(self.call, session.request)
+        session.request_scheduler = self
+
+        if hasattr(session, "max_retries"):
+            session.max_retries = 0
+
+        return self
+
+    def limits(self):
+        """Return the scheduler's `(rate, burst, min_concurrency,
+        max_concurrency)`
+        """
+        return (
+            self.rate,
+            self.burst,
+            self.min_concurrency,
+            self.max_concurrency,
+        )
+
+    def describe_limits(self):
+        return "%s requests per second and %d concurrent requests" % (
+            "%g" % self.rate if self.rate is not None else "unlimited",
+            self.max_concurrency,
+        )
+
+    def set_limits(self, rate, burst, min_concurrency, max_concurrency):
+        """Change the limits given when the scheduler was made. Requests
+        already in flight are not affected.
+        """
+        with self.condition:
+            self.rate = rate
+            self.burst = burst
+            self.tokens = min(self.tokens, float(burst))
+            self.min_concurrency = min_concurrency
+            self.max_concurrency = max(min_concurrency, max_concurrency)
+            self.limit = min(
+                max(self.limit, self.min_concurrency), self.max_concurrency
+            )
+            self.condition.notify_all()
+
+    def count(self, name, amount=1):
+        """Add `amount` to the counter `name`, in `stats` and in the counters
+        of the current context, if any. Call with `condition` held.
+        """
+        self.stats[name] += amount
+
+        run_stats = _run_stats.get()
+        if run_stats is not None:
+            run_stats[name] += amount
+
+    def call(self, function, *args, **kwargs):
+        """Call `function` (which makes a request) when the scheduler
+        allows it, retrying if JIRA throttles it.
+        """
+
+        priority = current_priority()
+        delay = THROTTLED_RETRY_DELAY
+
+        for attempt in itertools.count(1):
+            self.acquire(priority)
+            start = self.clock()
+
+            error = None
+            try:
+                response = function(*args, **kwargs)
+            except Exception as e:
+                error = e
+                response = getattr(e, "response", None)
+                status_code = getattr(e, "status_code", None)
+            else:
+                status_code = getattr(response, "status_code", None)
+
+            throttled = status_code in THROTTLED_STATUS_CODES
+            self.release(self.clock() - start, throttled, response)
+
+            if not throttled or attempt > self.max_retries:
+                if error is not None:
+                    with self.condition:
+                        self.count("errors")
+                    raise error
+                return response
+
+            wait = retry_after(response, delay)
+            logger.warning(
+                "JIRA is throttling requests (HTTP %d). Pausing for %.1f "
+                "seconds",
+                status_code,
+                wait,
+            )
+            self.pause(wait)
+            delay *= 2
+
+            with self.condition:
+                self.count("retries")
+
+    def acquire(self, priority):
+        """Wait until a request with the given priority may be made"""
+
+        with self.condition:
+            ticket = (priority, next(self.sequence))
+            heapq.heappush(self.waiting, ticket)
+
+            while True:
+                timeout = None
+
+                if self.waiting[0] == ticket and self.active < int(self.limit):
+                    now = self.clock()
+                    self.refill(now)
+
+                    if now < self.paused_until:
+                        timeout = self.paused_until - now
+                    elif self.tokens < 1:
+                        timeout = (1 - self.tokens) / self.rate
+                    else:
+                        break
+
+                self.condition.wait(timeout)
+
+            heapq.heappop(self.waiting)
+            self.active += 1
+            self.tokens -= 1
+            self.count("requests")
+            self.condition.notify_all()
+
+    def release(self, latency, throttled=False, response=None):
+        """Record the end of a request, adjusting the concurrency limit"""
+
+        with self.condition:
+            self.active -= 1
+
+            content = getattr(response, "content", None)
+            if isinstance(content, bytes):
+                self.count("bytes", len(content))
+
+            if throttled:
+                self.decrease(0.5)
+            elif (
+                self.latency is not None
+                and latency > LATENCY_TOLERANCE * self.latency
+            ):
+                self.decrease(0.75)
+            else:
+                self.limit = min(
+                    self.max_concurrency, self.limit + 1 / self.limit
+                )
+
+            if not throttled:
+                self.latency = (
+                    latency
+                    if self.latency is None
+                    else self.latency
+                    + LATENCY_SMOOTHING * (latency - self.latency)
+                )
+
+            self.condition.notify_all()
+
+    def decrease(self, factor):
+        self.limit = max(self.min_concurrency, self.limit * factor)
+
+    def pause(self, seconds):
+        """Stop making requests for `seconds`"""
+
+        with self.condition:
+            now = self.clock()
+            until = now + seconds
+
+            if until > self.paused_until:
+                self.count(
+                    "throttled_seconds", until - max(now, self.paused_until)
+                )
+                self.paused_until = until
+
+            self.condition.notify_all()
+
+    def refill(self, now):
+        """Add the tokens accrued since the last refill to the bucket"""
+
+        if self.rate is None:
+            self.tokens = float(self.burst)
+        else:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.refilled) * self.rate
+            )
+        self.refilled = now
+
+    def summary(self):
+        return summarize_stats(self.stats)
+
+
+def retry_after(response, default):
+    """Return the number of seconds to wait before retrying as given by
+    the `Retry-After` header of `response`, or `default`.
+    """
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After")
+    return float(value) if value and value.isdigit() else default
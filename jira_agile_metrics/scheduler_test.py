@@ -0,0 +1,275 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from .scheduler import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    RequestScheduler,
+    count_requests,
+    current_priority,
+    in_current_context,
+    request_priority,
+    retry_after,
+    summarize_stats,
+)
+
+
+class Response(object):
+    def __init__(self, status_code=200, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class ThrottledError(Exception):
+    def __init__(self, retry_after=None):
+        self.status_code = 429
+        self.response = Response(
+            429,
+            headers={"Retry-After": retry_after} if retry_after else None,
+        )
+
+
+def test_request_priority():
+    assert current_priority() == PRIORITY_NORMAL
+
+    with request_priority(PRIORITY_LOW):
+        assert current_priority() == PRIORITY_LOW
+        function = in_current_context(current_priority)
+
+    assert current_priority() == PRIORITY_NORMAL
+
+    # The priority carries over to other threads
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()))
+    thread.start()
+    thread.join()
+    assert result == [PRIORITY_LOW]
+
+
+def test_retry_after():
+    assert retry_after(Response(headers={"Retry-After": "3"}), 1.0) == 3.0
+    assert retry_after(Response(headers={"Retry-After": "soon"}), 1.0) == 1.0
+    assert retry_after(None, 2.0) == 2.0
+
+
+def test_call_counts_requests():
+    scheduler = RequestScheduler()
+
+    response = scheduler.call(lambda: Response(content=b"12345"))
+    assert response.status_code == 200
+
+    with pytest.raises(ValueError):
+        scheduler.call(lambda: int("x"))
+
+    assert scheduler.stats == {
+        "requests": 2,
+        "bytes": 5,
+        "retries": 0,
+        "errors": 1,
+        "throttled_seconds": 0.0,
+    }
+
+
+def test_call_retries_throttled_requests():
+    scheduler = RequestScheduler(max_retries=2)
+    scheduler.limit = 4.0
+
+    attempts = []
+
+    def throttled_once():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise ThrottledError("0")
+        return Response(content=b"ok")
+
+    assert scheduler.call(throttled_once).content == b"ok"
+    assert len(attempts) == 2
+    assert scheduler.stats["retries"] == 1
+
+    # Throttling halves the concurrency limit
+    assert scheduler.limit < 4.0
+
+    # Gives up eventually
+    def always_throttled():
+        raise ThrottledError("0")
+
+    with pytest.raises(ThrottledError):
+        scheduler.call(always_throttled)
+
+    assert scheduler.stats["retries"] == 3
+    assert scheduler.stats["errors"] == 1
+    assert scheduler.limit == 1.0
+
+
+def test_pause():
+    now = [100.0]
+    scheduler = RequestScheduler(clock=lambda: now[0])
+
+    scheduler.pause(5)
+    scheduler.pause(2)
+    assert scheduler.paused_until == 105.0
+    assert scheduler.stats["throttled_seconds"] == 5.0
+
+    now[0] = 104.0
+    scheduler.pause(5)
+    assert scheduler.paused_until == 109.0
+    assert scheduler.stats["throttled_seconds"] == 9.0
+
+
+def test_adaptive_concurrency():
+    scheduler = RequestScheduler(max_concurrency=6, initial_concurrency=2)
+
+    # Additive increase while requests are quick...
+    for _ in range(20):
+        scheduler.acquire(PRIORITY_NORMAL)
+        scheduler.release(0.1)
+    assert 5.0 < scheduler.limit <= 6.0
+
+    # ...up to the maximum
+    for _ in range(50):
+        scheduler.acquire(PRIORITY_NORMAL)
+        scheduler.release(0.1)
+    assert scheduler.limit == 6.0
+
+    # Multiplicative decrease when they become slow, or are throttled
+    scheduler.acquire(PRIORITY_NORMAL)
+    scheduler.release(1.0)
+    assert scheduler.limit == 4.5
+
+    scheduler.acquire(PRIORITY_NORMAL)
+    scheduler.release(0.1, throttled=True)
+    assert scheduler.limit == 2.25
+
+
+def test_token_bucket():
+    scheduler = RequestScheduler(rate=50, burst=2, max_concurrency=8)
+
+    start = time.monotonic()
+    for _ in range(7):
+        scheduler.acquire(PRIORITY_NORMAL)
+        scheduler.release(0)
+
+    # Two requests in the initial burst, then one every 20ms
+    assert time.monotonic() - start >= 0.09
+
+
+def test_priority_order():
+    scheduler = RequestScheduler(max_concurrency=1, initial_concurrency=1)
+    order = []
+
+    # Hold the only slot while requests queue up
+    scheduler.acquire(PRIORITY_NORMAL)
+
+    def request(name, priority):
+        with request_priority(priority):
+            scheduler.call(lambda: order.append(name))
+
+    threads = []
+    for name, priority in [
+        ("low", PRIORITY_LOW),
+        ("normal", PRIORITY_NORMAL),
+        ("high", PRIORITY_HIGH),
+    ]:
+        thread = threading.Thread(target=request, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+
+        # Wait for the request to be queued
+        while len(scheduler.waiting) < len(threads):
+            time.sleep(0.001)
+
+    scheduler.release(0)
+    for thread in threads:
+        thread.join()
+
+    assert order == ["high", "normal", "low"]
+
+
+def test_install():
+    class Session(object):
+        max_retries = 3
+
+        def request(self, method, url, **kwargs):
+            return Response(content=url.encode("utf-8"))
+
+    session = Session()
+    scheduler = RequestScheduler()
+    assert scheduler.install(session) is scheduler
+
+    # The session keeps the scheduler it has
+    assert scheduler.install(session) is scheduler
+    assert RequestScheduler().install(session) is scheduler
+    assert scheduler.limits() == (None, 1, 1, 8)
+
+    assert session.max_retries == 0
+    assert session.request("GET", "/abc").content == b"/abc"
+    assert scheduler.stats["requests"] == 1
+    assert scheduler.stats["bytes"] == 4
+
+
+def test_install_with_other_limits(caplog):
+    class Session(object):
+        def request(self, method, url, **kwargs):
+            return Response()
+
+    session = Session()
+    scheduler = RequestScheduler(rate=10, max_concurrency=8).install(session)
+
+    # The scheduler of the session takes on the limits of a scheduler
+    # installed later
+    with caplog.at_level(logging.WARNING):
+        other = RequestScheduler(rate=2, max_concurrency=2)
+        assert other.install(session) is scheduler
+
+    assert scheduler.limits() == other.limits() == (2, 2, 1, 2)
+    assert scheduler.limit == 2
+    assert scheduler.tokens <= 2
+    assert (
+        "from 10 requests per second and 8 concurrent requests "
+        "to 2 requests per second and 2 concurrent requests" in caplog.text
+    )
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING):
+        RequestScheduler(rate=2, max_concurrency=2).install(session)
+    assert caplog.text == ""
+
+
+def test_count_requests():
+    scheduler = RequestScheduler()
+    results = {}
+
+    def run(name, count):
+        stats = count_requests()
+        call = in_current_context(scheduler.call)
+        for _ in range(count):
+            # Requests made in worker threads count too
+            thread = threading.Thread(
+                target=call, args=(lambda: Response(content=b"123"),)
+            )
+            thread.start()
+            thread.join()
+        results[name] = stats
+
+    threads = [
+        threading.Thread(target=run, args=("one", 1)),
+        threading.Thread(target=run, args=("two", 2)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results["one"]["requests"] == 1
+    assert results["two"]["requests"] == 2
+    assert results["two"]["bytes"] == 6
+    assert scheduler.stats["requests"] == 3
+    assert summarize_stats(results["one"]) == (
+        "1 requests to JIRA, 3 bytes received, 0 retries, 0 errors, "
+        "0.0 seconds throttled"
+    )
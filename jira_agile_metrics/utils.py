@@ -1,5 +1,6 @@
 import datetime
 import os.path
+import dateutil.parser
 
 import numpy as np
 import pandas as pd
@@ -7,6 +8,10 @@ import pandas.tseries.offsets as offsets
 import seaborn as sns
 
 
+# The format of timestamps returned by the JIRA REST API
+JIRA_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+
+
 class StatusTypes:
     backlog = "backlog"
     accepted = "accepted"
@@ -31,6 +36,37 @@ def to_json_string(value):
         return value
 
 
+def chunks(values, size):
+    """Split the list `values` into consecutive lists of at most `size`
+    items.
+    """
+    return [
+        values[start:end]
+        for start, end in ((i, i + size) for i in range(0, len(values), size))
+    ]
+
+
+def parse_date(value):
+    """Parse a date/time string as returned by JIRA. Timestamps in the
+    format JIRA uses, and other ISO 8601 timestamps where Python can parse
+    them itself, are parsed without the overhead of
+    `dateutil.parser.parse()`, which is used as a fallback for anything else.
+    """
+    try:
+        return datetime.datetime.strptime(value, JIRA_DATE_FORMAT)
+    except ValueError:
+        pass
+
+    # Python 3.7 and later
+    if hasattr(datetime.datetime, "fromisoformat"):
+        try:
+            return datetime.datetime.fromisoformat(value)
+        except ValueError:
+            pass
+
+    return dateutil.parser.parse(value)
+
+
 def get_extension(filename):
     return os.path.splitext(filename)[1].lower()
 
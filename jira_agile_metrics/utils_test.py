@@ -1,10 +1,14 @@
+import types
 import datetime
+import dateutil.parser
 import numpy as np
 import pandas as pd
 import pytest
 
+from . import utils
 from .utils import (
     get_extension,
+    parse_date,
     to_json_string,
     to_days_since_epoch,
     extend_dict,
@@ -72,6 +76,37 @@ def test_get_extension():
     assert get_extension("foo.CSV") == ".csv"
 
 
+def test_parse_date():
+    for value in [
+        "2018-01-02T01:01:01.000+0000",
+        "2018-01-02T01:01:01.123-0500",
+        "2018-01-02 01:01:01",
+        "2018-01-02",
+        "2 January 2018 1:01 PM",
+    ]:
+        assert parse_date(value) == dateutil.parser.parse(value)
+        assert parse_date(value).utcoffset() == (
+            dateutil.parser.parse(value).utcoffset()
+        )
+
+
+def test_parse_date_without_fromisoformat(monkeypatch):
+    # As on Python 3.6
+    class Datetime(object):
+        strptime = datetime.datetime.strptime
+
+    monkeypatch.setattr(
+        utils, "datetime", types.SimpleNamespace(datetime=Datetime)
+    )
+
+    for value in [
+        "2018-01-02T01:01:01.000+0000",
+        "2018-01-02 01:01:01",
+        "2 January 2018 1:01 PM",
+    ]:
+        assert parse_date(value) == dateutil.parser.parse(value)
+
+
 def test_to_json_string():
     assert to_json_string(1) == "1"
     assert to_json_string("foo") == "foo"
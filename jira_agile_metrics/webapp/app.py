@@ -15,6 +15,7 @@ from jira import JIRA, JIRAError
 from ..config import config_to_options, CALCULATORS, ConfigError
 from ..querymanager import QueryManager
 from ..calculator import run_calculators
+from ..connection import ClientPool, configure_session
 
 template_folder = os.path.join(os.path.dirname(__file__), "templates")
 static_folder = os.path.join(os.path.dirname(__file__), "static")
@@ -31,6 +32,12 @@ app.jinja_loader = jinja2.PackageLoader(
 
 logger = logging.getLogger(__name__)
 
+# JIRA clients, reused across runs against the same server
+jira_clients = ClientPool()
+
+# Options that can't be set from the form
+PROTECTED_OPTIONS = {"http_adapter"}
+
 
 @app.route("/")
 def index():
@@ -65,7 +72,7 @@ def run():
                 except ValueError:
                     options["settings"]["max_results"] = None
 
-            jira = get_jira_client(options["connection"])
+            jira = jira_clients.get(options["connection"], get_jira_client)
             query_manager = QueryManager(jira, options["settings"])
             zip_data = get_archive(
                 CALCULATORS, query_manager, options["settings"]
@@ -115,9 +122,11 @@ def capture_log(buffer, level, formatter=None):
 
 def override_options(options, form):
     """Override options from the configuration files with form data where
-    applicable.
+    applicable. Options that load code can't be set.
     """
     for key in options.keys():
+        if key in PROTECTED_OPTIONS:
+            continue
         if key in form and form[key] != "":
             options[key] = form[key]
 
@@ -135,7 +144,7 @@ def get_jira_client(connection):
     jira_options.update(jira_client_options)
 
     try:
-        return JIRA(
+        jira = JIRA(
             jira_options,
             basic_auth=(username, password),
             get_server_info=jira_server_version_check,
@@ -149,6 +158,9 @@ def get_jira_client(connection):
         else:
             raise
 
+    configure_session(jira._session, connection)
+    return jira
+
 
 def get_archive(calculators, query_manager, settings):
     """Run all calculators and write outputs to a temporary directory.
@@ -163,6 +175,7 @@ def get_archive(calculators, query_manager, settings):
     try:
         os.chdir(temp_path)
         run_calculators(calculators, query_manager, settings)
+        query_manager.log_statistics()
 
         with zipfile.ZipFile("metrics.zip", "w", zipfile.ZIP_STORED) as z:
             for root, dirs, files in os.walk(temp_path):
@@ -0,0 +1,96 @@
+import functools
+import json
+
+from .utils import StatusTypes
+
+
+def compile_workflow(cycle):
+    """Return the `Workflow` for the given `cycle` setting (a list of
+    `{name, statuses, type}` dicts), compiling it only the first time, so
+    that all calculators share it.
+    """
+    return _compile_workflow(json.dumps(cycle, sort_keys=True))
+
+
+@functools.lru_cache(maxsize=8)
+def _compile_workflow(cycle_json):
+    return Workflow(json.loads(cycle_json))
+
+
+class Workflow(object):
+    """The steps of the cycle, in order, and the JIRA statuses that map to
+    each, compiled so that the step of a status can be looked up quickly.
+
+    Steps are identified by their index in the cycle. Statuses are matched
+    regardless of case; each distinct status string seen is only case-folded
+    and looked up once. Statuses can also be matched by id, given a map of
+    status ids to steps for the JIRA instance (see `status_id_indexes()`),
+    e.g. in the history of an issue from before the status was renamed.
+
+    A workflow is shared by all runs with the same cycle, so it never holds
+    anything learned from a particular JIRA instance.
+    """
+
+    def __init__(self, cycle):
+        self.step_names = [step["name"] for step in cycle]
+
+        # Indexes of the steps of each type, in order
+        self.accepted_indexes = [
+            index
+            for index, step in enumerate(cycle)
+            if step["type"] == StatusTypes.accepted
+        ]
+        self.completed_indexes = [
+            index
+            for index, step in enumerate(cycle)
+            if step["type"] == StatusTypes.complete
+        ]
+
+        # Lower case status -> step index
+        self.status_indexes = {}
+        for index, step in enumerate(cycle):
+            for status in step["statuses"]:
+                self.status_indexes[status.lower()] = index
+
+        # Status as given -> step index, or None for unknown statuses
+        self.interned = {}
+
+    def status_id_indexes(self, status_names):
+        """Return a dict of the index of the step each status maps to by
+        name, keyed by status id, given a dict of status names by id, such
+        as the statuses of a JIRA instance (see
+        `QueryManager.status_names()`). Statuses not mapped to a step are
+        left out.
+        """
+        status_ids = {}
+        for status_id, status in status_names.items():
+            index = self.step_index(status)
+            if index is not None:
+                status_ids[status_id] = index
+        return status_ids
+
+    def step_index(self, status, status_id=None, status_ids=None):
+        """Return the index of the step `status` maps to, or `None`. If the
+        `status_id` is given, it is looked up in `status_ids` (see
+        `status_id_indexes()`) first.
+        """
+        if status_id is not None and status_ids:
+            index = status_ids.get(status_id)
+            if index is not None:
+                return index
+
+        try:
+            return self.interned[status]
+        except KeyError:
+            index = (
+                self.status_indexes.get(status.lower())
+                if status is not None
+                else None
+            )
+            self.interned[status] = index
+            return index
+
+    def step_name(self, status, status_id=None, status_ids=None):
+        """Return the name of the step `status` maps to, or `None`"""
+        index = self.step_index(status, status_id, status_ids)
+        return self.step_names[index] if index is not None else None
@@ -0,0 +1,71 @@
+from .utils import StatusTypes
+from .workflow import Workflow, compile_workflow
+
+CYCLE = [
+    {"name": "Backlog", "statuses": ["Backlog"], "type": StatusTypes.backlog},
+    {"name": "Committed", "statuses": ["Next"], "type": StatusTypes.accepted},
+    {
+        "name": "Build",
+        "statuses": ["Build", "Code review"],
+        "type": StatusTypes.accepted,
+    },
+    {"name": "Done", "statuses": ["Done"], "type": StatusTypes.complete},
+]
+
+
+def test_steps():
+    workflow = Workflow(CYCLE)
+
+    assert workflow.step_names == ["Backlog", "Committed", "Build", "Done"]
+    assert workflow.accepted_indexes == [1, 2]
+    assert workflow.completed_indexes == [3]
+
+
+def test_step_index():
+    workflow = Workflow(CYCLE)
+
+    assert workflow.step_index("Backlog") == 0
+    assert workflow.step_index("next") == 1
+    assert workflow.step_index("Code Review") == 2
+    assert workflow.step_index("Unknown") is None
+    assert workflow.step_index(None) is None
+
+    assert workflow.step_name("CODE REVIEW") == "Build"
+    assert workflow.step_name("Unknown") is None
+
+    # Statuses are only looked up once
+    assert workflow.interned == {
+        "Backlog": 0,
+        "next": 1,
+        "Code Review": 2,
+        "Unknown": None,
+        None: None,
+        "CODE REVIEW": 2,
+    }
+
+
+def test_compile_workflow():
+    workflow = compile_workflow(CYCLE)
+
+    assert workflow.step_names == ["Backlog", "Committed", "Build", "Done"]
+    assert compile_workflow([dict(step) for step in CYCLE]) is workflow
+    assert compile_workflow(CYCLE[:-1]) is not workflow
+
+
+def test_status_ids():
+    workflow = Workflow(CYCLE)
+
+    status_ids = workflow.status_id_indexes(
+        {"10": "Next", "20": "Code review", "30": "Doing"}
+    )
+    assert status_ids == {"10": 1, "20": 2}
+
+    # Ids are looked up first, so renamed statuses still map to their step
+    assert workflow.step_index("Ready", "10") is None
+    assert workflow.step_index("Ready", "10", status_ids) == 1
+    assert workflow.step_name("Ready", "10", status_ids) == "Committed"
+    assert workflow.step_index("Next", "99", status_ids) == 1
+    assert workflow.step_index("Doing", "30", status_ids) is None
+
+    # Nothing is learned by the shared workflow
+    assert workflow.step_index("Ready", "10") is None